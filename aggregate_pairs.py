@@ -6,6 +6,9 @@ CSVファイルとして出力します。
 
 使い方:
     python aggregate_pairs.py
+    python aggregate_pairs.py --sqlite ./output_sqlite/dataset.sqlite  # SQLiteデータベースから集計
+    python aggregate_pairs.py --partition-dir ./pairs_partitions  # フォントごとのCSVをインクリメンタルに更新
+    python aggregate_pairs.py --fold none  # pair_keyの文字を正規化しない（デフォルト: nfkc）
 
 設定:
     JSON_DIR: JSONファイルが格納されているフォルダ（デフォルト: "./output_json/train"）
@@ -15,334 +18,870 @@ CSVファイルとして出力します。
     pairs_aggregated.csv - すべての文字ペアを集計したCSVファイル
 """
 
+import argparse
 import json
+import logging
 import os
 import csv
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Tuple
+
+from columnar_utils import DictionaryEncoder, column_filename, load_columns, new_column, write_npy, write_schema
+from pair_keys import DEFAULT_FOLDING, FOLDINGS, char_form, fold_char
+from log_utils import SUMMARY, collect_records, log_warning_summary, replay_records, setup_logging, warn_repeated
+
+logger = logging.getLogger(__name__)
 
 
 # 設定
 JSON_DIR = "./output_json/train"  # JSONファイルが格納されているフォルダ
 OUTPUT_CSV = "./pairs_aggregated.csv"  # 出力先のCSVファイル
 
+# 列指向のペア表で値がない場合のfloat32の値
+NAN = float("nan")
 
-def load_json_files(json_dir: str) -> List[Dict[str, Any]]:
+# --jobs 指定時に1つのワーカープロセスにまとめて渡すファイル数の上限と、先読みするチャンク数（ワーカーあたり）
+MAX_CHUNK_FILES = 64
+IN_FLIGHT_CHUNKS_PER_JOB = 2
+
+# 出力CSVのカラム順
+CSV_COLUMNS = [
+    "sample_id",
+    "left_char",
+    "right_char",
+    "left_font",
+    "right_font",
+    "gap_actual",
+    "left_width",
+    "right_width",
+    "left_height",
+    "right_height",
+    "left_min_x",
+    "left_max_x",
+    "left_min_y",
+    "left_max_y",
+    "right_min_x",
+    "right_max_x",
+    "right_min_y",
+    "right_max_y",
+    "left_index",
+    "right_index",
+    "avg_width",
+    "font_size_est",  # 推定フォントサイズ（案1用）
+    "gap_norm",  # 平均文字幅で正規化（推奨）
+    "gap_norm_left",  # 後方互換性のため保持
+    "gap_norm_right",  # 後方互換性のため保持
+    "pair_key",
+    "left_char_form",  # 元の文字の幅（East Asian Width、pair_keyは全角・半角を正規化するため）
+    "right_char_form",
+]
+
+
+def list_json_sources(json_dir: str) -> List[Path]:
     """
-    JSON_DIR以下のすべてのJSONファイルを読み込む
+    json_dir直下の名前ごとのJSONファイル（*.json）とJSON Linesシャード（*.jsonl）を読み込む順に列挙する
+    
+    *.json をファイル名順に並べた後に *.jsonl をファイル名順に並べる
+    （ファイル名順に読むので、集計結果の行の順序はディレクトリの列挙順によらず一定になる）
     
     Args:
         json_dir: JSONファイルが格納されているディレクトリ
     
     Returns:
-        JSONデータのリスト
+        ファイルのパスのリスト（ディレクトリがない・ファイルがない場合はログを出して空のリスト）
     """
     json_path = Path(json_dir)
     if not json_path.exists():
-        print(f"Error: Directory '{json_dir}' does not exist")
+        logger.error("Error: Directory '%s' does not exist", json_dir)
         return []
     
-    json_files = list(json_path.glob("*.json"))
-    if not json_files:
-        print(f"Warning: No JSON files found in '{json_dir}'")
-        return []
+    json_files = sorted(json_path.glob("*.json"), key=lambda path: path.name)
+    jsonl_files = sorted(json_path.glob("*.jsonl"), key=lambda path: path.name)
+    if not json_files and not jsonl_files:
+        logger.warning("Warning: No JSON files found in '%s'", json_dir)
+    return json_files + jsonl_files
+
+
+def iter_json_source(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    JSONファイル（1ファイル1レコード）またはJSON Linesシャード（1行1レコード）のレコードを読み込む
+    
+    Args:
+        path: *.json または *.jsonl のパス
     
-    json_data_list = []
-    for json_file in json_files:
+    Yields:
+        JSONデータ（読み込めないファイル・行は警告して飛ばす）
+    """
+    if path.suffix != ".jsonl":
         try:
-            with open(json_file, 'r', encoding='utf-8') as f:
+            with open(path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                # ファイル名からsample_idを取得（fileフィールドがない場合）
-                if 'file' not in data:
-                    data['file'] = json_file.stem
-                json_data_list.append(data)
+            # ファイル名からsample_idを取得（fileフィールドがない場合）
+            if 'file' not in data:
+                data['file'] = path.stem
         except Exception as e:
-            print(f"Warning: Failed to load {json_file.name}: {e}")
+            logger.warning("Warning: Failed to load %s: %s", path.name, e)
+            return
+        yield data
+        return
     
-    return json_data_list
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    logger.warning("Warning: Failed to parse %s line %s: %s", path.name, line_num, e)
+                    continue
+                yield data
+    except Exception as e:
+        logger.warning("Warning: Failed to load %s: %s", path.name, e)
 
 
-def get_bbox_info(bbox_dict: Dict[str, Dict[str, float]], path_id: str, prefix: str) -> Dict[str, Optional[float]]:
+def iter_json_sample_files(json_dir: str) -> Iterator[Tuple[Path, Dict[str, Any]]]:
     """
-    bbox辞書から指定されたpath_idの情報を取得
+    json_dir直下の名前ごとのJSONファイル（*.json）をファイル名順に読み込む
+    
+    （sharding.merge_shards もこの順序でシャードの部分集計をまとめる）
+    
+    Args:
+        json_dir: JSONファイルが格納されているディレクトリ
+    
+    Yields:
+        (JSONファイルのパス, JSONデータ)（読み込めないファイルは警告して飛ばす）
+    """
+    for json_file in sorted(Path(json_dir).glob("*.json"), key=lambda path: path.name):
+        for data in iter_json_source(json_file):
+            yield json_file, data
+
+
+def iter_json_data(json_dir: str) -> Iterator[Dict[str, Any]]:
+    """
+    JSON_DIR以下のJSONファイル（*.json）とJSON Linesシャード（*.jsonl）のレコードを1件ずつ読み込む
+    
+    ファイル（JSON Linesは1行）ごとに読み込んでは返すので、メモリ使用量はデータセットの大きさによらない
+    
+    Args:
+        json_dir: JSONファイルが格納されているディレクトリ
+    
+    Yields:
+        JSONデータ（list_json_sourcesの順）
+    """
+    for path in list_json_sources(json_dir):
+        yield from iter_json_source(path)
+
+
+def load_json_files(json_dir: str) -> List[Dict[str, Any]]:
+    """
+    JSON_DIR以下のすべてのJSONファイル（*.json）とJSON Linesシャード（*.jsonl）を読み込む
+    
+    （すべてをメモリに載せるので、大きなデータセットでは iter_json_data を使う）
+    
+    Args:
+        json_dir: JSONファイルが格納されているディレクトリ
+    
+    Returns:
+        JSONデータのリスト
+    """
+    return list(iter_json_data(json_dir))
+
+
+# bbox情報のうちレコードに載せる項目（カラム名は left_<項目> / right_<項目>）
+BBOX_FIELDS = ("width", "height", "min_x", "max_x", "min_y", "max_y")
+LEFT_BBOX_COLUMNS = tuple(f"left_{field}" for field in BBOX_FIELDS)
+RIGHT_BBOX_COLUMNS = tuple(f"right_{field}" for field in BBOX_FIELDS)
+
+
+def get_bbox_values(bbox_dict: Dict[str, Dict[str, float]], path_id: str) -> Tuple[Optional[float], ...]:
+    """
+    bbox辞書から指定されたpath_idのBBOX_FIELDSの値を取得
     
     Args:
         bbox_dict: bbox情報の辞書
         path_id: 取得するpathのID
-        prefix: カラム名のプレフィックス（例: "left", "right"）
     
     Returns:
-        bbox情報の辞書（見つからない場合はNoneで埋める）
-    """
-    if path_id not in bbox_dict:
-        return {
-            f"{prefix}_width": None,
-            f"{prefix}_height": None,
-            f"{prefix}_min_x": None,
-            f"{prefix}_max_x": None,
-            f"{prefix}_min_y": None,
-            f"{prefix}_max_y": None,
-        }
-    
-    bbox = bbox_dict[path_id]
-    return {
-        f"{prefix}_width": bbox.get("width"),
-        f"{prefix}_height": bbox.get("height"),
-        f"{prefix}_min_x": bbox.get("min_x"),
-        f"{prefix}_max_x": bbox.get("max_x"),
-        f"{prefix}_min_y": bbox.get("min_y"),
-        f"{prefix}_max_y": bbox.get("max_y"),
-    }
+        BBOX_FIELDSの順の値のタプル（見つからない場合はNoneで埋める）
+    """
+    bbox = bbox_dict.get(path_id)
+    if bbox is None:
+        return (None,) * len(BBOX_FIELDS)
+    return tuple(bbox.get(field) for field in BBOX_FIELDS)
 
 
-def find_index_in_sequence(sequence: List[Dict[str, str]], path_id: str) -> Optional[int]:
+def build_glyph_index(
+    sequence: List[Dict[str, str]],
+    bbox_dict: Dict[str, Dict[str, float]],
+    default_font: str
+) -> Dict[str, Tuple[int, str, Tuple[Optional[float], ...]]]:
     """
-    sequence内で指定されたpath_idのインデックスを取得
+    sequenceを1回走査して、path_idごとのsequence内のインデックス・フォント・bboxの値をまとめる
+    
+    ペアごとにsequenceを線形に探す代わりに、サンプルごとに1回だけ作って引く
     
     Args:
         sequence: sequence情報のリスト
-        path_id: 検索するpathのID
+        bbox_dict: bbox情報の辞書
+        default_font: sequenceにfontがない場合のフォント
     
     Returns:
-        インデックス（見つからない場合はNone）
+        {path_id: (インデックス, フォント, bboxの値)}
+        （同じIDが複数ある場合、インデックスは最初、フォントは最後のもの）
     """
-    if not sequence:
-        return None
-    
+    glyphs = {}
     for i, item in enumerate(sequence):
-        if item.get("id") == path_id:
-            return i
-    
-    return None
+        seq_id = item.get("id")
+        if not seq_id:
+            continue
+        seq_font = item.get("font", default_font)
+        if seq_id in glyphs:
+            index, _, values = glyphs[seq_id]
+            glyphs[seq_id] = (index, seq_font, values)
+        else:
+            glyphs[seq_id] = (i, seq_font, get_bbox_values(bbox_dict, seq_id))
+    return glyphs
 
 
-def create_pair_key(left_char: str, right_char: str, left_font: str, right_font: str) -> str:
+def create_pair_key(left_char: str, right_char: str, left_font: str, right_font: str,
+                    folding: str = DEFAULT_FOLDING) -> str:
     """
-    ペアのキー文字列を生成
+    ペアのキー文字列を生成（文字は pair_keys.fold_char で正規化する）
     
     Args:
         left_char: 左側の文字
         right_char: 右側の文字
         left_font: 左側のフォント
         right_font: 右側のフォント
+        folding: 文字の正規化の方式（pair_keys.FOLDINGS）
     
     Returns:
-        ペアキー文字列（例: "N|A|Mincho" または "N|A|Mincho-Gothic"）
+        ペアキー文字列（例: "N|A|Mincho" または "N|A|Mincho-Gothic"、"Ｎ|Ａ|Mincho" も "N|A|Mincho" になる）
     """
+    left_char = fold_char(left_char, folding)
+    right_char = fold_char(right_char, folding)
     if left_font == right_font:
         return f"{left_char}|{right_char}|{left_font}"
     else:
         return f"{left_char}|{right_char}|{left_font}-{right_font}"
 
 
-def aggregate_pairs(json_data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def add_derived_columns(record: Dict[str, Any], folding: str = DEFAULT_FOLDING) -> Dict[str, Any]:
     """
-    JSONデータから文字ペアのレコードを生成
+    基本カラム（gap_actual, bbox）から派生カラム（avg_width, font_size_est, gap_norm*, pair_key, *_char_form）を計算して追加
     
     Args:
-        json_data_list: JSONデータのリスト
+        record: sample_id, left_char, right_char, left_font, right_font, gap_actual と
+                left_/right_ のbbox情報を持つレコード
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
     
     Returns:
-        文字ペアレコードのリスト
+        派生カラムを追加したレコード（引数と同じ辞書）
+    """
+    left_char = record.get("left_char", "")
+    right_char = record.get("right_char", "")
+    left_font = record.get("left_font")
+    right_font = record.get("right_font")
+    gap_actual = record.get("gap_actual")
+    
+    left_width = record.get("left_width")
+    right_width = record.get("right_width")
+    left_height = record.get("left_height")
+    right_height = record.get("right_height")
+    
+    if left_width is not None and right_width is not None:
+        record["avg_width"] = (left_width + right_width) / 2
+    else:
+        record["avg_width"] = None
+    
+    # フォントサイズを推定（文字の高さから推定、一般的に高さはフォントサイズの0.85倍程度）
+    if left_height is not None and right_height is not None:
+        avg_height = (left_height + right_height) / 2
+        # フォントサイズ = 高さ / 0.85（一般的な比率）
+        record["font_size_est"] = avg_height / 0.85
+    else:
+        record["font_size_est"] = None
+    
+    # 平均文字幅で正規化（カーニング計算時のbaseWidthPxと一致させる）
+    if record.get("avg_width") is not None and record["avg_width"] != 0:
+        record["gap_norm"] = gap_actual / record["avg_width"] if gap_actual is not None else None
+    else:
+        record["gap_norm"] = None
+    
+    # 後方互換性のため、左右の正規化値も保持（非推奨）
+    if left_width is not None and left_width != 0:
+        record["gap_norm_left"] = gap_actual / left_width if gap_actual is not None else None
+    else:
+        record["gap_norm_left"] = None
+    
+    if right_width is not None and right_width != 0:
+        record["gap_norm_right"] = gap_actual / right_width if gap_actual is not None else None
+    else:
+        record["gap_norm_right"] = None
+    
+    # pair_keyを生成し、正規化で失われる元の文字の幅を記録
+    record["pair_key"] = create_pair_key(left_char, right_char, left_font, right_font, folding)
+    record["left_char_form"] = char_form(left_char)
+    record["right_char_form"] = char_form(right_char)
+    
+    return record
+
+
+def iter_sample_pair_records(json_data: Dict[str, Any], folding: str = DEFAULT_FOLDING) -> Iterator[Dict[str, Any]]:
+    """
+    1サンプル（名前ごとのJSONレコード）から文字ペアのレコードを順に生成
+    
+    Args:
+        json_data: JSONデータ（export_json.build_recordの形式）
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Yields:
+        文字ペアレコード（CSV_COLUMNSのカラムを持つ辞書）
     """
-    records = []
+    sample_id = json_data.get("file", "unknown")
+    pairs = json_data.get("pairs", [])
+    bbox = json_data.get("bbox", {})
+    sequence = json_data.get("sequence", [])
+    
+    # pairsが存在しない or 空配列の場合はスキップ
+    if not pairs:
+        return
     
-    for json_data in json_data_list:
-        sample_id = json_data.get("file", "unknown")
-        pairs = json_data.get("pairs", [])
-        bbox = json_data.get("bbox", {})
-        sequence = json_data.get("sequence", [])
+    # フォント情報を取得（トップレベルのfontフィールド、またはsequenceから）
+    default_font = json_data.get("font", "")
+    
+    # sequenceから各文字のインデックス・font情報・bbox情報を取得（あれば）
+    glyphs = build_glyph_index(sequence, bbox, default_font)
+    
+    for pair in pairs:
+        left_id = pair.get("left_id")
+        right_id = pair.get("right_id")
         
-        # pairsが存在しない or 空配列の場合はスキップ
-        if not pairs:
+        # bboxにleft_id/right_idが見つからない場合はスキップ
+        if left_id not in bbox:
+            warn_repeated(logger, "missing_bbox", "{count} pairs skipped (id not in bbox) across {files} files",
+                          "Warning: left_id '%s' not found in bbox for sample '%s', skipping pair", left_id, sample_id,
+                          file_id=sample_id)
+            continue
+        if right_id not in bbox:
+            warn_repeated(logger, "missing_bbox", "{count} pairs skipped (id not in bbox) across {files} files",
+                          "Warning: right_id '%s' not found in bbox for sample '%s', skipping pair", right_id, sample_id,
+                          file_id=sample_id)
             continue
         
-        # フォント情報を取得（トップレベルのfontフィールド、またはsequenceから）
-        default_font = json_data.get("font", "")
+        # sequenceにないIDは、インデックス -1・デフォルトのフォントとする
+        left_index, left_seq_font, left_values = (
+            glyphs.get(left_id) or (-1, default_font, get_bbox_values(bbox, left_id))
+        )
+        right_index, right_seq_font, right_values = (
+            glyphs.get(right_id) or (-1, default_font, get_bbox_values(bbox, right_id))
+        )
         
-        # sequenceから各文字のfont情報を取得（あれば）
-        sequence_font_map = {}
-        for seq_item in sequence:
-            seq_id = seq_item.get("id")
-            seq_font = seq_item.get("font", default_font)
-            if seq_id:
-                sequence_font_map[seq_id] = seq_font
+        # 基本情報（フォントはpairs内、sequence内、またはデフォルト）
+        record = {
+            "sample_id": sample_id,
+            "left_char": pair.get("left", ""),
+            "right_char": pair.get("right", ""),
+            "left_font": pair.get("left_font") or left_seq_font,
+            "right_font": pair.get("right_font") or right_seq_font,
+            "gap_actual": pair.get("gap_actual"),
+        }
+        
+        # bbox情報・sequence情報を追加
+        record.update(zip(LEFT_BBOX_COLUMNS, left_values))
+        record.update(zip(RIGHT_BBOX_COLUMNS, right_values))
+        record["left_index"] = left_index
+        record["right_index"] = right_index
+        
+        # 派生カラムを計算
+        add_derived_columns(record, folding)
         
-        for pair in pairs:
-            left_id = pair.get("left_id")
-            right_id = pair.get("right_id")
-            left_char = pair.get("left", "")
-            right_char = pair.get("right", "")
-            
-            # フォント情報を取得（pairs内、sequence内、またはデフォルト）
-            left_font = pair.get("left_font") or sequence_font_map.get(left_id, default_font)
-            right_font = pair.get("right_font") or sequence_font_map.get(right_id, default_font)
-            
-            gap_actual = pair.get("gap_actual")
-            
-            # bboxにleft_id/right_idが見つからない場合はスキップ
-            if left_id not in bbox:
-                print(f"Warning: left_id '{left_id}' not found in bbox for sample '{sample_id}', skipping pair")
-                continue
-            if right_id not in bbox:
-                print(f"Warning: right_id '{right_id}' not found in bbox for sample '{sample_id}', skipping pair")
-                continue
-            
-            # 基本情報
-            record = {
-                "sample_id": sample_id,
-                "left_char": left_char,
-                "right_char": right_char,
-                "left_font": left_font,
-                "right_font": right_font,
-                "gap_actual": gap_actual,
-            }
-            
-            # bbox情報を追加
-            left_bbox = get_bbox_info(bbox, left_id, "left")
-            right_bbox = get_bbox_info(bbox, right_id, "right")
-            record.update(left_bbox)
-            record.update(right_bbox)
-            
-            # sequence情報を追加
-            left_index = find_index_in_sequence(sequence, left_id)
-            right_index = find_index_in_sequence(sequence, right_id)
-            record["left_index"] = left_index if left_index is not None else -1
-            record["right_index"] = right_index if right_index is not None else -1
-            
-            # 派生カラムを計算
-            left_width = record.get("left_width")
-            right_width = record.get("right_width")
-            left_height = record.get("left_height")
-            right_height = record.get("right_height")
-            
-            if left_width is not None and right_width is not None:
-                record["avg_width"] = (left_width + right_width) / 2
-            else:
-                record["avg_width"] = None
-            
-            # フォントサイズを推定（文字の高さから推定、一般的に高さはフォントサイズの0.85倍程度）
-            if left_height is not None and right_height is not None:
-                avg_height = (left_height + right_height) / 2
-                # フォントサイズ = 高さ / 0.85（一般的な比率）
-                record["font_size_est"] = avg_height / 0.85
-            else:
-                record["font_size_est"] = None
-            
-            # 平均文字幅で正規化（カーニング計算時のbaseWidthPxと一致させる）
-            if record.get("avg_width") is not None and record["avg_width"] != 0:
-                record["gap_norm"] = gap_actual / record["avg_width"] if gap_actual is not None else None
-            else:
-                record["gap_norm"] = None
-            
-            # 後方互換性のため、左右の正規化値も保持（非推奨）
-            if left_width is not None and left_width != 0:
-                record["gap_norm_left"] = gap_actual / left_width if gap_actual is not None else None
-            else:
-                record["gap_norm_left"] = None
-            
-            if right_width is not None and right_width != 0:
-                record["gap_norm_right"] = gap_actual / right_width if gap_actual is not None else None
-            else:
-                record["gap_norm_right"] = None
-            
-            # pair_keyを生成
-            record["pair_key"] = create_pair_key(left_char, right_char, left_font, right_font)
-            
-            records.append(record)
-    
-    return records
-
-
-def write_csv(records: List[Dict[str, Any]], output_path: str):
+        yield record
+
+
+def iter_pair_records(json_data_iter: Iterable[Dict[str, Any]], folding: str = DEFAULT_FOLDING
+                      ) -> Iterator[Dict[str, Any]]:
     """
-    レコードをCSVファイルに書き出す
+    JSONデータから文字ペアのレコードを順に生成
     
     Args:
-        records: レコードのリスト
-        output_path: 出力先のCSVファイルパス
+        json_data_iter: JSONデータ（iter_json_dataなど）
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Yields:
+        文字ペアレコード
+    """
+    for json_data in json_data_iter:
+        yield from iter_sample_pair_records(json_data, folding)
+
+
+def aggregate_pairs(json_data_list: List[Dict[str, Any]], folding: str = DEFAULT_FOLDING) -> List[Dict[str, Any]]:
+    """
+    JSONデータから文字ペアのレコードを生成
+    
+    Args:
+        json_data_list: JSONデータのリスト
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        文字ペアレコードのリスト
     """
-    if not records:
-        print("Warning: No records to write")
+    return list(iter_pair_records(json_data_list, folding))
+
+
+def _aggregate_chunk(paths: List[Path], folding: str = DEFAULT_FOLDING
+                     ) -> Tuple[int, Tuple[tuple, ...], List[logging.LogRecord]]:
+    """
+    ワーカープロセスで複数のファイルを読み込み、文字ペアのレコードを列ごとのタプルにして返す
+    （レコードの辞書のリストより、プロセス間で受け渡すデータが小さい）
+    
+    Returns:
+        (読み込んだJSONデータの件数, CSV_COLUMNSの順の列のタプル, ログレコード)
+    """
+    loaded = 0
+    rows = []
+    with collect_records() as collector:
+        for path in paths:
+            for json_data in iter_json_source(path):
+                loaded += 1
+                for record in iter_sample_pair_records(json_data, folding):
+                    rows.append(record_row(record))
+    return loaded, tuple(zip(*rows)), collector.records
+
+
+def iter_pair_rows_parallel(paths: List[Path], jobs: int, counts: Optional[Dict[str, int]] = None,
+                            folding: str = DEFAULT_FOLDING) -> Iterator[tuple]:
+    """
+    ファイルをjobs個のワーカープロセスに分けて読み込み・レコード生成を行い、ファイル順に行を返す
+    
+    ファイルの列はチャンクに分けて順に投入し（先読みは jobs * IN_FLIGHT_CHUNKS_PER_JOB チャンクまで）、
+    結果はチャンクの順に連結するので、行の順序とログは逐次処理の場合と同じになる
+    
+    Args:
+        paths: list_json_sourcesの結果
+        jobs: ワーカープロセス数
+        counts: 指定した場合、読み込んだJSONデータの件数を counts["loaded"] に加算する
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Yields:
+        CSV_COLUMNSの順の値のタプル
+    """
+    chunksize = max(1, min(MAX_CHUNK_FILES, len(paths) // (jobs * 4)))
+    chunks = iter([paths[i:i + chunksize] for i in range(0, len(paths), chunksize)])
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = deque(executor.submit(_aggregate_chunk, chunk, folding)
+                          for chunk in islice(chunks, jobs * IN_FLIGHT_CHUNKS_PER_JOB))
+        while in_flight:
+            loaded, columns, records = in_flight.popleft().result()
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                in_flight.append(executor.submit(_aggregate_chunk, next_chunk, folding))
+            replay_records(records)
+            if counts is not None:
+                counts["loaded"] = counts.get("loaded", 0) + loaded
+            yield from zip(*columns)
+
+
+# SQLiteデータベースからペアレコードの基本カラムを取得するクエリ
+# （pairsの (font, left_char, right_char) インデックスを使うため、絞り込み条件はpairs側に付ける）
+SQLITE_PAIRS_QUERY = """
+SELECT
+    p.file_id, p.left_char, p.right_char, p.left_font, p.right_font, p.gap_actual,
+    l.width, r.width, l.height, r.height,
+    l.min_x, l.max_x, l.min_y, l.max_y,
+    r.min_x, r.max_x, r.min_y, r.max_y,
+    l.seq_index, r.seq_index
+FROM pairs p
+JOIN glyphs l ON l.id = p.left_glyph
+JOIN glyphs r ON r.id = p.right_glyph
+"""
+
+SQLITE_RECORD_COLUMNS = (
+    "sample_id", "left_char", "right_char", "left_font", "right_font", "gap_actual",
+    "left_width", "right_width", "left_height", "right_height",
+    "left_min_x", "left_max_x", "left_min_y", "left_max_y",
+    "right_min_x", "right_max_x", "right_min_y", "right_max_y",
+    "left_index", "right_index",
+)
+
+
+def iter_records_from_sqlite(
+    db_path: str,
+    font: Optional[str] = None,
+    left_char: Optional[str] = None,
+    right_char: Optional[str] = None,
+    folding: str = DEFAULT_FOLDING
+) -> Iterator[Dict[str, Any]]:
+    """
+    SQLiteデータベース（export_jsonのsqlite形式）から文字ペアのレコードを順に生成
+    
+    JSONを全件読み込む代わりにインデックス付きのSQLで取得する。
+    font / left_char / right_char を指定すると、その条件に一致するペアだけを取得する。
+    
+    Args:
+        db_path: SQLiteデータベースのパス
+        font: 左側のフォントで絞り込む場合に指定
+        left_char: 左側の文字で絞り込む場合に指定
+        right_char: 右側の文字で絞り込む場合に指定
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Yields:
+        文字ペアレコード（aggregate_pairsと同じカラム）
+    """
+    if not Path(db_path).exists():
+        logger.error("Error: Database '%s' does not exist", db_path)
         return
     
-    # カラム順を定義
-    columns = [
-        "sample_id",
-        "left_char",
-        "right_char",
-        "left_font",
-        "right_font",
-        "gap_actual",
-        "left_width",
-        "right_width",
-        "left_height",
-        "right_height",
-        "left_min_x",
-        "left_max_x",
-        "left_min_y",
-        "left_max_y",
-        "right_min_x",
-        "right_max_x",
-        "right_min_y",
-        "right_max_y",
-        "left_index",
-        "right_index",
-        "avg_width",
-        "font_size_est",  # 推定フォントサイズ（案1用）
-        "gap_norm",  # 平均文字幅で正規化（推奨）
-        "gap_norm_left",  # 後方互換性のため保持
-        "gap_norm_right",  # 後方互換性のため保持
-        "pair_key",
-    ]
+    conditions = []
+    params = []
+    for column, value in (("p.font", font), ("p.left_char", left_char), ("p.right_char", right_char)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    
+    query = SQLITE_PAIRS_QUERY
+    if conditions:
+        query += "WHERE " + " AND ".join(conditions) + "\n"
+    query += "ORDER BY p.sample_id, p.id"
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        for row in conn.execute(query, params):
+            yield add_derived_columns(dict(zip(SQLITE_RECORD_COLUMNS, row)), folding)
+    finally:
+        conn.close()
+
+
+def load_records_from_sqlite(
+    db_path: str,
+    font: Optional[str] = None,
+    left_char: Optional[str] = None,
+    right_char: Optional[str] = None,
+    folding: str = DEFAULT_FOLDING
+) -> List[Dict[str, Any]]:
+    """
+    SQLiteデータベースから文字ペアのレコードのリストを生成（iter_records_from_sqliteを参照）
+    """
+    return list(iter_records_from_sqlite(db_path, font, left_char, right_char, folding))
+
+
+def write_csv(records: Iterable[Dict[str, Any]], output_path: str) -> int:
+    """
+    レコードをCSVファイルに書き出す
+    
+    レコードは受け取った順に1行ずつ書き出す（ジェネレータを渡せば全件をメモリに載せず、
+    最初のレコードが生成された時点から書き出し始める）。
+    一時ファイル（<output_path>.tmp）に書き込んでからリネームするので、中断しても書きかけのCSVは残らない。
+    
+    Args:
+        records: レコード（リストまたはジェネレータ）
+        output_path: 出力先のCSVファイルパス
+    
+    Returns:
+        書き出したレコード数（0件の場合はファイルを作らず、前回の実行のファイルがあれば削除する）
+    """
+    return write_csv_rows((record_row(record) for record in records), output_path)
+
+
+def write_csv_rows(rows: Iterable[tuple], output_path: str) -> int:
+    """
+    CSV_COLUMNSの順の値のタプルをCSVファイルに書き出す（write_csvを参照）
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        # 前回の実行のCSVを今回の結果と取り違えないよう削除する
+        if os.path.exists(output_path):
+            os.remove(output_path)
+            logger.info("Removed %s (no pair records)", output_path)
+        return 0
     
     # 出力ディレクトリが存在しない場合は作成
     output_file = Path(output_path)
     output_file.parent.mkdir(parents=True, exist_ok=True)
     
-    # CSVファイルに書き出し
-    with open(output_path, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
-        writer.writeheader()
-        writer.writerows(records)
+    # CSVファイルに書き出し（一時ファイルに書いてから置き換える）
+    tmp_path = output_path + ".tmp"
+    count = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS)
+            writer.writerow(first)
+            count += 1
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
     
-    print(f"Successfully wrote {len(records)} records to {output_path}")
+    logger.log(SUMMARY, "Successfully wrote %s records to %s", count, output_path)
+    return count
+
+
+def record_row(record: Dict[str, Any]) -> tuple:
+    """
+    レコードの辞書をCSV_COLUMNSの順の値のタプルにする
+    """
+    return tuple(record.get(column) for column in CSV_COLUMNS)
 
 
-def main():
-    """メイン処理"""
-    print("=" * 60)
-    print("Phase1 文字ペア集計スクリプト")
-    print("=" * 60)
-    print(f"JSON directory: {JSON_DIR}")
-    print(f"Output CSV: {OUTPUT_CSV}")
-    print("-" * 60)
+class PairTableWriter:
+    """
+    文字ペアのレコードを型付きの列指向のペア表（pairs_aggregated.csv の代わり）として書き出すライター
     
-    # JSONファイルを読み込む
-    json_data_list = load_json_files(JSON_DIR)
+    CSV_COLUMNSの列を1列1つの .npy（pairs.<列名>.npy）に書き出し、最後にschema.jsonを書く
+    （export_json.ColumnarWriter と同じ形式で、columnar_utils.load_columns で読み込める）
+    - sample_id / left_char / right_char / left_font / right_font / pair_key / *_char_form: 辞書コード（int32）
+    - left_index / right_index: int32
+    - それ以外（gap_actual, bbox, 派生カラム）: float32（値がない場合はNaN）
     
-    if not json_data_list:
-        print("No JSON data loaded. Exiting.")
-        return
+    使い方:
+        writer = PairTableWriter("./pairs_columnar")
+        for row in rows:
+            writer.write_row(row)  # CSV_COLUMNSの順の値のタプル
+        writer.close()
+    """
+    
+    SCHEMA_VERSION = 1
+    
+    TABLE = "pairs"
+    
+    # 辞書コードにする列 → 辞書名
+    DICTIONARY_COLUMNS = {
+        "sample_id": "samples",
+        "left_char": "chars",
+        "right_char": "chars",
+        "left_font": "fonts",
+        "right_font": "fonts",
+        "pair_key": "pair_keys",
+        "left_char_form": "char_forms",
+        "right_char_form": "char_forms",
+    }
+    
+    INT_COLUMNS = ("left_index", "right_index")
+    
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.dtypes = {
+            column: "int32" if column in self.DICTIONARY_COLUMNS or column in self.INT_COLUMNS else "float32"
+            for column in CSV_COLUMNS
+        }
+        self.columns = {column: new_column(dtype) for column, dtype in self.dtypes.items()}
+        self.dictionaries = {name: DictionaryEncoder() for name in dict.fromkeys(self.DICTIONARY_COLUMNS.values())}
+    
+    def write_row(self, row: tuple):
+        """
+        1行（CSV_COLUMNSの順の値のタプル）を各列に追加する
+        """
+        for column, value in zip(CSV_COLUMNS, row):
+            dictionary = self.DICTIONARY_COLUMNS.get(column)
+            if dictionary is not None:
+                value = self.dictionaries[dictionary].encode(value if value is not None else "")
+            elif value is None:
+                value = -1 if column in self.INT_COLUMNS else NAN
+            self.columns[column].append(value)
+    
+    def close(self):
+        """
+        列ごとに.npyファイルを書き出し、最後にschema.jsonを書き出す
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        
+        columns_schema = {}
+        for column, dtype in self.dtypes.items():
+            write_npy(os.path.join(self.output_dir, column_filename(self.TABLE, column)), self.columns[column], dtype)
+            columns_schema[column] = {"dtype": dtype}
+            if column in self.DICTIONARY_COLUMNS:
+                columns_schema[column]["dictionary"] = self.DICTIONARY_COLUMNS[column]
+        
+        write_schema(self.output_dir, {
+            "version": self.SCHEMA_VERSION,
+            "tables": {
+                self.TABLE: {"rows": len(self.columns[CSV_COLUMNS[0]]), "columns": columns_schema},
+            },
+            "dictionaries": {name: encoder.values for name, encoder in self.dictionaries.items()},
+        })
+
+
+def load_pair_table(input_dir: str, mmap: bool = True) -> Dict[str, Any]:
+    """
+    PairTableWriterで書き出したペア表を読み込む（NumPyがあればメモリマップで開くので、行数によらずすぐ終わる）
+    
+    使い方:
+        table = load_pair_table("./pairs_columnar")
+        fonts = table["dictionaries"]["fonts"]
+        fonts[table["columns"]["left_font"][0]]  # 1行目の左側のフォント
+    
+    Args:
+        input_dir: ペア表のディレクトリ
+        mmap: NumPy使用時にメモリマップで開く場合True
+    
+    Returns:
+        {"rows": 行数, "columns": {列名: 列}, "dictionaries": {辞書名: [str]}}
+    """
+    data = load_columns(input_dir, mmap=mmap)
+    table_schema = data["schema"]["tables"].get(PairTableWriter.TABLE)
+    if table_schema is None:
+        raise ValueError(f"Not a pair table: {input_dir}")
+    return {
+        "rows": table_schema["rows"],
+        "columns": data["tables"][PairTableWriter.TABLE],
+        "dictionaries": data["dictionaries"],
+    }
+
+
+def _tee_rows(rows: Iterable[tuple], writer: PairTableWriter) -> Iterator[tuple]:
+    """行をペア表のライターにも渡しながら返す"""
+    for row in rows:
+        writer.write_row(row)
+        yield row
+
+
+def main_partitioned(json_dir: str, partition_dir: str, force: bool = False, folding: str = DEFAULT_FOLDING):
+    """
+    フォントごとのパーティションのインクリメンタル集計（main の --partition-dir）
+    """
+    from pair_partitions import update_partitions
     
-    print(f"Loaded {len(json_data_list)} JSON files")
+    logger.info("=" * 60)
+    logger.info("Phase1 文字ペア集計スクリプト（インクリメンタル）")
+    logger.info("=" * 60)
+    logger.info("JSON directory: %s", json_dir)
+    logger.info("Partition directory: %s", partition_dir)
+    logger.info("-" * 60)
     
-    # 文字ペアのレコードを生成
-    records = aggregate_pairs(json_data_list)
+    result = update_partitions(json_dir, partition_dir, force, folding)
+    
+    logger.log(SUMMARY, "JSON files: %s (new: %s, changed: %s, removed: %s, unchanged: %s)",
+               result["sources"], result["new"], result["changed"], result["removed"], result["unchanged"])
+    logger.log(SUMMARY, "Partitions: %s rewritten, %s appended", len(result["rewritten"]), len(result["appended"]))
+    logger.log(SUMMARY, "Total pair records: %s", result["records"])
+    log_warning_summary(logger)
+    
+    logger.log(SUMMARY, "-" * 60)
+    logger.log(SUMMARY, "Processing completed!")
+
+
+def _iter_counted_sources(paths: List[Path], counts: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """
+    ファイルを順に読み込み、読み込んだJSONデータの件数を counts["loaded"] に加算する
+    """
+    for path in paths:
+        for json_data in iter_json_source(path):
+            counts["loaded"] = counts.get("loaded", 0) + 1
+            yield json_data
+
+
+def main(json_dir: str = JSON_DIR, output_csv: str = OUTPUT_CSV, sqlite_path: Optional[str] = None, jobs: int = 1,
+         partition_dir: Optional[str] = None, force: bool = False, columnar_out: Optional[str] = None,
+         folding: str = DEFAULT_FOLDING):
+    """
+    メイン処理
     
-    if not records:
-        print("No pairs found. Exiting.")
+    Args:
+        json_dir: JSONファイルが格納されているディレクトリ
+        output_csv: 出力先のCSVファイル
+        sqlite_path: 指定した場合、JSONの代わりにSQLiteデータベースから集計する
+        jobs: JSONの読み込みとレコード生成の並列プロセス数（1なら逐次処理、0ならCPU数）
+        partition_dir: 指定した場合、output_csvの代わりにこのディレクトリのフォントごとのCSVを
+                       変わったJSONファイルの分だけ更新する（pair_partitions.py）
+        force: partition_dir指定時に、すべてのパーティションを作り直す
+        columnar_out: 指定した場合、CSVと同じ行を列指向のペア表（PairTableWriter）としてこのディレクトリにも書き出す
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS、"none" なら元の文字のまま）
+    """
+    if partition_dir:
+        main_partitioned(json_dir, partition_dir, force, folding)
         return
     
-    print(f"Generated {len(records)} pair records")
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    
+    logger.info("=" * 60)
+    logger.info("Phase1 文字ペア集計スクリプト")
+    logger.info("=" * 60)
+    if sqlite_path:
+        logger.info("SQLite database: %s", sqlite_path)
+    else:
+        logger.info("JSON directory: %s", json_dir)
+    logger.info("Output CSV: %s", output_csv)
+    logger.info("Pair key folding: %s", folding)
+    if columnar_out:
+        logger.info("Columnar pair table: %s", columnar_out)
+    logger.info("-" * 60)
+    
+    # ファイルの列挙 → JSONの読み込み → 文字ペアのレコード → CSVの書き出しを1件ずつ流す
+    counts = {"loaded": 0}
+    if sqlite_path:
+        # SQLiteデータベースからペアレコードを取得
+        rows = (record_row(record) for record in iter_records_from_sqlite(sqlite_path, folding=folding))
+    else:
+        paths = list_json_sources(json_dir)
+        if jobs > 1 and len(paths) > 1:
+            # 読み込みとレコード生成をワーカープロセスで行い、ファイル順に連結して書き出す
+            logger.info("Jobs: %s", jobs)
+            rows = iter_pair_rows_parallel(paths, jobs, counts, folding)
+        else:
+            # JSONファイルを読み込みながら文字ペアのレコードを生成
+            rows = (record_row(record) for record in iter_pair_records(_iter_counted_sources(paths, counts), folding))
     
-    # CSVファイルに書き出し
-    write_csv(records, OUTPUT_CSV)
+    table_writer = PairTableWriter(columnar_out) if columnar_out else None
+    if table_writer is not None:
+        rows = _tee_rows(rows, table_writer)
+    record_count = write_csv_rows(rows, output_csv)
+    if table_writer is not None and record_count:
+        table_writer.close()
+        logger.log(SUMMARY, "Successfully wrote %s records to %s (columnar)", record_count, columnar_out)
     
-    print("-" * 60)
-    print("Processing completed!")
+    if not sqlite_path:
+        loaded = counts["loaded"]
+        if not loaded:
+            logger.warning("No JSON data loaded. Exiting.")
+            return
+        logger.info("Loaded %s JSON files", loaded)
+    
+    if not record_count:
+        logger.warning("No pairs found. Exiting.")
+        return
+    
+    logger.log(SUMMARY, "Generated %s pair records", record_count)
+    log_warning_summary(logger)
+    
+    logger.log(SUMMARY, "-" * 60)
+    logger.log(SUMMARY, "Processing completed!")
 
 
 if __name__ == "__main__":
-    main()
-
+    parser = argparse.ArgumentParser(description="Phase1 文字ペア集計スクリプト")
+    parser.add_argument("--json-dir", default=JSON_DIR, help=f"JSONファイルのフォルダ（デフォルト: {JSON_DIR}）")
+    parser.add_argument("--output", default=OUTPUT_CSV, help=f"出力先のCSVファイル（デフォルト: {OUTPUT_CSV}）")
+    parser.add_argument("--sqlite", dest="sqlite_path", default=None,
+                        help="JSONの代わりに集計するSQLiteデータベース（batch_process.py --format sqlite の出力）")
+    parser.add_argument("--columnar-out", default=None,
+                        help="CSVに加えて、列指向のペア表（float32の列と辞書コード、.npy + schema.json）をこのディレクトリに書き出す")
+    parser.add_argument("--partition-dir", default=None,
+                        help="1つのCSVの代わりに、フォントごとのCSVをこのディレクトリに出力し、変わったJSONファイルの分だけ更新する")
+    parser.add_argument("--force", action="store_true",
+                        help="--partition-dir で、状態ファイルを使わずにすべてのパーティションを作り直す")
+    parser.add_argument("--fold", choices=FOLDINGS, default=DEFAULT_FOLDING,
+                        help="pair_keyの文字の正規化（nfkc: 全角・半角などをまとめる、none: 元の文字のまま）")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="JSONの読み込みとレコード生成の並列プロセス数（1: 逐次処理、0: CPU数）")
+    parser.add_argument("--quiet", "-q", action="store_true", help="処理結果の要約とエラーだけを表示する")
+    parser.add_argument("--verbose", "-v", action="store_true", help="繰り返される警告も1件ずつ表示する")
+    parser.add_argument("--log-file", default=None, help="すべてのログをJSON Lines形式で追記するファイル")
+    args = parser.parse_args()
+    setup_logging(args.quiet, args.verbose, args.log_file)
+    
+    main(args.json_dir, args.output, args.sqlite_path, args.jobs, args.partition_dir, args.force,
+         args.columnar_out, args.fold)
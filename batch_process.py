@@ -9,11 +9,19 @@
 - 学習用パイプラインは dataset_train のみを入力とする
 """
 
+import argparse
+import io
+import logging
 import os
 import sys
-from pathlib import Path
-from typing import List
-from svg_parser import parse_svg, parse_svg_groups
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from functools import partial
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from svg_parser import load_svg_root, parse_svg, parse_svg_groups
 from csv_loader import load_csv
 from gap_extractor import (
     merge_svg_csv,
@@ -21,9 +29,42 @@ from gap_extractor import (
     extract_sequence,
     extract_bbox_dict,
     get_font,
+    iter_ngrams,
     split_by_names
 )
-from export_json import export_to_json
+from export_json import (
+    OUTPUT_FORMATS,
+    DEFAULT_SHARD_BYTES,
+    DEFAULT_QUEUE_SIZE,
+    BackgroundWriter,
+    build_record,
+    open_writer,
+    SQLITE_FILENAME
+)
+from manifest import (
+    INCREMENTAL_FORMATS,
+    BuildJournal,
+    apply_journal,
+    load_manifest,
+    plan_build,
+    save_manifest
+)
+from isolation import REJECTS_FILENAME, IsolatedPool, write_rejects
+from profiling import PROFILE_MODES, profile_run
+from sharding import PARTIAL_PAIRS_FILENAME, parse_shard, select_shard, shard_dir, shard_path, write_partial_pairs
+from metrics import FileMetrics, build_run_report, print_run_report, write_run_report
+from pair_keys import DEFAULT_FOLDING, FOLDINGS
+from log_utils import (
+    SUMMARY,
+    collect_records,
+    log_context,
+    log_warning_summary,
+    replay_records,
+    setup_logging,
+    warn_repeated
+)
+
+logger = logging.getLogger(__name__)
 
 
 # デフォルトのディレクトリ設定
@@ -31,164 +72,631 @@ from export_json import export_to_json
 DEFAULT_DATASET_DIR = "./dataset_train"  # 学習用データセット（目視確認済み）
 DEFAULT_OUTPUT_DIR = "./output_json/train"  # 学習用JSON出力先
 
+# --watch の設定
+DEFAULT_WATCH_INTERVAL = 1.0  # データセットを確認する間隔（秒）
+DEFAULT_SETTLE_SECONDS = 2.0  # 変更が止まってから処理を始めるまでの待ち時間（秒、書き込み途中のファイル対策）
+DEFAULT_PAIRS_CSV = "./pairs_aggregated.csv"  # 集計結果のCSV（sqlite形式）
+DEFAULT_PARTITION_DIR = "./pairs_partitions"  # フォントごとの集計結果のCSV（json形式、aggregate_pairs.py --partition-dir）
+DEFAULT_MODEL_PATH = "./assets/phase1_model.json"  # Phase1モデルの出力先
+
+# --profile の出力先（拡張子なし）
+DEFAULT_PROFILE_PREFIX = "./profile/batch_process"
+
+
+# 一括表示する孤立ファイル名の上限（すべての名前は --verbose で表示）
+ORPHAN_LIST_LIMIT = 10
 
-def find_svg_csv_pairs(dataset_dir: str) -> List[tuple]:
+# 並列処理でワーカーに渡すチャンクの上限（ペア数）と、ワーカーあたりの先読みチャンク数
+# （解析が書き込みより速くても、結果をこれ以上メモリに溜めない）
+MAX_CHUNK_SIZE = 16
+IN_FLIGHT_CHUNKS_PER_JOB = 2
+
+
+def iter_dataset_files(dataset_dir: str, recursive: bool = True) -> Iterator[os.DirEntry]:
+    """
+    データセットディレクトリ内のSVG/CSVファイルを列挙する（os.scandirによる1回の走査）
+    
+    Args:
+        dataset_dir: データセットディレクトリのパス
+        recursive: Trueの場合、サブディレクトリも再帰的に走査する（"."で始まるディレクトリは除く）
+    
+    Yields:
+        拡張子が .svg / .csv のファイルのos.DirEntry
+    """
+    stack = [dataset_dir]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not entry.name.startswith("."):
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith((".svg", ".csv")) and entry.is_file():
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def _log_orphans(kind: str, paths: List[str]):
+    """
+    対になるファイルがないファイルをまとめて警告する
+    """
+    if not paths:
+        return
+    names = sorted(os.path.basename(path) for path in paths)
+    shown = ", ".join(names[:ORPHAN_LIST_LIMIT])
+    if len(names) > ORPHAN_LIST_LIMIT:
+        shown += f", ... (+{len(names) - ORPHAN_LIST_LIMIT})"
+    logger.warning("Warning: %s %s files without %s: %s", len(names), kind, "CSV" if kind == "SVG" else "SVG", shown)
+    for path in sorted(paths):
+        logger.debug("  orphan %s: %s", kind, path)
+
+
+def find_svg_csv_pairs(dataset_dir: str, recursive: bool = True) -> List[tuple]:
     """
     データセットディレクトリ内のSVG/CSVペアを検索
     
-    dataset_dir直下にSVGとCSVが混在している構造を想定
+    SVGとCSVを拡張子を除いたファイル名（file_id）ごとに辞書にまとめ、メモリ上で対にする
+    - dataset_dir直下にSVGとCSVが混在している構造
+    - サブディレクトリごとに混在している構造（例: Study/script, Study/縦書き）
+    - svg/ と csv/ に分かれている構造
+    のいずれにも対応する。同じfile_idのファイルが複数ある場合は同じディレクトリのもの同士を対にする
     
     Args:
         dataset_dir: データセットディレクトリのパス
+        recursive: Trueの場合、サブディレクトリも検索する
     
     Returns:
-        [(svg_path, csv_path, file_id), ...] のリスト
+        [(svg_path, csv_path, file_id), ...] のリスト（SVGのパス順）
     """
     pairs = []
-    dataset_path = Path(dataset_dir)
     
-    if not dataset_path.exists():
-        print(f"Error: Dataset directory '{dataset_dir}' does not exist")
+    if not os.path.isdir(dataset_dir):
+        logger.error("Error: Dataset directory '%s' does not exist", dataset_dir)
         return pairs
     
-    # dataset_dir直下にSVGとCSVが混在している構造
-    svg_files = list(dataset_path.glob("*.svg"))
+    # file_id（stem）ごとにSVGとCSVを分類
+    svg_files: Dict[str, List[str]] = {}
+    csv_files: Dict[str, List[str]] = {}
+    for entry in iter_dataset_files(dataset_dir, recursive):
+        stem, ext = os.path.splitext(entry.name)
+        bucket = svg_files if ext.lower() == ".svg" else csv_files
+        bucket.setdefault(stem, []).append(entry.path)
     
-    for svg_file in svg_files:
-        file_id = svg_file.stem
-        csv_file = dataset_path / f"{file_id}.csv"
+    orphan_svgs = []
+    orphan_csvs = []
+    duplicates = []
+    for file_id in sorted(svg_files):
+        svg_paths = sorted(svg_files[file_id])
+        csv_paths = sorted(csv_files.pop(file_id, []))
+        if not csv_paths:
+            orphan_svgs.extend(svg_paths)
+            continue
         
-        if csv_file.exists():
-            pairs.append((str(svg_file), str(csv_file), file_id))
+        if len(svg_paths) == 1 and len(csv_paths) == 1:
+            matched = [(svg_paths[0], csv_paths[0])]
         else:
-            print(f"Warning: CSV file not found for {svg_file.name}")
+            # 同じディレクトリのSVGとCSVを対にする
+            csv_by_dir = {os.path.dirname(path): path for path in csv_paths}
+            matched = []
+            for svg_path in svg_paths:
+                csv_path = csv_by_dir.pop(os.path.dirname(svg_path), None)
+                if csv_path is None:
+                    orphan_svgs.append(svg_path)
+                else:
+                    matched.append((svg_path, csv_path))
+            orphan_csvs.extend(csv_by_dir.values())
+        
+        # file_idは出力ファイル名に使うため、重複する場合は最初のペアだけを使う
+        if matched:
+            pairs.append((matched[0][0], matched[0][1], file_id))
+            duplicates.extend(svg_path for svg_path, _ in matched[1:])
+    
+    for paths in csv_files.values():
+        orphan_csvs.extend(paths)
+    
+    _log_orphans("SVG", orphan_svgs)
+    _log_orphans("CSV", orphan_csvs)
+    if duplicates:
+        logger.warning("Warning: %s pairs skipped (duplicate file id): %s",
+                       len(duplicates), ", ".join(sorted(duplicates)))
     
     return pairs
 
 
-def process_single_pair(svg_path: str, csv_path: str, file_id: str, output_dir: str) -> bool:
+def subdir_tag(dataset_dir: str, svg_path: str) -> Optional[str]:
     """
-    1つのSVG/CSVペアを処理してJSONを生成
+    SVGファイルのdataset_dirからの相対ディレクトリを返す（直下の場合はNone）
+    
+    例: dataset_dir="Study", svg_path="Study/縦書き/123.svg" → "縦書き"
+    """
+    relative = os.path.relpath(os.path.dirname(svg_path), dataset_dir)
+    if relative == os.curdir:
+        return None
+    return relative.replace(os.sep, "/")
+
+
+def compute_single_pair(svg_path: str, csv_path: str, file_id: str,
+                        metrics: Optional[FileMetrics] = None) -> Optional[List[Tuple[str, str, Dict]]]:
+    """
+    1つのSVG/CSVペアを解析して、名前ごとの出力レコードを生成（ファイルへの書き込みはしない）
     
     Args:
         svg_path: SVGファイルのパス
         csv_path: CSVファイルのパス
         file_id: ファイルID
-        output_dir: 出力ディレクトリ
+        metrics: 指定した場合、ステージごとの処理時間と件数を記録する
     
     Returns:
-        成功した場合True、失敗した場合False
+        [(出力ファイル名（拡張子なし）, 名前のテキスト, レコード), ...] のリスト
+        失敗した場合はNone
     """
+    if metrics is None:
+        metrics = FileMetrics(file_id)
+    
     try:
-        print(f"Processing: {file_id}")
+        # Step 1: SVGを解析（XMLは1回だけ解析し、bounding boxとグループ構造で共有）
+        with metrics.stage("svg_xml"):
+            svg_root = load_svg_root(svg_path)
+        if svg_root is None:
+            logger.error("  Error: Failed to parse SVG %s", svg_path)
+            return None
         
-        # Step 1: SVGを解析（bounding box情報を取得）
-        svg_data = parse_svg(svg_path)
+        with metrics.stage("svg_bbox"):
+            svg_data = parse_svg(svg_path, svg_root)
+            # Step 1.5: SVGのグループ構造を取得（名前ごとのグループ）
+            svg_groups = parse_svg_groups(svg_path, svg_root)
+        metrics.count("paths", len(svg_data))
         if not svg_data:
-            print(f"  Error: Failed to parse SVG {svg_path}")
-            return False
-        
-        # Step 1.5: SVGのグループ構造を取得（名前ごとのグループ）
-        svg_groups = parse_svg_groups(svg_path)
+            logger.error("  Error: Failed to parse SVG %s", svg_path)
+            return None
         
         # Step 2: CSVを読み込み
-        csv_data = load_csv(csv_path)
+        with metrics.stage("csv_load"):
+            csv_data = load_csv(csv_path)
         if not csv_data:
-            print(f"  Error: Failed to load CSV {csv_path}")
-            return False
+            logger.error("  Error: Failed to load CSV %s", csv_path)
+            return None
         
         # Step 3: 結合・gap_actual計算
-        merged_data = merge_svg_csv(svg_data, csv_data)
+        with metrics.stage("merge"):
+            merged_data = merge_svg_csv(svg_data, csv_data)
         if not merged_data:
-            print(f"  Error: Failed to merge SVG and CSV data")
-            return False
+            logger.error("  Error: Failed to merge SVG and CSV data")
+            return None
+        metrics.count("glyphs", len(merged_data))
         
         # 名前ごとに分割（SVGグループ構造を使用）
-        name_groups = split_by_names(merged_data, svg_groups)
+        with metrics.stage("split_by_names"):
+            name_groups = split_by_names(merged_data, svg_groups)
         
         if not name_groups:
-            print(f"  Warning: No names found in {file_id}")
-            return False
-        
-        # 各名前ごとにJSONを出力
-        success_count = 0
-        for name_index, name_data in enumerate(name_groups):
-            # CSVのname_textを優先的に使用
-            name_text = ""
-            if name_data and name_data[0].get("name_text"):
-                name_text = name_data[0].get("name_text", "").strip()
-            
-            # name_textが取得できない場合、各文字のtextを結合（後方互換性のため）
-            if not name_text:
-                for item in name_data:
-                    text = item.get("text", "").strip()
-                    if text:
-                        name_text += text
-            
-            # 名前のテキストが取得できない場合、インデックスを使用
-            if not name_text:
-                name_text = f"name{name_index + 1}"
-            
-            # ファイル名に使用できない文字を置換
-            safe_name = "".join(c if c.isalnum() or ord(c) > 127 else '_' for c in name_text)
-            # 長すぎる場合は切り詰め
-            if len(safe_name) > 30:
-                safe_name = safe_name[:30]
-            
-            # gap_actualを計算
-            pairs = calculate_gap_actual(name_data)
-            
-            # シーケンス情報を抽出
-            sequence = extract_sequence(name_data)
-            
-            # bounding box情報を抽出（全データから該当するidのみ）
-            all_bbox = extract_bbox_dict(merged_data)
-            bbox = {item["id"]: all_bbox[item["id"]] for item in name_data if item["id"] in all_bbox}
-            
-            # フォント名を取得
-            font = get_font(name_data)
-            
-            # ファイル名を生成（複数の名前がある場合はインデックスも含める）
-            if len(name_groups) > 1:
-                output_filename = f"{file_id}_{name_index + 1:02d}_{safe_name}.json"
-            else:
-                # 名前が1つでも名前をファイル名に含める
-                output_filename = f"{file_id}_{safe_name}.json"
-            
-            output_path = os.path.join(output_dir, output_filename)
-            
-            # Step 4: JSONを出力
-            success = export_to_json(
-                output_path=output_path,
-                file_id=file_id,
-                font=font,
-                sequence=sequence,
-                pairs=pairs,
-                bbox=bbox
-            )
-            
-            if success:
-                print(f"  Success: Generated {output_path} (name: {name_text})")
-                success_count += 1
-            else:
-                print(f"  Error: Failed to export JSON for name: {name_text}")
+            logger.warning("  Warning: No names found in %s", file_id)
+            return None
+        metrics.count("names", len(name_groups))
         
-        return success_count == len(name_groups)
+        with metrics.stage("records"):
+            named_records = build_named_records(file_id, merged_data, name_groups)
+        metrics.count("pairs", sum(len(record["pairs"]) for _, _, record in named_records))
+        return named_records
     
+    except MemoryError:
+        raise
     except Exception as e:
-        print(f"  Error processing {file_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("  Error processing %s: %s", file_id, e)
+        return None
+
+
+def build_named_records(file_id: str, merged_data: List[Dict], name_groups: List[List[Dict]]) -> List[Tuple[str, str, Dict]]:
+    """
+    名前ごとに分割したデータから、出力ファイル名とレコードを生成する
+    
+    Args:
+        file_id: ファイルID
+        merged_data: merge_svg_csvの結果
+        name_groups: split_by_namesの結果
+    
+    Returns:
+        [(出力ファイル名（拡張子なし）, 名前のテキスト, レコード), ...] のリスト
+    """
+    # bounding box情報を抽出（全データ分を1回だけ）
+    all_bbox = extract_bbox_dict(merged_data)
+    
+    # 各名前ごとにレコードを生成
+    named_records = []
+    for name_index, name_data in enumerate(name_groups):
+        # CSVのname_textを優先的に使用
+        name_text = ""
+        if name_data and name_data[0].get("name_text"):
+            name_text = name_data[0].get("name_text", "").strip()
+        
+        # name_textが取得できない場合、各文字のtextを結合（後方互換性のため）
+        if not name_text:
+            for item in name_data:
+                text = item.get("text", "").strip()
+                if text:
+                    name_text += text
+        
+        # 名前のテキストが取得できない場合、インデックスを使用
+        if not name_text:
+            name_text = f"name{name_index + 1}"
+        
+        # ファイル名に使用できない文字を置換
+        safe_name = "".join(c if c.isalnum() or ord(c) > 127 else '_' for c in name_text)
+        # 長すぎる場合は切り詰め
+        if len(safe_name) > 30:
+            safe_name = safe_name[:30]
+        
+        # gap_actualを計算
+        pairs = calculate_gap_actual(name_data)
+        
+        # シーケンス情報を抽出
+        sequence = extract_sequence(name_data)
+        
+        # bounding box情報（該当するidのみ）
+        bbox = {item["id"]: all_bbox[item["id"]] for item in name_data if item["id"] in all_bbox}
+        
+        # フォント名を取得
+        font = get_font(name_data)
+        
+        # ファイル名を生成（複数の名前がある場合はインデックスも含める）
+        if len(name_groups) > 1:
+            output_name = f"{file_id}_{name_index + 1:02d}_{safe_name}"
+        else:
+            # 名前が1つでも名前をファイル名に含める
+            output_name = f"{file_id}_{safe_name}"
+        
+        record = build_record(file_id, font, sequence, pairs, bbox)
+        named_records.append((output_name, name_text, record))
+    
+    return named_records
+
+
+def write_pair_records(named_records: List[Tuple[str, str, Dict]], writer) -> bool:
+    """
+    compute_single_pairで生成した名前ごとのレコードをライターに書き出す
+    
+    Args:
+        named_records: [(出力ファイル名, 名前のテキスト, レコード), ...]
+        writer: 出力先のライター（export_json.open_writerで生成）
+    
+    Returns:
+        すべての名前を書き出せた場合True
+    """
+    success_count = 0
+    for output_name, name_text, record in named_records:
+        # Step 4: JSONを出力
+        try:
+            output_path = writer.write(record, output_name)
+        except Exception as e:
+            logger.error("  Error exporting %s: %s", output_name, e)
+            output_path = None
+        
+        if output_path:
+            logger.info("  Success: Generated %s (name: %s)", output_path, name_text)
+            success_count += 1
+        else:
+            logger.error("  Error: Failed to export JSON for name: %s", name_text)
+    
+    return success_count == len(named_records)
+
+
+def process_single_pair(svg_path: str, csv_path: str, file_id: str, output_dir: str, writer=None) -> bool:
+    """
+    1つのSVG/CSVペアを処理してJSONを生成
+    
+    Args:
+        svg_path: SVGファイルのパス
+        csv_path: CSVファイルのパス
+        file_id: ファイルID
+        output_dir: 出力ディレクトリ
+        writer: 出力先のライター（export_json.open_writerで生成、Noneの場合はoutput_dirへ名前ごとのJSON）
+    
+    Returns:
+        成功した場合True、失敗した場合False
+    """
+    if writer is None:
+        writer = open_writer("json", output_dir)
+    
+    results = list(process_many([(svg_path, csv_path, file_id)]))
+    if not results[0].ok:
         return False
+    return write_pair_records([(r.output_name, r.name_text, r.record) for r in results], writer)
+
+
+def _compute_logged(svg_path: str, csv_path: str, file_id: str, metrics: FileMetrics,
+                    raise_memory_error: bool = False) -> Optional[List[Tuple[str, str, Dict]]]:
+    """
+    1ペアを解析する（メモリ不足はraise_memory_errorがFalseならエラーとして扱う）
+    """
+    with log_context(file_id):
+        logger.info("Processing: %s", file_id)
+        try:
+            return compute_single_pair(svg_path, csv_path, file_id, metrics)
+        except MemoryError:
+            if raise_memory_error:
+                raise
+            logger.error("  Error: Out of memory while processing %s", file_id)
+            return None
+
+
+def _compute_in_worker(task: Tuple[str, str, str], raise_memory_error: bool = False
+                       ) -> Tuple[str, Optional[List[Tuple[str, str, Dict]]], str, List[logging.LogRecord], Dict]:
+    """
+    ワーカープロセスで1ペアを解析する（ログレコードと標準出力・標準エラーはまとめて親プロセスに返す）
+    
+    Args:
+        task: (svg_path, csv_path, file_id)
+        raise_memory_error: Trueの場合、メモリ不足をMemoryErrorとして呼び出し元に伝える（IsolatedPool用）
+    
+    Returns:
+        (file_id, compute_single_pairの結果, 解析中に出力されたメッセージ, ログレコード, FileMetrics.to_dict()の結果)
+    """
+    svg_path, csv_path, file_id = task
+    metrics = FileMetrics(file_id)
+    buffer = io.StringIO()
+    with redirect_stdout(buffer), redirect_stderr(buffer), collect_records() as collector:
+        named_records = _compute_logged(svg_path, csv_path, file_id, metrics, raise_memory_error)
+    return file_id, named_records, buffer.getvalue(), collector.records, metrics.to_dict()
+
+
+def _compute_chunk(tasks: List[Tuple[str, str, str]]) -> List[tuple]:
+    """ワーカープロセスで複数のペアを順に解析する（ProcessPoolExecutorに渡す単位）"""
+    return [(task, _compute_in_worker(task)) for task in tasks]
 
 
-def main(dataset_dir: str = None, output_dir: str = None):
+def _iter_chunks(pairs: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    chunk = []
+    for pair in pairs:
+        chunk.append(pair)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_pair_results(
+    pairs: Iterable[tuple],
+    jobs: int = 1,
+    file_timeout: Optional[float] = None,
+    max_memory_mb: Optional[int] = None
+) -> Iterator[Tuple[tuple, Optional[List[Tuple[str, str, Dict]]], List[logging.LogRecord], FileMetrics, Optional[str]]]:
+    """
+    SVG/CSVペアを順に解析して、入力順に結果を返す（process_manyの本体）
+    
+    jobsが2以上の場合はProcessPoolExecutorでワーカープロセスに分配し（チャンク単位、
+    先読みはjobs * IN_FLIGHT_CHUNKS_PER_JOB チャンクまで）、各ワーカーのログは入力順にまとめてこのプロセスで出力する
+    
+    file_timeoutまたはmax_memory_mbを指定した場合は、jobs個のワーカープロセスで1ペアずつ解析し
+    （isolation.IsolatedPool）、制限を超えたペアを打ち切る
+    
+    Yields:
+        (タスク, compute_single_pairの結果, 解析中のログレコード, ステージごとの処理時間と件数, 打ち切った理由)
+    """
+    if file_timeout or max_memory_mb:
+        pool = IsolatedPool(partial(_compute_in_worker, raise_memory_error=True), jobs, file_timeout, max_memory_mb)
+        for task, result, reason in pool.imap(pairs):
+            file_id = task[2]
+            if reason is not None:
+                with log_context(file_id):
+                    logger.error("  Rejected: %s (%s)", file_id, reason)
+                yield task, None, [], FileMetrics(file_id), reason
+                continue
+            _, named_records, output, records, metrics = result
+            sys.stdout.write(output)
+            replay_records(records)
+            yield task, named_records, records, FileMetrics.from_dict(metrics), None
+        return
+    
+    if jobs <= 1:
+        for task in pairs:
+            svg_path, csv_path, file_id = task
+            metrics = FileMetrics(file_id)
+            with collect_records(keep_handlers=True) as collector:
+                named_records = _compute_logged(svg_path, csv_path, file_id, metrics)
+            yield task, named_records, collector.records, metrics, None
+        return
+    
+    # チャンクの大きさはペア数から決め（件数が分からない場合は1件ずつ）、結果を溜め込まないよう先読みを制限する
+    size = len(pairs) if hasattr(pairs, "__len__") else 0
+    chunksize = max(1, min(MAX_CHUNK_SIZE, size // (jobs * 4)))
+    chunks = _iter_chunks(pairs, chunksize)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = deque(executor.submit(_compute_chunk, chunk)
+                          for chunk in islice(chunks, jobs * IN_FLIGHT_CHUNKS_PER_JOB))
+        while in_flight:
+            results = in_flight.popleft().result()
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                in_flight.append(executor.submit(_compute_chunk, next_chunk))
+            for task, (_, named_records, output, records, metrics) in results:
+                sys.stdout.write(output)
+                replay_records(records)
+                yield task, named_records, records, FileMetrics.from_dict(metrics), None
+
+
+class NameResult:
+    """
+    process_manyが返す1名前分の解析結果
+    
+    解析に失敗した・打ち切ったペアは、errorを設定した1件の結果として返す（name_index以降はNone）
+    
+    Attributes:
+        file_id: ファイルID
+        svg_path: SVGファイルのパス
+        csv_path: CSVファイルのパス
+        name_index: ファイル内の名前の番号（0始まり）
+        name_count: ファイル内の名前の数
+        output_name: 出力ファイル名（拡張子なし、例: "13033022_01_佐藤"）
+        name_text: 名前のテキスト
+        record: export_json.build_record の形式のレコード
+        diagnostics: このペアの解析中の警告・エラーのメッセージ（同じファイルの名前で共有）
+        metrics: ステージごとの処理時間と件数（同じファイルの名前で共有）
+        error: 失敗した場合の理由（成功した場合はNone）
+        rejected: 制限時間・メモリ上限を超えて打ち切った場合True
+    """
+    
+    __slots__ = ("file_id", "svg_path", "csv_path", "name_index", "name_count", "output_name", "name_text",
+                 "record", "diagnostics", "metrics", "error", "rejected")
+    
+    def __init__(self, file_id: str, svg_path: str, csv_path: str, name_index: Optional[int] = None,
+                 name_count: Optional[int] = None, output_name: Optional[str] = None, name_text: Optional[str] = None,
+                 record: Optional[Dict[str, Any]] = None, diagnostics: Optional[List[str]] = None,
+                 metrics: Optional[FileMetrics] = None, error: Optional[str] = None, rejected: bool = False):
+        self.file_id = file_id
+        self.svg_path = svg_path
+        self.csv_path = csv_path
+        self.name_index = name_index
+        self.name_count = name_count
+        self.output_name = output_name
+        self.name_text = name_text
+        self.record = record
+        self.diagnostics = diagnostics or []
+        self.metrics = metrics
+        self.error = error
+        self.rejected = rejected
+    
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+    
+    @property
+    def font(self) -> Optional[str]:
+        return self.record["font"] if self.record else None
+    
+    @property
+    def sequence(self) -> List[Dict[str, str]]:
+        """[{"id": str, "text": str}, ...]"""
+        return self.record["sequence"] if self.record else []
+    
+    @property
+    def pairs(self) -> List[Dict[str, Any]]:
+        """[{"left_id", "left", "right_id", "right", "gap_actual"}, ...]"""
+        return self.record["pairs"] if self.record else []
+    
+    @property
+    def bbox(self) -> Dict[str, Dict[str, float]]:
+        """{id: {"min_x", "max_x", "min_y", "max_y", "width", "height"}}"""
+        return self.record["bbox"] if self.record else {}
+    
+    def ngrams(self, n: int = 3) -> Optional[Dict[str, Any]]:
+        """
+        この名前のn文字のスライディング窓と、gapの平均・標準偏差などの集計値（Phase2用、gap_extractor.iter_ngrams）
+        
+        Returns:
+            iter_ngramsの1名前分の結果（失敗した結果ではNone）
+        """
+        if not self.ok:
+            return None
+        bbox = self.bbox
+        name_data = [{**bbox[item["id"]], **item} for item in self.sequence if item["id"] in bbox]
+        return next(iter_ngrams([name_data], n))
+    
+    def __repr__(self) -> str:
+        if self.error is not None:
+            return f"NameResult({self.file_id!r}, error={self.error!r})"
+        return f"NameResult({self.output_name!r}, pairs={len(self.pairs)})"
+
+
+def process_many(
+    pairs: Iterable[tuple],
+    jobs: int = 1,
+    file_timeout: Optional[float] = None,
+    max_memory_mb: Optional[int] = None
+) -> Iterator[NameResult]:
+    """
+    SVG/CSVペアを解析して、名前ごとの結果を入力順に返す（ファイルには書き込まない）
+    
+    結果は解析が終わったペアから順に返すので、データセット全体をメモリに載せずに処理できる。
+    ファイルへの出力（main）や一括パイプライン（pipeline.py）もこの結果を書き出している。
+    
+    使い方:
+        from batch_process import find_svg_csv_pairs, process_many
+        for result in process_many(find_svg_csv_pairs("./dataset_train"), jobs=4):
+            if result.ok:
+                print(result.output_name, result.sequence, result.pairs, result.bbox)
+    
+    Args:
+        pairs: [(svg_path, csv_path, file_id), ...]（find_svg_csv_pairsの結果、イテレータでもよい）
+        jobs: 解析の並列プロセス数（1なら逐次処理、0ならCPU数）
+        file_timeout: 指定した場合、1ペアの解析がこの秒数を超えたら打ち切る
+        max_memory_mb: 指定した場合、解析するワーカープロセスのメモリ上限（MB、Unix系のみ）
+    
+    Yields:
+        NameResult（失敗したペアはerrorを設定した1件）
+    """
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    
+    for (svg_path, csv_path, file_id), named_records, records, metrics, reason in _iter_pair_results(
+            pairs, jobs, file_timeout, max_memory_mb):
+        diagnostics = [record.getMessage().strip() for record in records if record.levelno >= logging.WARNING]
+        if reason is not None:
+            yield NameResult(file_id, svg_path, csv_path, diagnostics=diagnostics, metrics=metrics,
+                             error=reason, rejected=True)
+            continue
+        if named_records is None:
+            yield NameResult(file_id, svg_path, csv_path, diagnostics=diagnostics, metrics=metrics,
+                             error=diagnostics[-1] if diagnostics else "failed to process")
+            continue
+        for name_index, (output_name, name_text, record) in enumerate(named_records):
+            yield NameResult(file_id, svg_path, csv_path, name_index, len(named_records), output_name, name_text,
+                             record, diagnostics, metrics)
+
+
+def iter_file_results(results: Iterable[NameResult]) -> Iterator[List[NameResult]]:
+    """
+    process_manyの結果をファイルごとにまとめる（次のファイルの結果を待たずに返す）
+    
+    Yields:
+        1ファイル分のNameResultのリスト（失敗したペアはerrorを設定した1件）
+    """
+    group = []
+    for result in results:
+        group.append(result)
+        if not result.ok or result.name_index == result.name_count - 1:
+            yield group
+            group = []
+
+
+def main(dataset_dir: str = None, output_dir: str = None, output_format: str = "json",
+         shard_bytes: int = DEFAULT_SHARD_BYTES, background_write: bool = False,
+         queue_size: int = DEFAULT_QUEUE_SIZE, force_write: bool = False, prune: bool = True,
+         jobs: int = 1, force: bool = False, metrics_out: Optional[str] = None,
+         recursive: bool = True, tag_subdirs: bool = False, resume: bool = False,
+         file_timeout: Optional[float] = None, max_memory_mb: Optional[int] = None,
+         rejects_out: Optional[str] = None, shard: Optional[Tuple[int, int]] = None,
+         folding: str = DEFAULT_FOLDING):
     """
     メイン処理
     
     Args:
         dataset_dir: データセットディレクトリ（デフォルト: DEFAULT_DATASET_DIR = "./dataset_train"）
         output_dir: 出力ディレクトリ（デフォルト: DEFAULT_OUTPUT_DIR = "./output_json/train"）
+        output_format: 出力形式（"json": 名前ごとに1ファイル、"jsonl": シャードファイル）
+        shard_bytes: jsonl形式のシャード1ファイルあたりの上限サイズ（バイト）
+        background_write: Trueの場合、書き込みを別スレッドで行い次のファイルの処理と並行させる
+        queue_size: background_write時に書き込み待ちにできるレコード数の上限
+        force_write: json形式で、内容が変わっていないファイルも書き直す場合True
+        prune: json/sqlite形式で、入力からなくなった名前の古い出力を削除する場合True
+        jobs: 解析の並列プロセス数（1なら逐次処理、0ならCPU数）
+        force: json/sqlite形式で、マニフェストを無視して全ペアを処理し直す場合True
+        metrics_out: 指定した場合、ステージごとの処理時間のレポートをJSONで書き出す
+        recursive: Trueの場合、dataset_dirのサブディレクトリのSVG/CSVも処理する
+        tag_subdirs: Trueの場合、各レコードにdataset_dirからの相対ディレクトリを "subset" として記録する
+        resume: json/sqlite形式で、中断した実行のジャーナルに記録されたペアを処理せずに続きから再開する場合True
+        file_timeout: 指定した場合、1ペアの解析がこの秒数を超えたら打ち切る
+        max_memory_mb: 指定した場合、解析するワーカープロセスのメモリ上限（MB、Unix系のみ）
+        rejects_out: 打ち切ったペアのレポートの出力先（デフォルト: <output_dir>/.batch_rejects）
+        shard: (i, N) を指定した場合、file_idのハッシュでi番目（1始まり）のシャードに属するペアだけを
+               <output_dir>/shard-<i>-of-<N>/ に出力し、文字ペアの部分集計も書き出す（sharding.merge_shardsでまとめる）
+        folding: 文字ペアの部分集計のpair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        処理結果 {"success": int, "errors": int, "unchanged": int, "removed": int, "rejected": int}
+        SVG/CSVペアが見つからなかった場合はNone
     
     注意:
         - 学習用パイプラインは dataset_train を前提とする
@@ -199,51 +707,418 @@ def main(dataset_dir: str = None, output_dir: str = None):
         dataset_dir = DEFAULT_DATASET_DIR
     if output_dir is None:
         output_dir = DEFAULT_OUTPUT_DIR
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    if shard:
+        output_dir = shard_dir(output_dir, *shard)
+        if metrics_out:
+            metrics_out = shard_path(metrics_out, *shard)
+        if rejects_out:
+            rejects_out = shard_path(rejects_out, *shard)
     
-    print("=" * 60)
-    print("SVG+CSV → JSON 変換パイプライン")
-    print("=" * 60)
-    print(f"Dataset directory: {dataset_dir} (SVGとCSVが混在)")
-    print(f"Output directory: {output_dir}")
-    print("-" * 60)
+    logger.info("=" * 60)
+    logger.info("SVG+CSV → JSON 変換パイプライン")
+    logger.info("=" * 60)
+    logger.info("Dataset directory: %s (%s)", dataset_dir, "サブディレクトリを含む" if recursive else "直下のみ")
+    logger.info("Output directory: %s", output_dir)
+    logger.info("Output format: %s", output_format)
+    logger.info("Jobs: %s", jobs)
+    logger.info("-" * 60)
     
     # SVG/CSVペアを検索
-    pairs = find_svg_csv_pairs(dataset_dir)
+    pairs = find_svg_csv_pairs(dataset_dir, recursive)
     
     if not pairs:
-        print("No SVG/CSV pairs found")
+        logger.info("No SVG/CSV pairs found")
         return
     
-    print(f"Found {len(pairs)} SVG/CSV pairs")
-    print("-" * 60)
+    logger.info("Found %s SVG/CSV pairs", len(pairs))
+    if shard:
+        pairs = select_shard(pairs, *shard)
+        logger.info("Shard %s/%s: %s pairs", shard[0], shard[1], len(pairs))
+    
+    # json/sqlite形式では、マニフェストと比べて入力が変わったペアだけを処理する
+    # （jsonl/npy形式は出力全体を作り直すため、常に全ペアを処理する）
+    incremental = output_format in INCREMENTAL_FORMATS
+    todo_pairs = pairs
+    manifest_entries = {}
+    removed_ids = set()
+    journal = None
+    if incremental:
+        manifest = load_manifest(output_dir) if not force else {"entries": {}}
+        todo_pairs, manifest_entries, digests, removed_ids = plan_build(pairs, manifest, output_dir, output_format)
+        logger.info("Unchanged (skipped): %s", len(manifest_entries))
+        quarantined = sum(1 for entry in manifest_entries.values() if entry.get("rejected"))
+        if quarantined:
+            logger.info("  of which quarantined (rejected before): %s", quarantined)
+        logger.info("Removed from dataset: %s", len(removed_ids))
+        
+        # 完了したペアをジャーナルに記録し、中断しても --resume で続きから再開できるようにする
+        journal = BuildJournal(output_dir, resume=resume)
+        if resume:
+            todo_pairs, resumed_entries = apply_journal(todo_pairs, journal.entries, digests, output_dir, output_format)
+            manifest_entries.update(resumed_entries)
+            logger.info("Resumed (already done): %s", len(resumed_entries))
+    elif resume:
+        logger.warning("Warning: --resume supports only %s formats (processing all pairs)", ', '.join(INCREMENTAL_FORMATS))
+    logger.info("-" * 60)
     
     # 各ペアを処理
-    success_count = 0
+    succeeded_ids = []
     error_count = 0
+    rejects = {}
+    outputs_by_id = {}
+    file_metrics = []
+    start_ns = time.perf_counter_ns()
     
-    for svg_path, csv_path, file_id in pairs:
-        if process_single_pair(svg_path, csv_path, file_id, output_dir):
-            success_count += 1
+    if output_format == "json":
+        writer_options = {
+            "skip_unchanged": not force_write,
+            "active_file_ids": {file_id for _, _, file_id in pairs} if prune else None,
+        }
+    elif output_format == "jsonl":
+        writer_options = {"max_bytes": shard_bytes}
+    elif output_format == "sqlite":
+        writer_options = {"active_file_ids": {file_id for _, _, file_id in pairs} if prune else None}
+    else:
+        writer_options = {}
+    writer = open_writer(output_format, output_dir, **writer_options)
+    if background_write:
+        writer = BackgroundWriter(writer, max_pending=queue_size)
+    
+    # サブディレクトリのタグ（例: "縦書き"）
+    tags = {file_id: subdir_tag(dataset_dir, svg_path) for svg_path, _, file_id in pairs} if tag_subdirs else {}
+    
+    # 解析はjobsプロセスで並列に行い（process_many）、書き込みはファイルごとにまとめて入力順にこのプロセスで行う
+    try:
+        with writer:
+            results = process_many(todo_pairs, jobs, file_timeout, max_memory_mb)
+            for file_results in iter_file_results(results):
+                first = file_results[0]
+                file_id = first.file_id
+                if first.rejected:
+                    rejects[file_id] = {"file": file_id, "svg": first.svg_path, "csv": first.csv_path, "reason": first.error}
+                    # 隔離するペアの前回までの出力が aggregate_pairs に読まれないよう削除する
+                    discard = getattr(writer, "discard", None)
+                    if discard is not None:
+                        discard(file_id)
+                    continue
+                metrics = first.metrics
+                file_metrics.append(metrics)
+                named_records = [(r.output_name, r.name_text, r.record) for r in file_results] if first.ok else None
+                if named_records is not None and tags.get(file_id):
+                    for _, _, record in named_records:
+                        record["subset"] = tags[file_id]
+                with log_context(file_id), metrics.stage("write"):
+                    written = named_records is not None and write_pair_records(named_records, writer)
+                if written:
+                    succeeded_ids.append(file_id)
+                    outputs_by_id[file_id] = [output_name for output_name, _, _ in named_records]
+                else:
+                    error_count += 1
+                    continue
+                
+                # 出力をディスクまで書き出してから、完了したペアをジャーナルに記録する
+                if journal is not None:
+                    journal.add(file_id, {**digests[file_id], "outputs": outputs_by_id[file_id]})
+                    if journal.due():
+                        writer.flush()
+                        journal.sync(exclude={file_id for file_id, _ in getattr(writer, "failed", [])})
+    finally:
+        if journal is not None:
+            journal.close()
+    
+    # 別スレッドでの書き込みに失敗したファイルはエラーとして数え直す
+    if background_write and writer.failed:
+        failed_ids = {file_id for file_id, _ in writer.failed}
+        for file_id, name in writer.failed:
+            logger.error("  Error: Failed to export JSON for %s (%s)", name, file_id)
+        error_count += sum(1 for file_id in succeeded_ids if file_id in failed_ids)
+        succeeded_ids = [file_id for file_id in succeeded_ids if file_id not in failed_ids]
+    success_count = len(succeeded_ids)
+    wall_ns = time.perf_counter_ns() - start_ns
+    
+    # 処理に成功したペアをマニフェストに記録する（失敗したペアは次回も処理対象にする）
+    # 打ち切ったペアは入力が変わるまで隔離する（次回も処理しない）
+    if incremental:
+        for file_id in succeeded_ids:
+            manifest_entries[file_id] = {**digests[file_id], "outputs": outputs_by_id[file_id]}
+        for file_id, reject in rejects.items():
+            manifest_entries[file_id] = {**digests[file_id], "outputs": [], "rejected": reject["reason"]}
+        save_manifest(output_dir, output_format, manifest_entries)
+        journal.remove()
+    
+    # 打ち切ったペア（隔離中のものを含む）のレポート
+    quarantined = [
+        {"file": file_id, "svg": entry["svg"]["path"], "csv": entry["csv"]["path"], "reason": entry["rejected"]}
+        for file_id, entry in sorted(manifest_entries.items())
+        if entry.get("rejected") and file_id not in rejects
+    ]
+    all_rejects = sorted(list(rejects.values()) + quarantined, key=lambda reject: reject["file"])
+    rejects_path = rejects_out or os.path.join(output_dir, REJECTS_FILENAME)
+    if all_rejects or os.path.exists(rejects_path):
+        write_rejects(rejects_path, all_rejects)
+    
+    # シャードの文字ペアの部分集計（全シャードの出力が揃ったら sharding.py でまとめる）
+    if shard:
+        if output_format == "json":
+            partial_count = write_partial_pairs(output_dir, folding=folding)
+            logger.info("Partial pairs: %s records (%s)", partial_count, os.path.join(output_dir, PARTIAL_PAIRS_FILENAME))
         else:
-            error_count += 1
+            logger.warning("Warning: partial pairs for merging shards are written only in json format")
     
     # 結果を表示
-    print("-" * 60)
-    print(f"Processing completed:")
-    print(f"  Success: {success_count}")
-    print(f"  Errors: {error_count}")
-    print(f"  Total: {len(pairs)}")
+    logger.log(SUMMARY, "-" * 60)
+    logger.log(SUMMARY, "Processing completed:")
+    logger.log(SUMMARY, "  Success: %s", success_count)
+    logger.log(SUMMARY, "  Errors: %s", error_count)
+    if all_rejects:
+        logger.log(SUMMARY, "  Rejected: %s (see %s)", len(all_rejects), rejects_path)
+    if incremental:
+        logger.log(SUMMARY, "  Unchanged: %s", len(pairs) - len(todo_pairs))
+    logger.log(SUMMARY, "  Total: %s", len(pairs))
+    log_warning_summary(logger)
+    stats = getattr(writer, "stats", None)
+    if stats is not None:
+        logger.log(SUMMARY, "Output files:")
+        logger.log(SUMMARY, "  Written: %s", stats['written'])
+        logger.log(SUMMARY, "  Skipped (unchanged): %s", stats['skipped'])
+        logger.log(SUMMARY, "  Removed (stale): %s", stats['removed'])
+    
+    # ステージごとの処理時間（表は --metrics-out 指定時に表示し、それ以外は --verbose のときだけ）
+    if file_metrics:
+        report = build_run_report(file_metrics, wall_ns)
+        print_run_report(report, level=logging.INFO if metrics_out else logging.DEBUG)
+        if metrics_out:
+            write_run_report(report, metrics_out)
+            logger.log(SUMMARY, "Metrics report: %s", metrics_out)
+    
+    return {
+        "success": success_count,
+        "errors": error_count,
+        "unchanged": len(pairs) - len(todo_pairs),
+        "removed": len(removed_ids),
+        "rejected": len(rejects),
+    }
+
+
+def snapshot_dataset(dataset_dir: str, recursive: bool = True) -> Dict[str, Tuple[int, int]]:
+    """
+    データセットディレクトリ内のSVG/CSVのサイズとmtimeを取得する（os.scandirのstatのみでファイルは読まない）
+    
+    Args:
+        dataset_dir: データセットディレクトリのパス
+        recursive: Trueの場合、サブディレクトリも対象にする
+    
+    Returns:
+        {ファイルのパス: (サイズ, mtime_ns)}
+    """
+    snapshot = {}
+    for entry in iter_dataset_files(dataset_dir, recursive):
+        stat = entry.stat()
+        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+
+def refresh_model(output_dir: str, output_format: str, pairs_csv: str, model_path: str,
+                  partition_dir: str = DEFAULT_PARTITION_DIR, folding: str = DEFAULT_FOLDING) -> Optional[Dict[str, Any]]:
+    """
+    出力から文字ペアの集計を更新し、Phase1モデルを作り直す
+    
+    json形式では、変わったJSONファイルの分だけフォントごとのパーティションを更新し（pair_partitions.update_partitions）、
+    パーティションのディレクトリからモデルを作る。sqlite形式ではデータベース全体から集計し直す。
+    
+    Args:
+        output_dir: batch_processの出力ディレクトリ
+        output_format: 出力形式（"sqlite"の場合はデータベースから集計する）
+        pairs_csv: sqlite形式の集計結果のCSVの出力先
+        model_path: Phase1モデルJSONの出力先
+        partition_dir: json形式のフォントごとの集計結果のディレクトリ
+        folding: pair_key・モデルのキーの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        json形式ではupdate_partitionsの結果（sqlite形式ではNone）
+    """
+    import aggregate_pairs
+    import build_phase1_model
+    from pair_partitions import update_partitions
+    
+    if output_format == "sqlite":
+        aggregate_pairs.main(output_csv=pairs_csv, sqlite_path=os.path.join(output_dir, SQLITE_FILENAME), folding=folding)
+        if os.path.exists(pairs_csv):
+            build_phase1_model.build_phase1_model(pairs_csv, model_path, folding)
+        return None
+    
+    result = update_partitions(output_dir, partition_dir, folding=folding)
+    logger.info("Pair partitions: %s rewritten, %s appended (%s)",
+                len(result["rewritten"]), len(result["appended"]), partition_dir)
+    if result["records"]:
+        if result["rewritten"] or result["appended"] or not os.path.exists(model_path):
+            build_phase1_model.build_phase1_model(partition_dir, model_path, folding)
+    else:
+        logger.warning("No pairs found in %s", output_dir)
+    return result
+
+
+def watch(dataset_dir: str = None, output_dir: str = None, output_format: str = "json",
+          interval: float = DEFAULT_WATCH_INTERVAL, settle: float = DEFAULT_SETTLE_SECONDS,
+          pairs_csv: str = DEFAULT_PAIRS_CSV, model_path: str = DEFAULT_MODEL_PATH,
+          partition_dir: str = DEFAULT_PARTITION_DIR, **options):
+    """
+    データセットディレクトリを監視し、SVG/CSVが追加・変更・削除されるたびに処理し直す
+    
+    - interval秒ごとにsnapshot_datasetで変更を確認する
+    - 変更が止まってからsettle秒たつまで待ち、書き込み途中のファイルを処理しない
+    - 処理はマニフェストによるインクリメンタルビルドで、変わったペアだけを解析する
+    - 出力が変わった場合は、文字ペアの集計とPhase1モデルを更新する（json形式では変わったJSONの分のパーティションだけ）
+    
+    Args:
+        dataset_dir: データセットディレクトリ（デフォルト: DEFAULT_DATASET_DIR）
+        output_dir: 出力ディレクトリ（デフォルト: DEFAULT_OUTPUT_DIR）
+        output_format: 出力形式（"json" または "sqlite"）
+        interval: データセットを確認する間隔（秒）
+        settle: 変更が止まってから処理を始めるまでの待ち時間（秒）
+        pairs_csv: sqlite形式の集計結果のCSVの出力先
+        model_path: Phase1モデルJSONの出力先
+        partition_dir: json形式のフォントごとの集計結果のディレクトリ
+        **options: mainに渡すその他の引数
+    """
+    if dataset_dir is None:
+        dataset_dir = DEFAULT_DATASET_DIR
+    if output_dir is None:
+        output_dir = DEFAULT_OUTPUT_DIR
+    if output_format not in INCREMENTAL_FORMATS:
+        logger.error("Error: --watch supports only %s formats", ', '.join(INCREMENTAL_FORMATS))
+        return
+    
+    # --force は最初の処理にだけ適用する
+    force = options.pop("force", False)
+    
+    def rebuild(force: bool = False):
+        summary = main(dataset_dir, output_dir, output_format, force=force, **options)
+        if summary and (summary["success"] or summary["removed"] or not os.path.exists(model_path)):
+            refresh_model(output_dir, output_format, pairs_csv, model_path, partition_dir,
+                          options.get("folding", DEFAULT_FOLDING))
+    
+    recursive = options.get("recursive", True)
+    built_snapshot = snapshot_dataset(dataset_dir, recursive)
+    rebuild(force)
+    
+    logger.info("Watching %s (interval: %ss, settle: %ss, Ctrl+C to stop)", dataset_dir, interval, settle)
+    pending_snapshot = built_snapshot
+    changed_at = time.monotonic()
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot_dataset(dataset_dir, recursive)
+            if current == built_snapshot:
+                pending_snapshot = current
+                continue
+            if current != pending_snapshot:
+                # 変更を検出したら、変更が止まるまで待つ
+                pending_snapshot = current
+                changed_at = time.monotonic()
+                continue
+            if time.monotonic() - changed_at < settle:
+                continue
+            
+            changed = {name for name in set(current) | set(built_snapshot) if current.get(name) != built_snapshot.get(name)}
+            logger.info("Detected changes: %s", ', '.join(sorted(os.path.relpath(path, dataset_dir) for path in changed)))
+            built_snapshot = current
+            rebuild()
+            logger.info("Watching %s ...", dataset_dir)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
 
 
 if __name__ == "__main__":
     # コマンドライン引数からディレクトリを取得（オプション）
-    dataset_dir = None
-    output_dir = None
+    parser = argparse.ArgumentParser(description="SVG+CSV → JSON 変換パイプライン")
+    parser.add_argument("dataset_dir", nargs="?", default=None,
+                        help=f"データセットディレクトリ（デフォルト: {DEFAULT_DATASET_DIR}）")
+    parser.add_argument("output_dir", nargs="?", default=None,
+                        help=f"出力ディレクトリ（デフォルト: {DEFAULT_OUTPUT_DIR}）")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="json",
+                        help="出力形式（json: 名前ごとに1ファイル、jsonl: サイズでローテーションするシャード、npy: 学習用の列指向形式、sqlite: SQLiteデータベース）")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_BYTES // (1024 * 1024),
+                        help="jsonl形式のシャード1ファイルあたりの上限サイズ（MB）")
+    parser.add_argument("--background-write", action="store_true",
+                        help="書き込みを別スレッドで行い、次のファイルの解析と並行させる")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="--background-write時に書き込み待ちにできるレコード数の上限")
+    parser.add_argument("--force-write", action="store_true",
+                        help="json形式で、内容が変わっていないファイルも書き直す")
+    parser.add_argument("--no-prune", dest="prune", action="store_false",
+                        help="json/sqlite形式で、入力からなくなった名前の古い出力を削除しない")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="解析の並列プロセス数（1: 逐次処理、0: CPU数）")
+    parser.add_argument("--force", action="store_true",
+                        help="json/sqlite形式で、入力が変わっていないペアも含めて全ペアを処理し直す")
+    parser.add_argument("--quiet", "-q", action="store_true",
+                        help="ファイルごとのメッセージを表示せず、処理結果の要約とエラーだけを表示する")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="繰り返される警告（SVGにないidなど）も1件ずつ表示する")
+    parser.add_argument("--log-file", default=None,
+                        help="すべてのログをJSON Lines形式で追記するファイル")
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="データセットディレクトリ直下のSVG/CSVだけを処理する")
+    parser.add_argument("--tag-subdirs", action="store_true",
+                        help="各レコードにデータセットディレクトリからの相対ディレクトリを \"subset\" として記録する（例: 縦書き）")
+    parser.add_argument("--metrics-out", default=None,
+                        help="ステージごとの処理時間・件数のレポートを書き出すJSONファイル")
+    parser.add_argument("--resume", action="store_true",
+                        help="json/sqlite形式で、中断した実行で完了したペアを処理せずに続きから再開する")
+    parser.add_argument("--file-timeout", type=float, default=None,
+                        help="1ペアの解析の制限時間（秒）。超えたペアは打ち切ってrejectsレポートに記録し、残りの処理を続ける")
+    parser.add_argument("--max-memory", type=int, default=None,
+                        help="解析するワーカープロセスのメモリ上限（MB、Unix系のみ）。超えたペアは打ち切る")
+    parser.add_argument("--rejects-out", default=None,
+                        help=f"打ち切ったペアのレポートの出力先（デフォルト: <出力ディレクトリ>/{REJECTS_FILENAME}）")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N",
+                        help="file_idのハッシュでN分割したうちi番目（1始まり）のペアだけを <出力ディレクトリ>/shard-<i>-of-<N>/ に出力する（複数マシンでの分散実行用）")
+    parser.add_argument("--profile", nargs="?", const=DEFAULT_PROFILE_PREFIX, default=None, metavar="PREFIX",
+                        help=f"実行全体をプロファイルし、<PREFIX>.pstats と <PREFIX>.collapsed.txt（フレームグラフ用）を書き出す（デフォルト: {DEFAULT_PROFILE_PREFIX}）")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default="cprofile",
+                        help="--profileの方式（cprofile: cProfile、sample: スタックのサンプリング）")
+    parser.add_argument("--profile-top", type=int, default=0, metavar="N",
+                        help="累積時間の上位N件の関数を表示する（--profileを省略した場合も有効にする）")
+    parser.add_argument("--fold", choices=FOLDINGS, default=DEFAULT_FOLDING,
+                        help="文字ペアのpair_key・モデルのキーの文字の正規化（--shard の部分集計と --watch の集計に使う）")
+    parser.add_argument("--watch", action="store_true",
+                        help="データセットを監視し、変更されたペアの処理・文字ペアの集計・Phase1モデルの更新を繰り返す")
+    parser.add_argument("--interval", type=float, default=DEFAULT_WATCH_INTERVAL,
+                        help="--watch時にデータセットを確認する間隔（秒）")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="--watch時に変更が止まってから処理を始めるまでの待ち時間（秒）")
+    parser.add_argument("--pairs-csv", default=DEFAULT_PAIRS_CSV,
+                        help=f"--watch時のsqlite形式の集計結果のCSV（デフォルト: {DEFAULT_PAIRS_CSV}）")
+    parser.add_argument("--partition-dir", default=DEFAULT_PARTITION_DIR,
+                        help=f"--watch時のjson形式のフォントごとの集計結果のディレクトリ（デフォルト: {DEFAULT_PARTITION_DIR}）")
+    parser.add_argument("--model-out", default=DEFAULT_MODEL_PATH,
+                        help=f"--watch時のPhase1モデルの出力先（デフォルト: {DEFAULT_MODEL_PATH}）")
+    args = parser.parse_args()
+    setup_logging(args.quiet, args.verbose, args.log_file)
     
-    if len(sys.argv) > 1:
-        dataset_dir = sys.argv[1]
-    if len(sys.argv) > 2:
-        output_dir = sys.argv[2]
+    if args.watch and args.shard:
+        parser.error("--watch cannot be combined with --shard")
+    if args.profile_top and args.profile is None:
+        args.profile = DEFAULT_PROFILE_PREFIX
+    if args.profile and args.jobs != 1:
+        logger.warning("Warning: --profile profiles only this process (analysis in worker processes is not included)")
+    profiling = profile_run(args.profile, args.profile_mode, args.profile_top)
     
-    main(dataset_dir, output_dir)
-
+    if args.watch:
+        with profiling:
+            watch(args.dataset_dir, args.output_dir, args.output_format, args.interval, args.settle,
+                  args.pairs_csv, args.model_out, args.partition_dir, shard_bytes=args.shard_size * 1024 * 1024,
+                  background_write=args.background_write, queue_size=args.queue_size,
+                  force_write=args.force_write, prune=args.prune, jobs=args.jobs, force=args.force,
+                  metrics_out=args.metrics_out, recursive=args.recursive, tag_subdirs=args.tag_subdirs,
+                  resume=args.resume, file_timeout=args.file_timeout, max_memory_mb=args.max_memory,
+                  rejects_out=args.rejects_out, folding=args.fold)
+    else:
+        with profiling:
+            main(args.dataset_dir, args.output_dir, args.output_format, args.shard_size * 1024 * 1024,
+                 args.background_write, args.queue_size, args.force_write, args.prune, args.jobs,
+                 args.force, args.metrics_out, args.recursive, args.tag_subdirs, args.resume,
+                 args.file_timeout, args.max_memory, args.rejects_out, args.shard, args.fold)
@@ -25,14 +25,21 @@ Phase1 カーニングモデル生成スクリプト
   "Mincho": { ... },
   ...
 }
+
+ペアのキーの文字は、デフォルトでNFKCにより正規化する（"Ｋ|Ａ" も "K|A" に集計される、--fold none で無効）
 """
 
+import argparse
 import csv
 import json
-from collections import defaultdict
+import os
+import sqlite3
 from pathlib import Path
 from typing import Dict, Any, Optional
 
+from columnar_utils import SCHEMA_FILENAME
+from pair_keys import DEFAULT_FOLDING, FOLDINGS, PairKeyCodec
+
 # ============================================
 # 設定定数
 # ============================================
@@ -120,124 +127,148 @@ def should_skip_row(row: Dict[str, str]) -> tuple[bool, str]:
 # メイン処理
 # ============================================
 
-def build_phase1_model(csv_path: str, output_json_path: str) -> Dict[str, Any]:
+class ModelStats(dict):
     """
-    CSVからPhase1モデルJSONを生成する
+    集計用のデータ構造（ペアのキー → 合計と件数）
     
-    Args:
-        csv_path: 入力CSVファイルのパス
-        output_json_path: 出力JSONファイルのパス
+    キーは pair_keys.PairKeyCodec の整数のタプル (font_id, left_cp, right_cp) で、
+    文字は codec の方式で正規化される（全角・半角のペアは同じキーにまとまる）
     
-    Returns:
-        生成されたモデル辞書
+    stats[key] = {
+        "sum_gap_norm": float,  # 平均文字幅で正規化した値
+        "sum_gap_norm_left": float,  # 後方互換性のため保持
+        "sum_gap_norm_right": float,  # 後方互換性のため保持
+        "sum_gap_actual": float,
+        "sum_font_size_est": float,  # 推定フォントサイズの合計（案1用）
+        "count": int
+    }
     """
-    # 集計用のデータ構造
-    # stats[font_key][pair_key] = {
-    #     "sum_gap_norm": float,  # 平均文字幅で正規化した値
-    #     "sum_gap_norm_left": float,  # 後方互換性のため保持
-    #     "sum_gap_norm_right": float,  # 後方互換性のため保持
-    #     "sum_gap_actual": float,
-    #     "sum_font_size_est": float,  # 推定フォントサイズの合計（案1用）
-    #     "count": int
-    # }
-    stats: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(
-        lambda: defaultdict(lambda: {
+    
+    def __init__(self, folding: str = DEFAULT_FOLDING):
+        super().__init__()
+        self.codec = PairKeyCodec(folding)
+    
+    def __missing__(self, key):
+        pair_stats = self[key] = {
             "sum_gap_norm": 0.0,
             "sum_gap_norm_left": 0.0,
             "sum_gap_norm_right": 0.0,
             "sum_gap_actual": 0.0,
             "sum_font_size_est": 0.0,
             "count": 0
-        })
-    )
+        }
+        return pair_stats
+
+
+def new_stats(folding: str = DEFAULT_FOLDING) -> ModelStats:
+    """
+    集計用のデータ構造を生成
     
-    # CSV読み込み
-    csv_file_path = Path(csv_path)
-    if not csv_file_path.exists():
-        raise FileNotFoundError(f"CSVファイルが見つかりません: {csv_path}")
+    Args:
+        folding: ペアのキーの文字の正規化の方式（pair_keys.FOLDINGS）
+    """
+    return ModelStats(folding)
+
+
+def accumulate_row(stats: ModelStats, row: Dict[str, Any]) -> tuple[bool, str]:
+    """
+    1行（文字ペアレコード）をスキップ判定し、スキップしない場合は集計に追加する
     
-    print(f"CSVファイルを読み込み中: {csv_path}")
+    CSVから読んだ文字列の行と、aggregate_pairs.iter_sample_pair_records() の
+    数値のままのレコードのどちらも受け付ける
     
-    skipped_count = 0
-    processed_count = 0
+    Args:
+        stats: new_stats()の形式の集計結果
+        row: 文字ペアレコード
     
-    with open(csv_file_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        
-        for row_num, row in enumerate(reader, start=2):  # ヘッダー行を除いて2行目から
-            # スキップ判定
-            skip, reason = should_skip_row(row)
-            if skip:
-                skipped_count += 1
-                if skipped_count <= 10:  # 最初の10件だけ警告を表示
-                    print(f"  警告: 行 {row_num} をスキップしました: {reason}")
-                continue
-            
-            # データを取得
-            font_key = row["left_font"].strip()
-            left_char = row["left_char"].strip()
-            right_char = row["right_char"].strip()
-            pair_key = f"{left_char}|{right_char}"
-            
-            gap_norm = parse_float(row.get("gap_norm"))  # 平均文字幅で正規化した値（推奨）
-            gap_norm_left = parse_float(row.get("gap_norm_left"))  # 後方互換性のため
-            gap_norm_right = parse_float(row.get("gap_norm_right"))  # 後方互換性のため
-            gap_actual = parse_float(row.get("gap_actual"), 0.0)
-            font_size_est = parse_float(row.get("font_size_est"))  # 推定フォントサイズ（案1用）
-            
-            # 集計に追加
-            if gap_norm is not None:
-                stats[font_key][pair_key]["sum_gap_norm"] += gap_norm
-            if gap_norm_left is not None:
-                stats[font_key][pair_key]["sum_gap_norm_left"] += gap_norm_left
-            if gap_norm_right is not None:
-                stats[font_key][pair_key]["sum_gap_norm_right"] += gap_norm_right
-            stats[font_key][pair_key]["sum_gap_actual"] += gap_actual
-            if font_size_est is not None:
-                stats[font_key][pair_key]["sum_font_size_est"] += font_size_est
-            stats[font_key][pair_key]["count"] += 1
-            
-            processed_count += 1
+    Returns:
+        (skip: bool, reason: str)
+    """
+    skip, reason = should_skip_row(row)
+    if skip:
+        return skip, reason
     
-    print(f"処理完了: {processed_count} 件のレコードを処理しました")
-    if skipped_count > 10:
-        print(f"  （その他 {skipped_count - 10} 件のレコードをスキップしました）")
-    elif skipped_count > 0:
-        print(f"  （{skipped_count} 件のレコードをスキップしました）")
+    # データを取得（キーは (font_id, left_cp, right_cp) の整数のタプル）
+    key = stats.codec.pack(row["left_font"].strip(), row["left_char"].strip(), row["right_char"].strip())
+    
+    gap_norm = parse_float(row.get("gap_norm"))  # 平均文字幅で正規化した値（推奨）
+    gap_norm_left = parse_float(row.get("gap_norm_left"))  # 後方互換性のため
+    gap_norm_right = parse_float(row.get("gap_norm_right"))  # 後方互換性のため
+    gap_actual = parse_float(row.get("gap_actual"), 0.0)
+    font_size_est = parse_float(row.get("font_size_est"))  # 推定フォントサイズ（案1用）
+    
+    # 集計に追加
+    pair_stats = stats[key]
+    if gap_norm is not None:
+        pair_stats["sum_gap_norm"] += gap_norm
+    if gap_norm_left is not None:
+        pair_stats["sum_gap_norm_left"] += gap_norm_left
+    if gap_norm_right is not None:
+        pair_stats["sum_gap_norm_right"] += gap_norm_right
+    pair_stats["sum_gap_actual"] += gap_actual
+    if font_size_est is not None:
+        pair_stats["sum_font_size_est"] += font_size_est
+    pair_stats["count"] += 1
+    
+    return False, ""
+
+
+def finalize_model(stats: ModelStats) -> Dict[str, Any]:
+    """
+    集計結果（合計と件数）から平均を計算してモデル辞書を組み立てる
+    
+    整数のキーは、ここでキーごとに1回だけフォント名と "左|右" の文字列に戻す
     
-    # 最終的なJSON形式を組み立て
+    Args:
+        stats: new_stats()の形式の集計結果
+    
+    Returns:
+        モデル辞書 {font_key: {pair_key: {...}}}
+    """
     result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    codec = stats.codec
     
-    for font_key, pairs_dict in stats.items():
-        result[font_key] = {}
+    for key, data in stats.items():
+        font_pairs = result.setdefault(codec.fonts.values[key[0]], {})
+        count = data["count"]
         
-        for pair_key, data in pairs_dict.items():
-            count = data["count"]
-            
-            # MIN_COUNT より小さい場合はスキップ
-            if count < MIN_COUNT:
-                continue
-            
-            # 平均を計算
-            gap_norm_avg = data["sum_gap_norm"] / count if data["sum_gap_norm"] > 0 else None
-            gap_norm_left_avg = data["sum_gap_norm_left"] / count if data["sum_gap_norm_left"] > 0 else None
-            gap_norm_right_avg = data["sum_gap_norm_right"] / count if data["sum_gap_norm_right"] > 0 else None
-            gap_actual_avg = data["sum_gap_actual"] / count
-            font_size_avg = data["sum_font_size_est"] / count if data["sum_font_size_est"] > 0 else None
-            
-            result[font_key][pair_key] = {
-                "gap_norm_avg": gap_norm_avg,  # 平均文字幅で正規化（推奨）
-                "gap_norm_left_avg": gap_norm_left_avg,  # 後方互換性のため保持
-                "gap_norm_right_avg": gap_norm_right_avg,  # 後方互換性のため保持
-                "gap_actual_avg": gap_actual_avg,
-                "font_size_avg": font_size_avg,  # 学習時の平均フォントサイズ（案1用）
-                "count": count
-            }
-    
-    # JSONファイルに書き出し
+        # MIN_COUNT より小さい場合はスキップ
+        if count < MIN_COUNT:
+            continue
+        
+        # 平均を計算
+        gap_norm_avg = data["sum_gap_norm"] / count if data["sum_gap_norm"] > 0 else None
+        gap_norm_left_avg = data["sum_gap_norm_left"] / count if data["sum_gap_norm_left"] > 0 else None
+        gap_norm_right_avg = data["sum_gap_norm_right"] / count if data["sum_gap_norm_right"] > 0 else None
+        gap_actual_avg = data["sum_gap_actual"] / count
+        font_size_avg = data["sum_font_size_est"] / count if data["sum_font_size_est"] > 0 else None
+        
+        font_pairs[codec.pair_text(key)] = {
+            "gap_norm_avg": gap_norm_avg,  # 平均文字幅で正規化（推奨）
+            "gap_norm_left_avg": gap_norm_left_avg,  # 後方互換性のため保持
+            "gap_norm_right_avg": gap_norm_right_avg,  # 後方互換性のため保持
+            "gap_actual_avg": gap_actual_avg,
+            "font_size_avg": font_size_avg,  # 学習時の平均フォントサイズ（案1用）
+            "count": count
+        }
+    
+    return result
+
+
+def write_model_json(result: Dict[str, Any], output_json_path: str):
+    """
+    モデル辞書をJSONファイルに書き出し、統計情報を表示する
+    
+    Args:
+        result: finalize_model()で組み立てたモデル辞書
+        output_json_path: 出力JSONファイルのパス
+    """
+    # 一時ファイルに書いてから置き換える（読み込み側が書き込み途中のファイルを読まないように）
     output_path = Path(output_json_path)
-    with open(output_path, 'w', encoding='utf-8') as f:
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
     
     print(f"✅ Phase1モデルを生成しました: {output_json_path}")
     
@@ -247,6 +278,199 @@ def build_phase1_model(csv_path: str, output_json_path: str) -> Dict[str, Any]:
     for font_key, pairs_dict in sorted(result.items()):
         print(f"  {font_key}: {len(pairs_dict)} ペア")
     print(f"  合計: {total_pairs} ペア")
+
+
+def build_phase1_model(csv_path: str, output_json_path: str, folding: str = DEFAULT_FOLDING) -> Dict[str, Any]:
+    """
+    CSVからPhase1モデルJSONを生成する
+    
+    Args:
+        csv_path: 入力CSVファイルのパス（フォントごとのCSVのディレクトリも可）
+        output_json_path: 出力JSONファイルのパス
+        folding: ペアのキーの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        生成されたモデル辞書
+    """
+    # 集計用のデータ構造
+    stats = new_stats(folding)
+    
+    # CSV読み込み（ディレクトリの場合は、その中のCSV（aggregate_pairs.py --partition-dir の出力）をファイル名順に読む）
+    csv_file_path = Path(csv_path)
+    if not csv_file_path.exists():
+        raise FileNotFoundError(f"CSVファイルが見つかりません: {csv_path}")
+    csv_files = sorted(csv_file_path.glob("*.csv")) if csv_file_path.is_dir() else [csv_file_path]
+    
+    skipped_count = 0
+    processed_count = 0
+    
+    for csv_file in csv_files:
+        print(f"CSVファイルを読み込み中: {csv_file}")
+        with open(csv_file, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            
+            for row_num, row in enumerate(reader, start=2):  # ヘッダー行を除いて2行目から
+                # スキップ判定・集計に追加
+                skip, reason = accumulate_row(stats, row)
+                if skip:
+                    skipped_count += 1
+                    if skipped_count <= 10:  # 最初の10件だけ警告を表示
+                        print(f"  警告: 行 {row_num} をスキップしました: {reason}")
+                    continue
+                
+                processed_count += 1
+    
+    print(f"処理完了: {processed_count} 件のレコードを処理しました")
+    if skipped_count > 10:
+        print(f"  （その他 {skipped_count - 10} 件のレコードをスキップしました）")
+    elif skipped_count > 0:
+        print(f"  （{skipped_count} 件のレコードをスキップしました）")
+    
+    # 最終的なJSON形式を組み立ててJSONファイルに書き出し
+    result = finalize_model(stats)
+    write_model_json(result, output_json_path)
+    
+    return result
+
+
+# SQLiteデータベースからフォント・ペアごとの合計と件数を求めるクエリ
+# should_skip_row と同じ条件（フォント・文字が空でなく、gap_normが範囲内）で絞り込む
+SQLITE_MODEL_QUERY = """
+SELECT
+    font, left_char, right_char,
+    SUM(gap_norm), SUM(gap_norm_left), SUM(gap_norm_right),
+    SUM(COALESCE(gap_actual, 0.0)), SUM(font_size_est), COUNT(*)
+FROM (
+    SELECT
+        TRIM(p.font) AS font, TRIM(p.left_char) AS left_char, TRIM(p.right_char) AS right_char,
+        p.gap_actual,
+        p.gap_actual / ((l.width + r.width) / 2.0) AS gap_norm,
+        CASE WHEN l.width != 0 THEN p.gap_actual / l.width END AS gap_norm_left,
+        CASE WHEN r.width != 0 THEN p.gap_actual / r.width END AS gap_norm_right,
+        ((l.height + r.height) / 2.0) / 0.85 AS font_size_est
+    FROM pairs p
+    JOIN glyphs l ON l.id = p.left_glyph
+    JOIN glyphs r ON r.id = p.right_glyph
+    WHERE l.width + r.width != 0
+)
+WHERE font != '' AND left_char != '' AND right_char != ''
+  AND gap_norm BETWEEN ? AND ?
+GROUP BY font, left_char, right_char
+"""
+
+
+def build_phase1_model_from_sqlite(db_path: str, output_json_path: str,
+                                   folding: str = DEFAULT_FOLDING) -> Dict[str, Any]:
+    """
+    SQLiteデータベース（batch_process.py --format sqlite の出力）からPhase1モデルJSONを生成する
+    
+    pairs_aggregated.csv を経由せず、フォント・ペアごとの集計をSQLのGROUP BYで行う
+    
+    Args:
+        db_path: SQLiteデータベースのパス
+        output_json_path: 出力JSONファイルのパス
+        folding: ペアのキーの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        生成されたモデル辞書
+    """
+    if not Path(db_path).exists():
+        raise FileNotFoundError(f"SQLiteデータベースが見つかりません: {db_path}")
+    
+    print(f"SQLiteデータベースを集計中: {db_path}")
+    
+    stats = new_stats(folding)
+    processed_count = 0
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(SQLITE_MODEL_QUERY, (MIN_GAPNORM, MAX_GAPNORM))
+        for font_key, left_char, right_char, sum_gap_norm, sum_left, sum_right, sum_actual, sum_size, count in rows:
+            # 正規化すると同じキーになるグループ（全角と半角など）は合計を足し合わせる
+            pair_stats = stats[stats.codec.pack(font_key, left_char, right_char)]
+            pair_stats["sum_gap_norm"] += sum_gap_norm or 0.0
+            pair_stats["sum_gap_norm_left"] += sum_left or 0.0
+            pair_stats["sum_gap_norm_right"] += sum_right or 0.0
+            pair_stats["sum_gap_actual"] += sum_actual or 0.0
+            pair_stats["sum_font_size_est"] += sum_size or 0.0
+            pair_stats["count"] += count
+            processed_count += count
+    finally:
+        conn.close()
+    
+    print(f"処理完了: {processed_count} 件のレコードを処理しました")
+    
+    result = finalize_model(stats)
+    write_model_json(result, output_json_path)
+    
+    return result
+
+
+def build_phase1_model_from_columnar(input_dir: str, output_json_path: str,
+                                     folding: str = DEFAULT_FOLDING) -> Dict[str, Any]:
+    """
+    列指向のペア表（aggregate_pairs.py --columnar-out の出力）からPhase1モデルJSONを生成する
+    
+    CSVの文字列を解析する代わりに、.npyの列（NumPyがあればメモリマップ）と辞書を読み込む。
+    スキップの判定と集計はCSVの場合と同じ（accumulate_row）だが、値はfloat32のため
+    CSVから生成した場合と平均値の下位の桁が異なることがある
+    
+    Args:
+        input_dir: ペア表のディレクトリ
+        output_json_path: 出力JSONファイルのパス
+        folding: ペアのキーの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        生成されたモデル辞書
+    """
+    from aggregate_pairs import load_pair_table
+    
+    if not Path(input_dir, SCHEMA_FILENAME).exists():
+        raise FileNotFoundError(f"列指向のペア表が見つかりません: {input_dir}")
+    
+    print(f"列指向のペア表を読み込み中: {input_dir}")
+    
+    table = load_pair_table(input_dir)
+    columns = table["columns"]
+    dictionaries = table["dictionaries"]
+    fonts = dictionaries["fonts"]
+    chars = dictionaries["chars"]
+    
+    def floats(name: str) -> list:
+        # NaN（値なし）はNoneにする
+        return [value if value == value else None for value in columns[name].tolist()]
+    
+    stats = new_stats(folding)
+    skipped_count = 0
+    processed_count = 0
+    
+    rows = zip(
+        columns["left_font"].tolist(), columns["left_char"].tolist(), columns["right_char"].tolist(),
+        floats("gap_norm"), floats("gap_norm_left"), floats("gap_norm_right"),
+        floats("gap_actual"), floats("font_size_est"),
+    )
+    for left_font, left_char, right_char, gap_norm, gap_norm_left, gap_norm_right, gap_actual, font_size_est in rows:
+        skip, _ = accumulate_row(stats, {
+            "left_font": fonts[left_font],
+            "left_char": chars[left_char],
+            "right_char": chars[right_char],
+            "gap_norm": gap_norm,
+            "gap_norm_left": gap_norm_left,
+            "gap_norm_right": gap_norm_right,
+            "gap_actual": gap_actual,
+            "font_size_est": font_size_est,
+        })
+        if skip:
+            skipped_count += 1
+        else:
+            processed_count += 1
+    
+    print(f"処理完了: {processed_count} 件のレコードを処理しました")
+    if skipped_count > 0:
+        print(f"  （{skipped_count} 件のレコードをスキップしました）")
+    
+    result = finalize_model(stats)
+    write_model_json(result, output_json_path)
     
     return result
 
@@ -256,16 +480,37 @@ def build_phase1_model(csv_path: str, output_json_path: str) -> Dict[str, Any]:
 # ============================================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phase1 カーニングモデル生成スクリプト")
+    parser.add_argument("--csv", dest="csv_path", default=CSV_PATH, help=f"入力CSV（デフォルト: {CSV_PATH}）")
+    parser.add_argument("--output", default=OUTPUT_JSON_PATH, help=f"出力JSON（デフォルト: {OUTPUT_JSON_PATH}）")
+    parser.add_argument("--sqlite", dest="sqlite_path", default=None,
+                        help="CSVの代わりに集計するSQLiteデータベース（batch_process.py --format sqlite の出力）")
+    parser.add_argument("--fold", choices=FOLDINGS, default=DEFAULT_FOLDING,
+                        help=f"ペアのキーの文字の正規化（nfkc: 全角・半角などをまとめる、none: しない、デフォルト: {DEFAULT_FOLDING}）")
+    parser.add_argument("--columnar", dest="columnar_dir", default=None,
+                        help="CSVの代わりに集計する列指向のペア表（aggregate_pairs.py --columnar-out の出力）")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Phase1 カーニングモデル生成スクリプト")
     print("=" * 60)
-    print(f"入力CSV: {CSV_PATH}")
-    print(f"出力JSON: {OUTPUT_JSON_PATH}")
-    print(f"フィルタ設定: MIN_GAPNORM={MIN_GAPNORM}, MAX_GAPNORM={MAX_GAPNORM}, MIN_COUNT={MIN_COUNT}")
+    if args.sqlite_path:
+        print(f"入力SQLite: {args.sqlite_path}")
+    elif args.columnar_dir:
+        print(f"入力ペア表: {args.columnar_dir}")
+    else:
+        print(f"入力CSV: {args.csv_path}")
+    print(f"出力JSON: {args.output}")
+    print(f"フィルタ設定: MIN_GAPNORM={MIN_GAPNORM}, MAX_GAPNORM={MAX_GAPNORM}, MIN_COUNT={MIN_COUNT}, FOLD={args.fold}")
     print("-" * 60)
     
     try:
-        model = build_phase1_model(CSV_PATH, OUTPUT_JSON_PATH)
+        if args.sqlite_path:
+            model = build_phase1_model_from_sqlite(args.sqlite_path, args.output, args.fold)
+        elif args.columnar_dir:
+            model = build_phase1_model_from_columnar(args.columnar_dir, args.output, args.fold)
+        else:
+            model = build_phase1_model(args.csv_path, args.output, args.fold)
         print("\n✅ 処理が正常に完了しました")
     except FileNotFoundError as e:
         print(f"\n❌ エラー: {e}")
@@ -275,4 +520,3 @@ if __name__ == "__main__":
         import traceback
         traceback.print_exc()
         exit(1)
-
@@ -0,0 +1,193 @@
+"""
+列指向（カラムナ）データ関連のユーティリティ関数
+NumPyの.npy形式で1列1ファイルを読み書きし、文字列を辞書で整数コードに変換する
+
+書き込みは標準ライブラリ（array）のみで行い、読み込みはNumPyがあれば
+np.load(mmap_mode='r') でメモリマップし、なければarrayに読み込む
+"""
+
+import ast
+import json
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List, Optional
+
+
+# dtype名 → (arrayのtypecode, .npyのdescr)
+COLUMN_DTYPES = {
+    "float32": ("f", "<f4"),
+    "int32": ("i", "<i4"),
+}
+
+NPY_MAGIC = b"\x93NUMPY"
+
+# スキーマのファイル名
+SCHEMA_FILENAME = "schema.json"
+
+
+def new_column(dtype: str) -> array:
+    """
+    指定したdtypeの空の列を返す
+    
+    Args:
+        dtype: "float32" または "int32"
+    
+    Returns:
+        空のarray
+    """
+    typecode, _ = COLUMN_DTYPES[dtype]
+    column = array(typecode)
+    if column.itemsize != 4:
+        raise RuntimeError(f"array('{typecode}') is not 4 bytes on this platform")
+    return column
+
+
+def column_filename(table: str, column: str) -> str:
+    """
+    列のファイル名を返す（例: "pairs.gap_actual.npy"）
+    """
+    return f"{table}.{column}.npy"
+
+
+def write_npy(path: str, column: array, dtype: str):
+    """
+    1次元の列を.npy形式（バージョン1.0、リトルエンディアン）で書き出す
+    
+    Args:
+        path: 出力先のパス
+        column: new_columnで作成した列
+        dtype: "float32" または "int32"
+    """
+    _, descr = COLUMN_DTYPES[dtype]
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, len(column))
+    # マジック(6) + バージョン(2) + ヘッダ長(2) + ヘッダ + 改行 を64バイト境界に揃える
+    padding = 64 - (10 + len(header) + 1) % 64
+    header = header + " " * (padding % 64) + "\n"
+    
+    data = column
+    if sys.byteorder == "big":
+        data = array(column.typecode, column)
+        data.byteswap()
+    
+    with open(path, "wb") as f:
+        f.write(NPY_MAGIC + bytes([1, 0]))
+        f.write(struct.pack("<H", len(header)))
+        f.write(header.encode("latin1"))
+        data.tofile(f)
+
+
+def read_npy(path: str, mmap: bool = True):
+    """
+    .npyファイルを読み込む
+    
+    NumPyが利用可能な場合は np.load（mmap=Trueならmmap_mode='r'）を使用し、
+    利用できない場合はwrite_npyで書いた形式（1次元・リトルエンディアン）をarrayとして読み込む
+    
+    Args:
+        path: .npyファイルのパス
+        mmap: NumPy使用時にメモリマップで開く場合True
+    
+    Returns:
+        numpy.ndarray または array
+    """
+    try:
+        import numpy as np
+        return np.load(path, mmap_mode="r" if mmap else None)
+    except ImportError:
+        pass
+    
+    with open(path, "rb") as f:
+        if f.read(6) != NPY_MAGIC:
+            raise ValueError(f"Not a .npy file: {path}")
+        major, _ = f.read(2)
+        if major == 1:
+            (header_len,) = struct.unpack("<H", f.read(2))
+        else:
+            (header_len,) = struct.unpack("<I", f.read(4))
+        header = ast.literal_eval(f.read(header_len).decode("latin1"))
+        typecodes = {descr: typecode for typecode, descr in COLUMN_DTYPES.values()}
+        if header["descr"] not in typecodes or len(header["shape"]) != 1:
+            raise ValueError(f"Unsupported .npy layout in {path}: {header}")
+        column = array(typecodes[header["descr"]])
+        column.frombytes(f.read())
+        if sys.byteorder == "big":
+            column.byteswap()
+        return column
+
+
+class DictionaryEncoder:
+    """
+    文字列を出現順の整数コードに変換する辞書
+    
+    使い方:
+        fonts = DictionaryEncoder()
+        code = fonts.encode("Mincho")  # 0
+        fonts.values  # ["Mincho"]
+    """
+    
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        for value in values or []:
+            self.encode(value)
+    
+    def encode(self, value: str) -> int:
+        """
+        文字列のコードを返す（未登録なら末尾に追加）
+        """
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+    
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def write_schema(output_dir: str, schema: Dict[str, Any]):
+    """
+    スキーマ（テーブル・列・dtype・辞書）をschema.jsonに書き出す
+    
+    列ファイルをすべて書いた後に呼び、一時ファイルからのリネームで置き換える
+    
+    Args:
+        output_dir: 出力ディレクトリ
+        schema: スキーマ辞書
+    """
+    schema_path = os.path.join(output_dir, SCHEMA_FILENAME)
+    tmp_path = schema_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, schema_path)
+
+
+def load_columns(input_dir: str, mmap: bool = True) -> Dict[str, Any]:
+    """
+    schema.jsonと列ファイルを読み込む
+    
+    Args:
+        input_dir: 列ファイルとschema.jsonがあるディレクトリ
+        mmap: NumPy使用時にメモリマップで開く場合True
+    
+    Returns:
+        {"schema": dict, "tables": {table: {column: 列}}, "dictionaries": {name: [str]}}
+    """
+    with open(os.path.join(input_dir, SCHEMA_FILENAME), "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    
+    tables = {}
+    for table, table_schema in schema["tables"].items():
+        tables[table] = {
+            column: read_npy(os.path.join(input_dir, column_filename(table, column)), mmap=mmap)
+            for column in table_schema["columns"]
+        }
+    
+    return {
+        "schema": schema,
+        "tables": tables,
+        "dictionaries": schema.get("dictionaries", {}),
+    }
@@ -4,8 +4,10 @@ UTF-8でエンコードされたCSVファイルを読み込む（Shift-JISにも
 """
 
 import csv
+import logging
 from typing import List, Dict
-import sys
+
+logger = logging.getLogger(__name__)
 
 
 def load_csv(csv_path: str) -> List[Dict[str, str]]:
@@ -88,11 +90,11 @@ def load_csv(csv_path: str) -> List[Dict[str, str]]:
                             })
                     return results
             except Exception as e:
-                print(f"Error reading CSV {csv_path}: {e}", file=sys.stderr)
+                logger.error("Error reading CSV %s: %s", csv_path, e)
                 return []
     
     except Exception as e:
-        print(f"Error reading CSV {csv_path}: {e}", file=sys.stderr)
+        logger.error("Error reading CSV %s: %s", csv_path, e)
         return []
     
     return results
@@ -1,11 +1,189 @@
 """
 学習用JSON出力モジュール
 処理結果を学習用JSON形式で出力する
+
+出力形式:
+    json  - 名前ごとに1ファイル（indent=2、従来の形式）
+    jsonl - 1行1レコードのコンパクトなJSON Linesをサイズでローテーションするシャードファイル
+    npy   - 学習用の列指向形式（1列1つの.npyファイル + schema.json）
+    sqlite - サンプル・文字・ペアを正規化したSQLiteデータベース（dataset.sqlite）
 """
 
+import hashlib
 import json
+import logging
 import os
-from typing import Dict, List, Optional
+import queue
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from columnar_utils import (
+    DictionaryEncoder,
+    column_filename,
+    new_column,
+    write_npy,
+    write_schema
+)
+
+logger = logging.getLogger(__name__)
+
+
+# 出力形式
+OUTPUT_FORMATS = ("json", "jsonl", "npy", "sqlite")
+
+# JSONLシャード1ファイルあたりの上限サイズ（バイト）
+DEFAULT_SHARD_BYTES = 64 * 1024 * 1024
+
+# BackgroundWriterのキューに溜められるレコード数の上限
+DEFAULT_QUEUE_SIZE = 64
+
+# JsonFileWriterの出力索引（出力ファイル名 → ファイルID・内容のハッシュ）
+INDEX_FILENAME = ".export_index"
+
+# SqliteWriterのデータベースファイル名と、1トランザクションで書き込むサンプル数
+SQLITE_FILENAME = "dataset.sqlite"
+DEFAULT_SQLITE_BATCH = 1000
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    file_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    font TEXT NOT NULL,
+    UNIQUE (file_id, name)
+);
+CREATE TABLE IF NOT EXISTS glyphs (
+    id INTEGER PRIMARY KEY,
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    glyph_id TEXT NOT NULL,
+    seq_index INTEGER NOT NULL,
+    char TEXT NOT NULL,
+    min_x REAL, max_x REAL, min_y REAL, max_y REAL, width REAL, height REAL
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    sample_id INTEGER NOT NULL REFERENCES samples(id) ON DELETE CASCADE,
+    file_id TEXT NOT NULL,
+    font TEXT NOT NULL,
+    left_char TEXT NOT NULL,
+    right_char TEXT NOT NULL,
+    left_font TEXT NOT NULL,
+    right_font TEXT NOT NULL,
+    left_glyph INTEGER NOT NULL REFERENCES glyphs(id),
+    right_glyph INTEGER NOT NULL REFERENCES glyphs(id),
+    gap_actual REAL
+);
+CREATE INDEX IF NOT EXISTS idx_pairs_font_chars ON pairs (font, left_char, right_char);
+CREATE INDEX IF NOT EXISTS idx_pairs_file_id ON pairs (file_id);
+CREATE INDEX IF NOT EXISTS idx_samples_file_id ON samples (file_id);
+CREATE INDEX IF NOT EXISTS idx_glyphs_sample_id ON glyphs (sample_id);
+"""
+
+
+def build_record(
+    file_id: str,
+    font: Optional[str],
+    sequence: List[Dict[str, str]],
+    pairs: List[Dict[str, any]],
+    bbox: Dict[str, Dict[str, float]]
+) -> Dict[str, any]:
+    """
+    学習用JSONの1レコード（1名前分）を構築
+    
+    Args:
+        file_id: ファイルID（例: "13097882"）
+        font: フォント名（例: "Mincho"）
+        sequence: シーケンス情報 [{"id": str, "text": str}, ...]
+        pairs: ペア情報 [{"left_id": str, "left": str, "right_id": str, "right": str, "gap_actual": float}, ...]
+        bbox: bounding box情報 {"id": {"min_x": float, ...}, ...}
+    
+    Returns:
+        {"file": str, "font": str, "sequence": [...], "pairs": [...], "bbox": {...}}
+    """
+    return {
+        "file": file_id,
+        "font": font or "Unknown",
+        "sequence": sequence,
+        "pairs": pairs,
+        "bbox": bbox
+    }
+
+
+def serialize_record(record: Dict[str, any]) -> str:
+    """
+    レコードを名前ごとのJSONファイルと同じ形式（indent=2）の文字列にする
+    
+    Args:
+        record: build_recordで構築したレコード
+    
+    Returns:
+        JSON文字列
+    """
+    return json.dumps(record, ensure_ascii=False, indent=2)
+
+
+def content_hash(content: str) -> str:
+    """
+    出力内容のハッシュ（SHA-256の16進文字列）を返す
+    """
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def file_hash(path: str) -> Optional[str]:
+    """
+    既存ファイルの内容のハッシュを返す（ファイルがない場合はNone）
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def fsync_path(path: str):
+    """
+    ファイルまたはディレクトリの内容をディスクまで書き出す
+    
+    ディレクトリのfsync（リネームを確定させる）に対応しないOS（Windows）では何もしない
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        if os.path.isdir(path):
+            return
+        raise
+    try:
+        os.fsync(fd)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+    finally:
+        os.close(fd)
+
+
+def write_atomic(output_path: str, content: str):
+    """
+    一時ファイル（<output_path>.tmp）に書き込んでからリネームで置き換える
+    
+    中断しても書きかけのファイルが output_path に残らない（.json.tmp は aggregate_pairs の対象外）
+    
+    Args:
+        output_path: 出力先のパス
+        content: 書き込む内容
+    """
+    tmp_path = output_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
 def export_to_json(
@@ -14,7 +192,8 @@ def export_to_json(
     font: Optional[str],
     sequence: List[Dict[str, str]],
     pairs: List[Dict[str, any]],
-    bbox: Dict[str, Dict[str, float]]
+    bbox: Dict[str, Dict[str, float]],
+    skip_unchanged: bool = False
 ) -> bool:
     """
     学習用JSONファイルを出力
@@ -26,9 +205,10 @@ def export_to_json(
         sequence: シーケンス情報 [{"id": str, "text": str}, ...]
         pairs: ペア情報 [{"left_id": str, "left": str, "right_id": str, "right": str, "gap_actual": float}, ...]
         bbox: bounding box情報 {"id": {"min_x": float, ...}, ...}
+        skip_unchanged: Trueの場合、既存ファイルと内容のハッシュが同じなら書き込まない
     
     Returns:
-        成功した場合True、失敗した場合False
+        成功した場合（書き込みを省略した場合を含む）True、失敗した場合False
     """
     try:
         # 出力ディレクトリが存在しない場合は作成
@@ -37,21 +217,739 @@ def export_to_json(
             os.makedirs(output_dir, exist_ok=True)
         
         # JSONデータを構築
-        json_data = {
-            "file": file_id,
-            "font": font or "Unknown",
-            "sequence": sequence,
-            "pairs": pairs,
-            "bbox": bbox
-        }
+        json_data = build_record(file_id, font, sequence, pairs, bbox)
+        content = serialize_record(json_data)
+        
+        # 内容が変わっていなければ書き込まない（mtimeを保つ）
+        if skip_unchanged and file_hash(output_path) == content_hash(content):
+            return True
         
-        # JSONファイルに書き込み
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
+        # JSONファイルに書き込み（書きかけのファイルが見えないよう、一時ファイルからリネームする）
+        write_atomic(output_path, content)
         
         return True
     
     except Exception as e:
-        print(f"Error exporting JSON to {output_path}: {e}")
+        logger.error("Error exporting JSON to %s: %s", output_path, e)
         return False
 
+
+class JsonFileWriter:
+    """
+    名前ごとに1つのJSONファイルを出力するライター（従来の形式）
+    
+    出力ディレクトリの .export_index に、出力したファイルごとのファイルID・内容のハッシュ・
+    サイズ・mtimeを記録する。次回以降は内容のハッシュが同じファイルの書き込みを省略し
+    （skip_unchanged）、active_file_idsが指定されていれば、もう存在しない名前の出力を削除する。
+    
+    flush・close時に、それまでに書き出したファイルと出力ディレクトリをfsyncする
+    （flushの後でジャーナルに完了を記録すれば、OSが落ちても記録したペアのJSONは欠けない）。
+    
+    使い方:
+        with JsonFileWriter(output_dir, active_file_ids={"13097882", ...}) as writer:
+            writer.write(record, "13097882_山田")
+        writer.stats  # {"written": int, "skipped": int, "removed": int}
+    
+    打ち切ったペア（隔離したペア）は discard(file_id) で前回までの出力を削除する。
+    """
+    
+    def __init__(self, output_dir: str, skip_unchanged: bool = True, active_file_ids: Optional[Set[str]] = None):
+        """
+        Args:
+            output_dir: 出力ディレクトリ
+            skip_unchanged: 内容が同じファイルの書き込みを省略する場合True
+            active_file_ids: 今回の入力に存在するファイルIDの集合。
+                             指定した場合、close時に次の出力を削除する（Noneなら削除しない）
+                             - ファイルIDが入力から消えたもの
+                             - 今回出力したファイルIDのうち、今回出力しなかった名前のもの
+                             （処理に失敗したファイルIDの出力は残す）
+        """
+        self.output_dir = output_dir
+        self.skip_unchanged = skip_unchanged
+        self.active_file_ids = active_file_ids
+        self.stats = {"written": 0, "skipped": 0, "removed": 0}
+        self.index_path = os.path.join(output_dir, INDEX_FILENAME)
+        self.index = self._load_index()
+        self._current: Dict[str, Dict[str, any]] = {}
+        self._unsynced: List[str] = []
+        self._index_dirty = False
+        self._dir_ready = False
+    
+    def _load_index(self) -> Dict[str, Dict[str, any]]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def _is_unchanged(self, output_path: str, filename: str, digest: str) -> bool:
+        """索引のハッシュ（サイズ・mtimeが一致する場合）か、既存ファイルの内容と比較する"""
+        try:
+            stat = os.stat(output_path)
+        except FileNotFoundError:
+            return False
+        entry = self.index.get(filename)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+            return entry.get("hash") == digest
+        return file_hash(output_path) == digest
+    
+    def write(self, record: Dict[str, any], name: str) -> Optional[str]:
+        """
+        1レコードを <output_dir>/<name>.json に書き出す（内容が同じなら省略）
+        
+        Args:
+            record: build_recordで構築したレコード
+            name: 出力ファイル名（拡張子なし）
+        
+        Returns:
+            出力先のパス（失敗した場合はNone）
+        """
+        filename = f"{name}.json"
+        output_path = os.path.join(self.output_dir, filename)
+        try:
+            content = serialize_record(record)
+            digest = content_hash(content)
+            
+            if self.skip_unchanged and self._is_unchanged(output_path, filename, digest):
+                self.stats["skipped"] += 1
+            else:
+                if not self._dir_ready:
+                    os.makedirs(self.output_dir, exist_ok=True)
+                    self._dir_ready = True
+                write_atomic(output_path, content)
+                self.stats["written"] += 1
+            # 省略した場合も、前回の実行で書いたままディスクに届いていない可能性があるのでfsyncの対象にする
+            self._unsynced.append(output_path)
+            
+            stat = os.stat(output_path)
+            self._current[filename] = {
+                "file": record["file"],
+                "hash": digest,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+            return output_path
+        
+        except Exception as e:
+            logger.error("Error exporting JSON to %s: %s", output_path, e)
+            return None
+    
+    def close(self):
+        """
+        古い出力を削除し（active_file_idsが指定されている場合）、索引を保存する
+        """
+        written_file_ids = {entry["file"] for entry in self._current.values()}
+        index = dict(self._current)
+        
+        for filename, entry in self.index.items():
+            if filename in index:
+                continue
+            file_id = entry.get("file")
+            stale = (
+                self.active_file_ids is not None
+                and (file_id not in self.active_file_ids or file_id in written_file_ids)
+            )
+            if not stale:
+                index[filename] = entry
+                continue
+            try:
+                os.remove(os.path.join(self.output_dir, filename))
+                self.stats["removed"] += 1
+            except FileNotFoundError:
+                pass
+        
+        self._sync_outputs()
+        self._save_index(index)
+        self.index = index
+        self._current = {}
+    
+    def _save_index(self, index: Dict[str, Dict[str, any]]):
+        if index or os.path.exists(self.index_path):
+            os.makedirs(self.output_dir, exist_ok=True)
+            write_atomic(self.index_path, json.dumps(index, ensure_ascii=False, sort_keys=True))
+    
+    def discard(self, file_id: str):
+        """
+        ファイルIDの前回までの出力を削除し、索引から除く（制限を超えて打ち切ったペアの古い出力を残さない）
+        """
+        for filename in [filename for filename, entry in self.index.items() if entry.get("file") == file_id]:
+            del self.index[filename]
+            try:
+                os.remove(os.path.join(self.output_dir, filename))
+                self.stats["removed"] += 1
+            except FileNotFoundError:
+                pass
+        self._index_dirty = True
+    
+    def _sync_outputs(self):
+        """ここまでに書き出したファイルと、リネームを確定させるために出力ディレクトリをfsyncする"""
+        if not self._unsynced:
+            return
+        for path in self._unsynced:
+            fsync_path(path)
+        fsync_path(self.output_dir)
+        self._unsynced = []
+    
+    def flush(self):
+        """
+        ここまでに書き出したファイルをfsyncし、索引に加えて保存する（古い出力の削除はclose時のみ）
+        
+        実行が中断しても、次回の実行で今回の出力を索引から辿れるようにする
+        """
+        self._sync_outputs()
+        if self._current or self._index_dirty:
+            self._save_index({**self.index, **self._current})
+            self._index_dirty = False
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class JsonlShardWriter:
+    """
+    レコードをコンパクトなJSON Linesとしてシャードファイルに追記するライター
+    
+    書き込み中のシャードは <prefix>-NNNNN.jsonl.tmp に書き、
+    上限サイズに達したとき・close時にfsyncしてから <prefix>-NNNNN.jsonl へリネームする。
+    そのため、読み込み側（*.jsonl）から書きかけのシャードが見えることはない。
+    開いたときに、前回の実行（中断したものを含む）のこのprefixのシャードと一時ファイルを削除する。
+    
+    使い方:
+        with JsonlShardWriter(output_dir) as writer:
+            writer.write(record, "13097882_山田")
+    """
+    
+    def __init__(self, output_dir: str, prefix: str = "samples", max_bytes: int = DEFAULT_SHARD_BYTES):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.shard_index = 0
+        self.shard_paths: List[str] = []
+        self._file = None
+        self._tmp_path = None
+        self._bytes = 0
+        self._remove_stale_shards()
+    
+    def _shard_path(self, index: int) -> str:
+        return os.path.join(self.output_dir, f"{self.prefix}-{index:05d}.jsonl")
+    
+    def _remove_stale_shards(self):
+        """前回の実行のシャード（<prefix>-NNNNN.jsonl と .jsonl.tmp）を削除する（新しいシャードと混ざらないように）"""
+        pattern = re.compile(re.escape(self.prefix) + r"-\d{5,}\.jsonl(\.tmp)?")
+        try:
+            entries = list(os.scandir(self.output_dir))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if pattern.fullmatch(entry.name) and entry.is_file():
+                os.remove(entry.path)
+    
+    def _open_shard(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._tmp_path = self._shard_path(self.shard_index) + ".tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._bytes = 0
+    
+    def _close_shard(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        final_path = self._shard_path(self.shard_index)
+        os.replace(self._tmp_path, final_path)
+        self.shard_paths.append(final_path)
+        self.shard_index += 1
+        self._file = None
+        self._tmp_path = None
+    
+    def write(self, record: Dict[str, any], name: str = None) -> Optional[str]:
+        """
+        1レコードを現在のシャードに1行で追記する
+        
+        Args:
+            record: build_recordで構築したレコード
+            name: 未使用（JsonFileWriterとインターフェースを揃えるため）
+        
+        Returns:
+            書き込み先シャードのパス（リネーム後のパス）
+        """
+        line = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        
+        # 上限サイズを超える場合は次のシャードへ（空のシャードは作らない）
+        if self._file is not None and self._bytes > 0 and self._bytes + len(line) > self.max_bytes:
+            self._close_shard()
+        if self._file is None:
+            self._open_shard()
+        
+        self._file.write(line)
+        self._bytes += len(line)
+        return self._shard_path(self.shard_index)
+    
+    def close(self):
+        """
+        書き込み中のシャードを確定する
+        """
+        self._close_shard()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ColumnarWriter:
+    """
+    全レコードのサンプル・文字（bbox）・ペアを型付きの列として蓄積し、close時に書き出すライター
+    
+    テーブルと列:
+        samples: file, font（辞書コード, int32）, glyph_start, glyph_count, pair_start, pair_count（int32）
+        glyphs:  sample（int32）, id, char（辞書コード, int32）, min_x, max_x, min_y, max_y, width, height（float32）
+        pairs:   sample, left_glyph, right_glyph（int32）, left_char, right_char（辞書コード, int32）, gap_actual（float32）
+    
+    各列は <table>.<column>.npy に書き出し、最後にschema.json（列のdtypeと辞書）を書く。
+    利用側は np.load(path, mmap_mode='r') でパースなしに読み込める（columnar_utils.load_columns）。
+    
+    使い方:
+        with ColumnarWriter(output_dir) as writer:
+            writer.write(record, "13097882_山田")
+    """
+    
+    SCHEMA_VERSION = 1
+    
+    BBOX_COLUMNS = ("min_x", "max_x", "min_y", "max_y", "width", "height")
+    
+    # テーブル → [(列名, dtype, 辞書名 or None), ...]
+    TABLES = {
+        "samples": [
+            ("file", "int32", "files"),
+            ("font", "int32", "fonts"),
+            ("glyph_start", "int32", None),
+            ("glyph_count", "int32", None),
+            ("pair_start", "int32", None),
+            ("pair_count", "int32", None),
+        ],
+        "glyphs": [
+            ("sample", "int32", None),
+            ("id", "int32", "glyph_ids"),
+            ("char", "int32", "chars"),
+        ] + [(name, "float32", None) for name in BBOX_COLUMNS],
+        "pairs": [
+            ("sample", "int32", None),
+            ("left_glyph", "int32", None),
+            ("right_glyph", "int32", None),
+            ("left_char", "int32", "chars"),
+            ("right_char", "int32", "chars"),
+            ("gap_actual", "float32", None),
+        ],
+    }
+    
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.columns = {
+            table: {name: new_column(dtype) for name, dtype, _ in columns}
+            for table, columns in self.TABLES.items()
+        }
+        self.dictionaries = {
+            "files": DictionaryEncoder(),
+            "fonts": DictionaryEncoder(),
+            "glyph_ids": DictionaryEncoder(),
+            "chars": DictionaryEncoder(),
+        }
+    
+    def write(self, record: Dict[str, any], name: str = None) -> Optional[str]:
+        """
+        1レコード分の行を各テーブルの列に追加する
+        
+        bboxはsequenceの順に文字テーブルへ追加し、bboxのない文字とペアは除外する
+        
+        Args:
+            record: build_recordで構築したレコード
+            name: 未使用（JsonFileWriterとインターフェースを揃えるため）
+        
+        Returns:
+            出力先ディレクトリ（実際の書き出しはclose時）
+        """
+        samples = self.columns["samples"]
+        glyphs = self.columns["glyphs"]
+        pairs = self.columns["pairs"]
+        chars = self.dictionaries["chars"]
+        
+        sample = len(samples["file"])
+        glyph_start = len(glyphs["sample"])
+        pair_start = len(pairs["sample"])
+        bbox = record["bbox"]
+        
+        # 文字（bbox）テーブル
+        glyph_rows = {}
+        for item in record["sequence"]:
+            glyph_id = item["id"]
+            if glyph_id not in bbox or glyph_id in glyph_rows:
+                continue
+            glyph_rows[glyph_id] = len(glyphs["sample"])
+            glyphs["sample"].append(sample)
+            glyphs["id"].append(self.dictionaries["glyph_ids"].encode(glyph_id))
+            glyphs["char"].append(chars.encode(item["text"]))
+            glyph_bbox = bbox[glyph_id]
+            for column in self.BBOX_COLUMNS:
+                glyphs[column].append(glyph_bbox[column])
+        
+        # ペアテーブル
+        for pair in record["pairs"]:
+            left_glyph = glyph_rows.get(pair["left_id"])
+            right_glyph = glyph_rows.get(pair["right_id"])
+            if left_glyph is None or right_glyph is None:
+                continue
+            pairs["sample"].append(sample)
+            pairs["left_glyph"].append(left_glyph)
+            pairs["right_glyph"].append(right_glyph)
+            pairs["left_char"].append(chars.encode(pair["left"]))
+            pairs["right_char"].append(chars.encode(pair["right"]))
+            pairs["gap_actual"].append(pair["gap_actual"])
+        
+        # サンプルテーブル
+        samples["file"].append(self.dictionaries["files"].encode(record["file"]))
+        samples["font"].append(self.dictionaries["fonts"].encode(record["font"]))
+        samples["glyph_start"].append(glyph_start)
+        samples["glyph_count"].append(len(glyphs["sample"]) - glyph_start)
+        samples["pair_start"].append(pair_start)
+        samples["pair_count"].append(len(pairs["sample"]) - pair_start)
+        
+        return self.output_dir
+    
+    def close(self):
+        """
+        列ごとに.npyファイルを書き出し、最後にschema.jsonを書き出す
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        
+        tables_schema = {}
+        for table, columns in self.TABLES.items():
+            columns_schema = {}
+            for name, dtype, dictionary in columns:
+                column = self.columns[table][name]
+                write_npy(os.path.join(self.output_dir, column_filename(table, name)), column, dtype)
+                columns_schema[name] = {"dtype": dtype}
+                if dictionary:
+                    columns_schema[name]["dictionary"] = dictionary
+            tables_schema[table] = {
+                "rows": len(self.columns[table][columns[0][0]]),
+                "columns": columns_schema,
+            }
+        
+        write_schema(self.output_dir, {
+            "version": self.SCHEMA_VERSION,
+            "tables": tables_schema,
+            "dictionaries": {name: encoder.values for name, encoder in self.dictionaries.items()},
+        })
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BackgroundWriter:
+    """
+    別スレッドでレコードを書き出すライター（他のライターを包む）
+    
+    write()は有界キューにレコードを積んですぐに戻るため、次のファイルの解析・計算と
+    前のレコードのシリアライズ・書き込みが並行して進む。
+    キューが満杯のときはwrite()が待つ（バックプレッシャー）ので、メモリ使用量は一定に保たれる。
+    内側のライターを呼ぶのは書き込みスレッドだけなので、内側はスレッドセーフでなくてよい。
+    
+    使い方:
+        with BackgroundWriter(open_writer("json", output_dir)) as writer:
+            writer.write(record, "13097882_山田")
+        writer.failed  # 書き込みに失敗した [(file_id, name), ...]
+    """
+    
+    _STOP = object()
+    _DISCARD = object()
+    
+    def __init__(self, writer, max_pending: int = DEFAULT_QUEUE_SIZE):
+        self.writer = writer
+        self.failed: List[Tuple[str, str]] = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="export-writer", daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        """書き込みスレッド: キューが終了マーカーを受け取るまでレコードを書き出す"""
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                self._queue.task_done()
+                break
+            record, name = item
+            if record is self._DISCARD:
+                try:
+                    self.writer.discard(name)
+                except Exception as e:
+                    logger.error("Error removing outputs of %s: %s", name, e)
+                self._queue.task_done()
+                continue
+            try:
+                result = self.writer.write(record, name)
+            except Exception as e:
+                logger.error("Error exporting %s: %s", name or record.get('file'), e)
+                result = None
+            if not result:
+                self.failed.append((record.get("file"), name))
+            self._queue.task_done()
+    
+    @property
+    def stats(self) -> Optional[Dict[str, int]]:
+        """内側のライターの書き込み件数（ない場合はNone）"""
+        return getattr(self.writer, "stats", None)
+    
+    def write(self, record: Dict[str, any], name: str = None) -> Optional[str]:
+        """
+        レコードを書き込みキューに積む（キューが満杯なら空くまで待つ）
+        
+        積んだ後はレコードを変更しないこと
+        
+        Args:
+            record: build_recordで構築したレコード
+            name: 出力ファイル名（拡張子なし）
+        
+        Returns:
+            キューに積んだことを示す文字列（書き込み結果はclose後のfailedで確認する）
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("Background writer thread is not running")
+        self._queue.put((record, name))
+        return f"{name or record.get('file')} (queued)"
+    
+    def discard(self, file_id: str):
+        """
+        内側のライターのdiscardを書き込みスレッドで実行する（キューに積んだ順に処理する）
+        """
+        if getattr(self.writer, "discard", None) is None:
+            return
+        if not self._thread.is_alive():
+            raise RuntimeError("Background writer thread is not running")
+        self._queue.put((self._DISCARD, file_id))
+    
+    def flush(self):
+        """
+        キューに積んだレコードがすべて書き出されるまで待ち、内側のライターをflushする
+        """
+        if self._thread.is_alive():
+            self._queue.join()
+        inner_flush = getattr(self.writer, "flush", None)
+        if inner_flush is not None:
+            inner_flush()
+    
+    def close(self):
+        """
+        キューに残ったレコードをすべて書き出してからスレッドを終了し、内側のライターを閉じる
+        """
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self.writer.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SqliteWriter:
+    """
+    サンプル・文字（bbox）・ペアを正規化したSQLiteデータベースに書き出すライター
+    
+    テーブル:
+        samples: id, file_id, name, font
+        glyphs:  id, sample_id, glyph_id, seq_index, char, min_x, max_x, min_y, max_y, width, height
+        pairs:   id, sample_id, file_id, font（=left_font）, left_char, right_char, left_font, right_font,
+                 left_glyph, right_glyph（glyphs.id）, gap_actual
+    
+    pairsには (font, left_char, right_char) と file_id のインデックスを張るので、
+    「Minchoの Ａ|Ｍ ペア」のような問い合わせや集計をインデックス付きのSQLで実行できる。
+    
+    書き込みはbatch_sizeサンプルごとにexecutemanyでまとめ、1バッチ1トランザクションで行う。
+    同じ (file_id, name) のサンプルは置き換え、active_file_idsを渡すとJsonFileWriterと同じ規則で
+    古いサンプルをclose時に削除する。discard(file_id) したファイルIDのサンプルは次のflushで削除する。
+    
+    使い方:
+        with SqliteWriter(output_dir, active_file_ids={"13097882", ...}) as writer:
+            writer.write(record, "13097882_山田")
+    """
+    
+    def __init__(self, output_dir: str, batch_size: int = DEFAULT_SQLITE_BATCH,
+                 active_file_ids: Optional[Set[str]] = None):
+        """
+        Args:
+            output_dir: 出力ディレクトリ（dataset.sqliteを作成する）
+            batch_size: 1トランザクションで書き込むサンプル数
+            active_file_ids: 今回の入力に存在するファイルIDの集合（Noneなら古いサンプルを削除しない）
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self.db_path = os.path.join(output_dir, SQLITE_FILENAME)
+        self.batch_size = batch_size
+        self.active_file_ids = active_file_ids
+        # BackgroundWriterでは書き込みスレッドとflush()を呼ぶスレッドが交互に使う（同時には使わない）
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.executescript(SQLITE_SCHEMA)
+        
+        # 新しい行のidは自前で割り当てる（executemanyでまとめて挿入するため）
+        self._next_sample = self._max_id("samples") + 1
+        self._next_glyph = self._max_id("glyphs") + 1
+        self._pending_keys: List[Tuple[str, str]] = []
+        self._samples: List[tuple] = []
+        self._glyphs: List[tuple] = []
+        self._pairs: List[tuple] = []
+        self._written: Set[Tuple[str, str]] = set()
+        self._discarded: List[Tuple[str]] = []
+    
+    def _max_id(self, table: str) -> int:
+        return self.conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    
+    def write(self, record: Dict[str, any], name: str = None) -> Optional[str]:
+        """
+        1レコード分の行をバッファに積み、batch_sizeに達したらまとめて書き込む
+        
+        bboxのない文字と、その文字を含むペアは除外する
+        
+        Args:
+            record: build_recordで構築したレコード
+            name: サンプル名（出力ファイル名に相当、省略時はファイルID）
+        
+        Returns:
+            データベースのパス
+        """
+        file_id = record["file"]
+        name = name or file_id
+        font = record["font"]
+        bbox = record["bbox"]
+        
+        sample_id = self._next_sample
+        self._next_sample += 1
+        self._pending_keys.append((file_id, name))
+        self._samples.append((sample_id, file_id, name, font))
+        
+        # 文字（bbox）
+        glyph_rows = {}
+        seq_fonts = {}
+        for seq_index, item in enumerate(record["sequence"]):
+            glyph_id = item["id"]
+            seq_fonts.setdefault(glyph_id, item.get("font", font))
+            if glyph_id not in bbox or glyph_id in glyph_rows:
+                continue
+            row_id = self._next_glyph
+            self._next_glyph += 1
+            glyph_rows[glyph_id] = row_id
+            b = bbox[glyph_id]
+            self._glyphs.append((
+                row_id, sample_id, glyph_id, seq_index, item["text"],
+                b.get("min_x"), b.get("max_x"), b.get("min_y"), b.get("max_y"), b.get("width"), b.get("height")
+            ))
+        
+        # ペア（フォントはpairs内、sequence内、トップレベルの順に採用）
+        for pair in record["pairs"]:
+            left_glyph = glyph_rows.get(pair["left_id"])
+            right_glyph = glyph_rows.get(pair["right_id"])
+            if left_glyph is None or right_glyph is None:
+                continue
+            left_font = pair.get("left_font") or seq_fonts.get(pair["left_id"], font)
+            right_font = pair.get("right_font") or seq_fonts.get(pair["right_id"], font)
+            self._pairs.append((
+                sample_id, file_id, left_font, pair["left"], pair["right"],
+                left_font, right_font, left_glyph, right_glyph, pair.get("gap_actual")
+            ))
+        
+        if len(self._samples) >= self.batch_size:
+            self.flush()
+        return self.db_path
+    
+    def discard(self, file_id: str):
+        """
+        ファイルIDの既存のサンプルを次のflushで削除する（制限を超えて打ち切ったペアの古い出力を残さない）
+        """
+        self._discarded.append((file_id,))
+    
+    def flush(self):
+        """
+        バッファに積んだ行を1トランザクションで書き込む（同じ (file_id, name) の既存サンプルは置き換える）
+        """
+        if not self._samples and not self._discarded:
+            return
+        with self.conn:
+            self.conn.executemany("DELETE FROM samples WHERE file_id = ?", self._discarded)
+            self.conn.executemany("DELETE FROM samples WHERE file_id = ? AND name = ?", self._pending_keys)
+            self.conn.executemany("INSERT INTO samples (id, file_id, name, font) VALUES (?, ?, ?, ?)", self._samples)
+            self.conn.executemany(
+                "INSERT INTO glyphs (id, sample_id, glyph_id, seq_index, char, min_x, max_x, min_y, max_y, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._glyphs
+            )
+            self.conn.executemany(
+                "INSERT INTO pairs (sample_id, file_id, font, left_char, right_char, left_font, right_font, "
+                "left_glyph, right_glyph, gap_actual) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._pairs
+            )
+        self._written.update(self._pending_keys)
+        self._discarded = []
+        self._pending_keys = []
+        self._samples = []
+        self._glyphs = []
+        self._pairs = []
+    
+    def close(self):
+        """
+        残りの行を書き込み、古いサンプルを削除して（active_file_idsが指定されている場合）接続を閉じる
+        """
+        self.flush()
+        
+        if self.active_file_ids is not None:
+            written_file_ids = {file_id for file_id, _ in self._written}
+            stale = [
+                (sample_id,)
+                for sample_id, file_id, name in self.conn.execute("SELECT id, file_id, name FROM samples")
+                if (file_id, name) not in self._written
+                and (file_id not in self.active_file_ids or file_id in written_file_ids)
+            ]
+            with self.conn:
+                self.conn.executemany("DELETE FROM samples WHERE id = ?", stale)
+        
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_writer(output_format: str, output_dir: str, **kwargs):
+    """
+    出力形式に応じたライターを生成
+    
+    Args:
+        output_format: "json", "jsonl", "npy" または "sqlite"
+        output_dir: 出力ディレクトリ
+        **kwargs: ライター固有のオプション
+                  （json: skip_unchanged, active_file_ids / jsonl: prefix, max_bytes /
+                   sqlite: batch_size, active_file_ids）
+    
+    Returns:
+        JsonFileWriter, JsonlShardWriter, ColumnarWriter または SqliteWriter
+    """
+    if output_format == "json":
+        return JsonFileWriter(output_dir, **kwargs)
+    if output_format == "jsonl":
+        return JsonlShardWriter(output_dir, **kwargs)
+    if output_format == "npy":
+        return ColumnarWriter(output_dir)
+    if output_format == "sqlite":
+        return SqliteWriter(output_dir, **kwargs)
+    raise ValueError(f"Unknown output format: {output_format} (expected one of {OUTPUT_FORMATS})")
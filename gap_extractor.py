@@ -3,7 +3,17 @@
 SVGのbounding box情報とCSVの文字情報を結合し、文字間隔を計算する
 """
 
-from typing import List, Dict, Optional
+import logging
+import math
+from array import array
+from typing import Iterable, Iterator, List, Dict, Optional, Sequence, Tuple
+
+from log_utils import warn_repeated
+
+logger = logging.getLogger(__name__)
+
+# n-gram窓の1文字あたりのフィールド（固定ストライドで詰める順序）
+NGRAM_CHAR_FIELDS = ("min_x", "max_x", "min_y", "max_y", "width", "height")
 
 
 def merge_svg_csv(svg_data: List[Dict], csv_data: List[Dict]) -> List[Dict]:
@@ -34,7 +44,8 @@ def merge_svg_csv(svg_data: List[Dict], csv_data: List[Dict]) -> List[Dict]:
             merged.append(merged_item)
         else:
             # CSVに存在するがSVGに存在しないidの場合、警告を出す（空のidは除く）
-            print(f"Warning: id '{csv_id}' found in CSV but not in SVG")
+            warn_repeated(logger, "missing_in_svg", "{count} ids missing in SVG across {files} files",
+                          "Warning: id '%s' found in CSV but not in SVG", csv_id)
     
     return merged
 
@@ -69,6 +80,116 @@ def calculate_gap_actual(merged_data: List[Dict]) -> List[Dict]:
     return pairs
 
 
+def ngram_stride(n: int) -> int:
+    """
+    n-gram窓1つあたりの要素数（ストライド）を返す
+    
+    窓のレイアウト: [文字0のNGRAM_CHAR_FIELDS, ..., 文字n-1のNGRAM_CHAR_FIELDS, gap0, ..., gap(n-2)]
+    
+    Args:
+        n: 窓の文字数
+    
+    Returns:
+        1窓あたりのfloat数
+    """
+    return n * len(NGRAM_CHAR_FIELDS) + (n - 1)
+
+
+def iter_ngrams(name_groups: Iterable[List[Dict]], n: int = 3) -> Iterator[Dict]:
+    """
+    名前ごとにn文字のスライディング窓を固定ストライドの配列に詰めて順に返す（Phase2用）
+    
+    窓ごとに辞書を作らず、名前ごとに1つのarray('d')へ全窓を連結する。
+    窓iの文字列は texts[i:i + n]、値は windows[i * stride:(i + 1) * stride] で取り出せる。
+    gapの平均・標準偏差（Welford法、平均が大きくても桁落ちしない）、全体幅、重心オフセットも同じ1パスで集計する。
+    batch_process.NameResult.ngrams() から1名前分を取り出せる。
+    
+    Args:
+        name_groups: 名前ごとに分割された結合データ（split_by_namesの結果）
+        n: 窓の文字数（2でペア、3でTriplet）
+    
+    Yields:
+        {"texts": [str], "ids": [str], "n": int, "stride": int, "count": int,
+         "windows": array('d'), "gap_mean": float, "gap_std": float,
+         "total_width": float, "centroid_offset": float}
+    """
+    if n < 2:
+        raise ValueError(f"n must be >= 2 (got {n})")
+    
+    char_stride = len(NGRAM_CHAR_FIELDS)
+    stride = ngram_stride(n)
+    
+    for name_data in name_groups:
+        texts = []
+        ids = []
+        chars = array('d')
+        gaps = array('d')
+        gap_mean = 0.0
+        gap_m2 = 0.0
+        span_min = math.inf
+        span_max = -math.inf
+        weight_sum = 0.0
+        weighted_center_sum = 0.0
+        prev_max_x = None
+        
+        # 1パスで文字配列・gap・集計値を作る
+        for item in name_data:
+            texts.append(item["text"])
+            ids.append(item["id"])
+            min_x = item["min_x"]
+            max_x = item["max_x"]
+            width = item["width"]
+            chars.extend((min_x, max_x, item["min_y"], item["max_y"], width, item["height"]))
+            
+            # gap_actual = next.min_x - current.max_x（calculate_gap_actualと同じ定義）
+            if prev_max_x is not None:
+                gap = min_x - prev_max_x
+                gaps.append(gap)
+                delta = gap - gap_mean
+                gap_mean += delta / len(gaps)
+                gap_m2 += delta * (gap - gap_mean)
+            prev_max_x = max_x
+            
+            span_min = min(span_min, min_x)
+            span_max = max(span_max, max_x)
+            # 文字幅を重みにした重心（黒密度は未取得のため幅で代用）
+            weight_sum += width
+            weighted_center_sum += width * (min_x + max_x) / 2.0
+        
+        char_count = len(texts)
+        gap_count = len(gaps)
+        gap_var = gap_m2 / gap_count if gap_count else 0.0
+        
+        if char_count:
+            total_width = span_max - span_min
+            span_center = (span_min + span_max) / 2.0
+            centroid = weighted_center_sum / weight_sum if weight_sum else span_center
+            centroid_offset = centroid - span_center
+        else:
+            total_width = 0.0
+            centroid_offset = 0.0
+        
+        # 窓を固定ストライドで連結
+        count = max(char_count - n + 1, 0)
+        windows = array('d')
+        for i in range(count):
+            windows.extend(chars[i * char_stride:(i + n) * char_stride])
+            windows.extend(gaps[i:i + n - 1])
+        
+        yield {
+            "texts": texts,
+            "ids": ids,
+            "n": n,
+            "stride": stride,
+            "count": count,
+            "windows": windows,
+            "gap_mean": gap_mean,
+            "gap_std": math.sqrt(gap_var),
+            "total_width": total_width,
+            "centroid_offset": centroid_offset,
+        }
+
+
 def extract_sequence(merged_data: List[Dict]) -> List[Dict]:
     """
     文字列順のシーケンス情報を抽出
@@ -321,6 +442,98 @@ def is_vertical_text(name_data: List[Dict]) -> bool:
     return y_range > x_range
 
 
+def order_arrays(items: List[Dict]) -> Tuple[List[float], List[float], List[float], List[float]]:
+    """
+    文字データから並び替えカーネル用の配列（中心・幅と、左端・上端）を作る
+    
+    Yスケールが負でmin/maxが入れ替わったbbox（min_y > max_yなど）は、
+    ここで小さい方を左端・上端、差の絶対値を幅として正規化する
+    
+    Args:
+        items: 文字データのリスト
+    
+    Returns:
+        (centers_x, widths, lefts, tops)
+    """
+    centers_x = []
+    widths = []
+    lefts = []
+    tops = []
+    for item in items:
+        min_x = item["min_x"]
+        max_x = item["max_x"]
+        centers_x.append((min_x + max_x) / 2.0)
+        widths.append(abs(max_x - min_x))
+        lefts.append(min(min_x, max_x))
+        tops.append(min(item["min_y"], item["max_y"]))
+    return centers_x, widths, lefts, tops
+
+
+def lexsort_order(buckets: Sequence, positions: Sequence, ties: Optional[Sequence] = None) -> List[int]:
+    """
+    (バケット, 位置[, 同順位の解消キー]) の辞書式順序で並べた添字の順列を返す
+    
+    キーがすべて等しい要素は入力順を保つ（安定ソート）
+    
+    Args:
+        buckets: 第1キー（列・行の番号など）
+        positions: 第2キー（列・行内での位置）
+        ties: 第3キー（省略時は入力順）
+    
+    Returns:
+        並び替え後の添字リスト
+    """
+    if ties is None:
+        return sorted(range(len(positions)), key=lambda i: (buckets[i], positions[i]))
+    return sorted(range(len(positions)), key=lambda i: (buckets[i], positions[i], ties[i]))
+
+
+def reading_order(
+    centers_x: Sequence[float],
+    widths: Sequence[float],
+    lefts: Sequence[float],
+    tops: Sequence[float],
+    vertical: bool
+) -> List[int]:
+    """
+    文字の中心・幅と左端・上端から読み順の順列を求める並び替えカーネル
+    
+    - 横書き: 1行として左端の昇順（左から右）
+    - 縦書き: 中心Xが平均文字幅の0.5倍以内で連続する文字を同じ列とし、
+      (列番号, 上端) の昇順（列は左から右、列内は上から下）。上端が同じ場合は中心Xの順
+    
+    Args:
+        centers_x: 中心X座標
+        widths: 幅（正規化済み）
+        lefts: 左端（正規化済み）
+        tops: 上端（正規化済み）
+        vertical: 縦書きの場合True
+    
+    Returns:
+        読み順に並べた添字リスト
+    """
+    n = len(centers_x)
+    if n <= 1:
+        return list(range(n))
+    
+    if not vertical:
+        return lexsort_order([0] * n, lefts)
+    
+    # 中心Xの順に走査して列番号を割り当てる（列番号は左から右に増える）
+    x_threshold = sum(widths) / n * 0.5
+    by_x = lexsort_order([0] * n, centers_x)
+    columns = [0] * n
+    x_ranks = [0] * n
+    column = 0
+    for rank, (prev, cur) in enumerate(zip(by_x, by_x[1:]), start=1):
+        if abs(centers_x[cur] - centers_x[prev]) > x_threshold:
+            column += 1
+        columns[cur] = column
+        x_ranks[cur] = rank
+    
+    return lexsort_order(columns, tops, x_ranks)
+
+
 def sort_by_x_in_row(row_data: List[Dict]) -> List[Dict]:
     """
     行内の文字をX座標でソート（左から右の順）
@@ -331,21 +544,8 @@ def sort_by_x_in_row(row_data: List[Dict]) -> List[Dict]:
     Returns:
         X座標でソートされた文字データ
     """
-    # Yスケールが負かどうかを判定（min_y > max_yの場合、Yスケールが負）
-    has_negative_y_scale = any(item.get("min_y", 0) > item.get("max_y", 0) for item in row_data)
-    
-    if has_negative_y_scale:
-        # Yスケールが負の場合、文字数が少ない場合（2文字など）はmax_xの降順でソート
-        # 文字数が多い場合はmin_xの昇順でソート
-        if len(row_data) <= 2:
-            # 2文字以下の場合はmax_xの降順でソート
-            return sorted(row_data, key=lambda item: item["max_x"], reverse=True)
-        else:
-            # 3文字以上の場合はmin_xの昇順でソート
-            return sorted(row_data, key=lambda item: item["min_x"])
-    else:
-        # Yスケールが正の場合、通常通りmin_xの昇順でソート
-        return sorted(row_data, key=lambda item: item["min_x"])
+    order = reading_order(*order_arrays(row_data), vertical=False)
+    return [row_data[i] for i in order]
 
 
 def sort_by_y_in_row(row_data: List[Dict]) -> List[Dict]:
@@ -353,7 +553,7 @@ def sort_by_y_in_row(row_data: List[Dict]) -> List[Dict]:
     行内の文字をY座標でソート（上から下の順）
     
     縦書きの場合、文字が重なっている可能性があるため、
-    X座標が近い文字同士でグループ化し、各グループ内でY座標でソートする
+    X座標が近い文字同士で列にまとめ、各列内でY座標でソートする
     
     Args:
         row_data: 1行分の文字データ
@@ -361,60 +561,8 @@ def sort_by_y_in_row(row_data: List[Dict]) -> List[Dict]:
     Returns:
         Y座標でソートされた文字データ
     """
-    if len(row_data) <= 1:
-        return row_data
-    
-    # X座標の範囲を計算
-    x_coords = [get_center_x(item) for item in row_data]
-    x_range = max(x_coords) - min(x_coords)
-    avg_width = sum(item["width"] for item in row_data) / len(row_data)
-    
-    # X座標が近い文字同士でグループ化（同じ列と判定）
-    # 閾値：平均文字幅の0.5倍以内なら同じ列
-    x_threshold = avg_width * 0.5
-    
-    # X座標でソート
-    sorted_by_x = sorted(row_data, key=lambda item: get_center_x(item))
-    
-    # 列ごとにグループ化
-    columns = []
-    current_column = [sorted_by_x[0]]
-    
-    for i in range(1, len(sorted_by_x)):
-        current_x = get_center_x(sorted_by_x[i - 1])
-        next_x = get_center_x(sorted_by_x[i])
-        x_diff = abs(next_x - current_x)
-        
-        if x_diff > x_threshold:
-            # 新しい列
-            columns.append(current_column)
-            current_column = [sorted_by_x[i]]
-        else:
-            # 同じ列
-            current_column.append(sorted_by_x[i])
-    
-    if current_column:
-        columns.append(current_column)
-    
-    # 各列内でY座標でソート（上から下の順）
-    # Yスケールが負の場合、min_yとmax_yが入れ替わっているため、
-    # 実際の表示ではmin_yが上、max_yが下になる
-    # そのため、min_yの昇順でソートする
-    sorted_columns = []
-    for col in columns:
-        # min_yの昇順でソート（上から下の順）
-        sorted_col = sorted(col, key=lambda item: item["min_y"])
-        sorted_columns.append(sorted_col)
-    
-    # 列をX座標でソート（左から右の順）
-    sorted_columns.sort(key=lambda col: get_center_x(col[0]))
-    
-    # 列を結合
-    result = []
-    for col in sorted_columns:
-        result.extend(col)
-    
-    return result
+    order = reading_order(*order_arrays(row_data), vertical=True)
+    return [row_data[i] for i in order]
 
 
 def split_by_names(merged_data: List[Dict], svg_groups: List[List[str]] = None) -> List[List[Dict]]:
@@ -458,11 +606,12 @@ def split_by_names(merged_data: List[Dict], svg_groups: List[List[str]] = None)
         for name_text, name_data in sorted(name_groups_dict.items()):
             # name_orderでソート（数値として比較）
             try:
-                sorted_name_data = sorted(name_data, key=lambda x: int(x.get('name_order', 0)))
+                positions = [int(x.get('name_order', 0)) for x in name_data]
             except (ValueError, TypeError):
                 # name_orderが数値でない場合は文字列としてソート
-                sorted_name_data = sorted(name_data, key=lambda x: x.get('name_order', ''))
-            names.append(sorted_name_data)
+                positions = [x.get('name_order', '') for x in name_data]
+            order = lexsort_order([0] * len(name_data), positions)
+            names.append([name_data[i] for i in order])
         
         if names:
             return names
@@ -486,14 +635,9 @@ def split_by_names(merged_data: List[Dict], svg_groups: List[List[str]] = None)
             
             # データが取得できた場合のみ追加
             if name_data:
-                # 縦書きか横書きかを判定
-                if is_vertical_text(name_data):
-                    # 縦書きの場合、Y座標でソート（上から下の順）
-                    sorted_name_data = sort_by_y_in_row(name_data)
-                else:
-                    # 横書きの場合、X座標でソート（左から右の順）
-                    sorted_name_data = sort_by_x_in_row(name_data)
-                names.append(sorted_name_data)
+                # 縦書きならY座標（上から下）、横書きならX座標（左から右）で並べる
+                order = reading_order(*order_arrays(name_data), vertical=is_vertical_text(name_data))
+                names.append([name_data[i] for i in order])
         
         # グループ構造から取得できたデータがある場合、それを返す
         if names:
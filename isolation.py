@@ -0,0 +1,228 @@
+"""
+ファイル単位の隔離実行モジュール
+SVG/CSVペアを1件ずつワーカープロセスで処理し、制限時間・メモリ上限を超えたファイルだけを打ち切る
+（巨大なpathや入れ子の深いSVGが1件あっても、残りのファイルの処理は止まらない）
+
+打ち切ったファイルは理由とともに rejects レポートに記録する
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    # Windowsにはresourceモジュールがない（メモリ上限は設定できない）
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# rejectsレポートのファイル名（出力ディレクトリに置く）
+REJECTS_FILENAME = ".batch_rejects"
+
+# 打ち切ったワーカーの終了を待つ時間（秒）
+KILL_WAIT_SECONDS = 5.0
+
+
+def _worker_main(conn, func: Callable, max_memory_bytes: Optional[int]):
+    """
+    ワーカープロセス: タスクを受け取って func(task) を実行し、結果を返す（Noneを受け取ったら終了）
+    
+    結果は ("ok", 戻り値)、("memory", None) または ("error", メッセージ)
+    """
+    if max_memory_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory_bytes, max_memory_bytes))
+    
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        try:
+            result = ("ok", func(task))
+        except MemoryError:
+            result = ("memory", None)
+        except Exception as e:
+            result = ("error", f"{type(e).__name__}: {e}")
+        conn.send(result)
+
+
+class _Worker:
+    """
+    ワーカープロセス1つと、処理中のタスク
+    """
+    
+    def __init__(self, func: Callable, max_memory_bytes: Optional[int]):
+        self.func = func
+        self.max_memory_bytes = max_memory_bytes
+        self.index: Optional[int] = None
+        self.task = None
+        self.started = 0.0
+        self._start()
+    
+    def _start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, self.func, self.max_memory_bytes), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+    
+    def submit(self, index: int, task):
+        self.index = index
+        self.task = task
+        self.started = time.monotonic()
+        self.conn.send(task)
+    
+    def done(self):
+        self.index = None
+        self.task = None
+    
+    def restart(self):
+        """
+        ワーカープロセスを終了させて作り直す（制限を超えたタスクの後始末）
+        """
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(KILL_WAIT_SECONDS)
+        self.conn.close()
+        self._start()
+    
+    def stop(self):
+        if self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(KILL_WAIT_SECONDS)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+        self.conn.close()
+
+
+class IsolatedPool:
+    """
+    タスクを1件ずつワーカープロセスで実行し、制限を超えたタスクを打ち切るプール
+    
+    - timeout秒を超えたタスクは、ワーカープロセスを強制終了して打ち切る
+    - max_memory_mbを超えてメモリを確保しようとしたタスク（MemoryError）は打ち切る
+      （メモリ上限はresourceモジュールのあるUnix系のみ）
+    - ワーカープロセスが異常終了した場合も、そのタスクだけを打ち切る
+    打ち切った後はワーカープロセスを作り直して、残りのタスクを続ける。
+    
+    使い方:
+        pool = IsolatedPool(func, workers=4, timeout=60, max_memory_mb=2048)
+        for task, result, reason in pool.imap(tasks):
+            if reason is not None:
+                ...  # 打ち切られた（resultはNone）
+    """
+    
+    def __init__(self, func: Callable, workers: int = 1, timeout: Optional[float] = None,
+                 max_memory_mb: Optional[int] = None):
+        """
+        Args:
+            func: 各タスクに適用する関数（ワーカープロセスに渡すため、モジュールのトップレベルの関数）
+            workers: ワーカープロセス数
+            timeout: 1タスクあたりの制限時間（秒、Noneなら無制限）
+            max_memory_mb: ワーカープロセスのメモリ上限（MB、Noneなら無制限）
+        """
+        self.func = func
+        self.workers = max(1, workers)
+        self.timeout = timeout or None
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+        if self.max_memory_bytes and resource is None:
+            logger.warning("Warning: memory limit is not supported on this platform (ignored)")
+    
+    def imap(self, tasks: Iterable) -> Iterator[Tuple[Any, Any, Optional[str]]]:
+        """
+        タスクを並列に実行し、入力順に結果を返す
+        
+        Args:
+            tasks: タスク（funcの引数）
+        
+        Yields:
+            (タスク, funcの戻り値, 打ち切った理由)
+            打ち切った場合は戻り値がNone、そうでなければ理由がNone
+        """
+        pending = iter(enumerate(tasks))
+        exhausted = False
+        results: Dict[int, Tuple[Any, Any, Optional[str]]] = {}
+        next_index = 0
+        workers = [_Worker(self.func, self.max_memory_bytes) for _ in range(self.workers)]
+        
+        try:
+            while True:
+                # 空いているワーカーに次のタスクを渡す
+                for worker in workers:
+                    if worker.index is None and not exhausted:
+                        item = next(pending, None)
+                        if item is None:
+                            exhausted = True
+                        else:
+                            worker.submit(*item)
+                
+                busy = [worker for worker in workers if worker.index is not None]
+                if not busy:
+                    break
+                
+                wait_seconds = None
+                if self.timeout:
+                    now = time.monotonic()
+                    wait_seconds = max(0.0, min(worker.started + self.timeout - now for worker in busy))
+                ready = wait([worker.conn for worker in busy], wait_seconds)
+                
+                now = time.monotonic()
+                for worker in busy:
+                    elapsed = now - worker.started
+                    if worker.conn in ready:
+                        try:
+                            status, value = worker.conn.recv()
+                        except (EOFError, OSError):
+                            worker.process.join(KILL_WAIT_SECONDS)
+                            status, value = "crashed", f"worker exited (code {worker.process.exitcode})"
+                    elif self.timeout and elapsed >= self.timeout:
+                        status, value = "timeout", f"timeout after {self.timeout:g}s"
+                    else:
+                        continue
+                    
+                    if status == "ok":
+                        results[worker.index] = (worker.task, value, None)
+                    else:
+                        if status == "memory":
+                            value = f"memory limit exceeded ({self.max_memory_bytes // (1024 * 1024)} MB)"
+                        results[worker.index] = (worker.task, None, value)
+                        if status != "error":
+                            worker.restart()
+                    worker.done()
+                
+                while next_index in results:
+                    yield results.pop(next_index)
+                    next_index += 1
+        finally:
+            for worker in workers:
+                worker.stop()
+
+
+def write_rejects(path: str, rejects: List[Dict[str, Any]]):
+    """
+    rejectsレポートを書き出す（一時ファイルからのリネームで置き換える）
+    
+    Args:
+        path: 出力先のパス
+        rejects: [{"file": str, "svg": str, "csv": str, "reason": str}, ...]
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(rejects, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,248 @@
+"""
+ログ出力の共通設定
+各モジュールは logging.getLogger(__name__) でロガーを取得し、
+スクリプトの実行時に setup_logging() でコンソール・JSON Linesファイルへの出力を設定する
+
+- ファイルごとに繰り返される警告は warn_repeated() で出し、実行の最後に
+  「12 ids missing in SVG across 5 files」のように件数をまとめて表示する
+- --quiet（SUMMARYレベル）では処理結果の要約とエラーだけを表示する
+"""
+
+import contextvars
+import json
+import logging
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+
+# 処理結果の要約用のレベル（INFOとWARNINGの間、--quiet でも表示する）
+SUMMARY = 25
+logging.addLevelName(SUMMARY, "SUMMARY")
+
+# 処理中のファイルID（ログレコードの file_id 属性に記録する）
+_current_file: contextvars.ContextVar = contextvars.ContextVar("current_file", default=None)
+
+_default_record_factory = logging.getLogRecordFactory()
+
+
+def _record_factory(*args, **kwargs) -> logging.LogRecord:
+    record = _default_record_factory(*args, **kwargs)
+    record.file_id = _current_file.get()
+    return record
+
+
+logging.setLogRecordFactory(_record_factory)
+
+
+@contextmanager
+def log_context(file_id: Optional[str]):
+    """
+    withブロック内のログレコードに処理中のファイルIDを記録する
+    
+    Args:
+        file_id: ファイルID
+    """
+    token = _current_file.set(file_id)
+    try:
+        yield
+    finally:
+        _current_file.reset(token)
+
+
+def warn_repeated(logger: logging.Logger, event: str, summary: str, msg: str, *args,
+                  file_id: Optional[str] = None):
+    """
+    ファイルごとに繰り返される警告を出す
+    
+    コンソールには --verbose の場合のみ1件ずつ表示し、通常は実行の最後に
+    log_warning_summary() が summary の形式で件数をまとめて表示する
+    
+    Args:
+        logger: ロガー
+        event: 警告の種類（集計のキー、例: "missing_in_svg"）
+        summary: 要約の形式（{count}: 件数、{files}: ファイル数）
+        msg: 1件ごとのメッセージ（loggingの%形式）
+        *args: msgの引数
+        file_id: 指定した場合、log_context() の代わりにこのファイルIDを記録する
+    """
+    if file_id is not None:
+        with log_context(file_id):
+            logger.warning(msg, *args, extra={"event": event, "summary": summary})
+    else:
+        logger.warning(msg, *args, extra={"event": event, "summary": summary})
+
+
+class WarningSummaryHandler(logging.Handler):
+    """
+    warn_repeated() の警告を種類ごとに数えるハンドラ
+    """
+    
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.counts: Dict[str, int] = {}
+        self.files: Dict[str, set] = {}
+        self.summaries: Dict[str, str] = {}
+    
+    def emit(self, record: logging.LogRecord):
+        event = getattr(record, "event", None)
+        if event is None:
+            return
+        self.counts[event] = self.counts.get(event, 0) + 1
+        self.files.setdefault(event, set())
+        if record.file_id is not None:
+            self.files[event].add(record.file_id)
+        self.summaries.setdefault(event, getattr(record, "summary", None) or f"{{count}} x {event}")
+    
+    def lines(self) -> List[str]:
+        """
+        種類ごとの要約の行を返す
+        """
+        return [
+            self.summaries[event].format(count=count, files=len(self.files[event]))
+            for event, count in self.counts.items()
+        ]
+    
+    def reset(self):
+        self.counts.clear()
+        self.files.clear()
+        self.summaries.clear()
+
+
+class _ConsoleFilter(logging.Filter):
+    """
+    verboseでない場合、warn_repeated() の警告を1件ずつは表示しない
+    """
+    
+    def __init__(self, verbose: bool):
+        super().__init__()
+        self.verbose = verbose
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        return self.verbose or getattr(record, "event", None) is None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    ログレコードを1行のJSONに変換する
+    """
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("file_id", "event"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# setup_logging() で作成したハンドラ
+_summary_handler = WarningSummaryHandler()
+_handlers: List[logging.Handler] = []
+
+
+def setup_logging(quiet: bool = False, verbose: bool = False, log_file: Optional[str] = None):
+    """
+    ルートロガーにコンソール（標準出力）とJSON Linesファイルへの出力を設定する
+    
+    Args:
+        quiet: Trueの場合、要約（SUMMARY）以上のみ表示する
+        verbose: Trueの場合、DEBUGと、繰り返される警告を1件ずつ表示する
+        log_file: 指定した場合、すべてのログ（DEBUG以上）をJSON Lines形式で追記する
+    """
+    root = logging.getLogger()
+    for handler in _handlers:
+        root.removeHandler(handler)
+        handler.close()
+    _handlers.clear()
+    _summary_handler.reset()
+    
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(SUMMARY if quiet else logging.DEBUG if verbose else logging.INFO)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    console.addFilter(_ConsoleFilter(verbose))
+    _handlers.extend([console, _summary_handler])
+    
+    if log_file:
+        file_handler = logging.FileHandler(log_file, mode="a", encoding="utf-8")
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(JsonLinesFormatter())
+        _handlers.append(file_handler)
+    
+    for handler in _handlers:
+        root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+
+
+def log_warning_summary(logger: logging.Logger):
+    """
+    warn_repeated() の警告の件数をまとめて表示し、カウントをリセットする
+    """
+    for line in _summary_handler.lines():
+        logger.log(SUMMARY, "Warnings: %s", line)
+    _summary_handler.reset()
+
+
+class RecordCollector(logging.Handler):
+    """
+    ワーカープロセスのログレコードを集めて、親プロセスに返せる形（pickle可能）にするハンドラ
+    """
+    
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records: List[logging.LogRecord] = []
+    
+    def emit(self, record: logging.LogRecord):
+        # logging.handlers.QueueHandler.prepare と同様に、メッセージを確定して引数と例外を外す
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+@contextmanager
+def collect_records(keep_handlers: bool = False):
+    """
+    withブロック内のログレコードを出力せずに集める（ワーカープロセス用）
+    
+    Args:
+        keep_handlers: Trueの場合、既存のハンドラとレベルのまま、出力しながら集める
+    
+    Yields:
+        RecordCollector（.records に集めたレコード）
+    """
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    collector = RecordCollector()
+    if keep_handlers:
+        root.handlers = saved_handlers + [collector]
+    else:
+        root.handlers = [collector]
+        root.setLevel(logging.DEBUG)
+    try:
+        yield collector
+    finally:
+        root.handlers = saved_handlers
+        root.setLevel(saved_level)
+
+
+def replay_records(records: List[logging.LogRecord]):
+    """
+    collect_records() で集めたレコードを、このプロセスのハンドラで出力する
+    """
+    for record in records:
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
@@ -0,0 +1,326 @@
+"""
+インクリメンタルビルド用のマニフェストモジュール
+SVG/CSVペアごとに入力の内容ハッシュ・パイプラインのバージョン・出力ファイルを記録し、
+前回から変わったペアだけを処理できるようにする
+
+実行中は完了したペアをジャーナル（BuildJournal）に追記し、中断した実行を再開できるようにする
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+# 出力に影響する処理を変更したら上げる（上がると全ペアを処理し直す）
+PIPELINE_VERSION = "1"
+
+# マニフェストのファイル名（出力ディレクトリに置く）
+MANIFEST_FILENAME = ".batch_manifest"
+
+# ペア単位で出力を置き換えられる（インクリメンタルビルドに対応する）出力形式
+INCREMENTAL_FORMATS = ("json", "sqlite")
+
+
+def file_digest(path: str, previous: Optional[Dict] = None) -> Dict:
+    """
+    ファイルの内容ハッシュ・サイズ・mtimeを返す
+    
+    previousのサイズとmtimeが一致する場合は、ファイルを読まずに前回のハッシュを使う
+    
+    Args:
+        path: ファイルのパス
+        previous: 前回のfile_digestの結果（マニフェストに記録したもの）
+    
+    Returns:
+        {"path": str, "hash": str, "size": int, "mtime_ns": int}
+    """
+    stat = os.stat(path)
+    if (previous and previous.get("size") == stat.st_size
+            and previous.get("mtime_ns") == stat.st_mtime_ns and previous.get("hash")):
+        digest = previous["hash"]
+    else:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+    return {"path": path, "hash": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_manifest(output_dir: str) -> Dict:
+    """
+    出力ディレクトリのマニフェストを読み込む（ない・壊れている場合は空のマニフェスト）
+    
+    Returns:
+        {"pipeline_version": str, "output_format": str, "entries": {file_id: {...}}}
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("entries"), dict):
+            return manifest
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"pipeline_version": None, "output_format": None, "entries": {}}
+
+
+def save_manifest(output_dir: str, output_format: str, entries: Dict[str, Dict]):
+    """
+    マニフェストを書き出す（一時ファイルからのリネームで置き換える）
+    
+    Args:
+        output_dir: 出力ディレクトリ
+        output_format: 出力形式
+        entries: {file_id: {"svg": file_digest, "csv": file_digest, "outputs": [出力名, ...]}}
+                 （制限を超えて打ち切ったペアは "rejected": 理由 も記録する）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "pipeline_version": PIPELINE_VERSION,
+            "output_format": output_format,
+            "entries": entries,
+        }, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def outputs_exist(output_dir: str, output_format: str, outputs: List[str]) -> bool:
+    """
+    記録した出力ファイルがすべて存在するかどうか（json形式以外は常にTrue）
+    """
+    return output_format != "json" or all(
+        os.path.exists(os.path.join(output_dir, f"{name}.json")) for name in outputs
+    )
+
+
+def outputs_complete(output_dir: str, output_format: str, outputs: List[str]) -> bool:
+    """
+    記録した出力ファイルがすべて存在し、JSONとして読み込めるかどうか（json形式以外は常にTrue）
+    
+    中断した実行の再開時に、書きかけ・空のまま残ったファイルを完了扱いにしないために使う
+    """
+    if output_format != "json":
+        return True
+    for name in outputs:
+        try:
+            with open(os.path.join(output_dir, f"{name}.json"), 'r', encoding='utf-8') as f:
+                if not isinstance(json.load(f), dict):
+                    return False
+        except (OSError, ValueError):
+            return False
+    return True
+
+
+def plan_build(
+    pairs: List[tuple],
+    manifest: Dict,
+    output_dir: str,
+    output_format: str
+) -> Tuple[List[tuple], Dict[str, Dict], Dict[str, Dict], Set[str]]:
+    """
+    マニフェストと比較して、処理が必要なペアを決める
+    
+    次のいずれかに当てはまるペアを処理対象とする:
+    - マニフェストにない（新しいペア）
+    - SVGまたはCSVの内容ハッシュが変わった
+    - パイプラインのバージョンまたは出力形式が変わった
+    - 記録した出力ファイルがない（json形式）
+    
+    Args:
+        pairs: [(svg_path, csv_path, file_id), ...]
+        manifest: load_manifestの結果
+        output_dir: 出力ディレクトリ
+        output_format: 出力形式
+    
+    Returns:
+        (処理対象のペア, 変更のないペアのマニフェストエントリ {file_id: entry},
+         全ペアの入力ダイジェスト {file_id: {"svg": ..., "csv": ...}}, 入力からなくなったfile_idの集合)
+    """
+    previous_entries = manifest.get("entries", {})
+    reusable = (
+        manifest.get("pipeline_version") == PIPELINE_VERSION
+        and manifest.get("output_format") == output_format
+    )
+    
+    todo = []
+    unchanged = {}
+    digests = {}
+    for svg_path, csv_path, file_id in pairs:
+        previous = previous_entries.get(file_id) or {}
+        digest = {
+            "svg": file_digest(svg_path, previous.get("svg")),
+            "csv": file_digest(csv_path, previous.get("csv")),
+        }
+        digests[file_id] = digest
+        
+        same_inputs = (
+            reusable and previous
+            and previous.get("svg", {}).get("hash") == digest["svg"]["hash"]
+            and previous.get("csv", {}).get("hash") == digest["csv"]["hash"]
+        )
+        if same_inputs and outputs_exist(output_dir, output_format, previous.get("outputs", [])):
+            unchanged[file_id] = {**digest, "outputs": previous.get("outputs", [])}
+            if previous.get("rejected"):
+                # 制限を超えて打ち切ったペアは、入力が変わるまで処理しない（隔離）
+                unchanged[file_id]["rejected"] = previous["rejected"]
+        else:
+            todo.append((svg_path, csv_path, file_id))
+    
+    current_ids = {file_id for _, _, file_id in pairs}
+    removed = set(previous_entries) - current_ids
+    
+    return todo, unchanged, digests, removed
+
+
+# 完了したペアを記録するジャーナルのファイル名（出力ディレクトリに置く）
+JOURNAL_FILENAME = ".batch_journal"
+
+# ジャーナルをfsyncする間隔（完了したペア数・秒のどちらかに達したとき）
+DEFAULT_JOURNAL_SYNC_FILES = 50
+DEFAULT_JOURNAL_SYNC_SECONDS = 5.0
+
+
+class BuildJournal:
+    """
+    処理が完了したペアを追記していくジャーナル（中断した実行の再開用）
+    
+    1行1ペアのJSON Lines（{"file_id": str, "svg": ..., "csv": ..., "outputs": [...]}、
+    マニフェストのエントリと同じ形式）で、add()したエントリはメモリにため、
+    due()になったら出力をflushした後でsync()して追記・fsyncする。
+    実行が最後まで終わってマニフェストを保存したらremove()で削除する。
+    
+    使い方:
+        journal = BuildJournal(output_dir, resume=True)
+        journal.entries  # 前回までに完了したペア {file_id: entry}
+        journal.add(file_id, entry)
+        if journal.due():
+            writer.flush()
+            journal.sync()
+    """
+    
+    def __init__(self, output_dir: str, resume: bool = False,
+                 sync_files: int = DEFAULT_JOURNAL_SYNC_FILES, sync_seconds: float = DEFAULT_JOURNAL_SYNC_SECONDS):
+        """
+        Args:
+            output_dir: 出力ディレクトリ
+            resume: Trueの場合、既存のジャーナルを読み込んで追記する（Falseなら空にする）
+            sync_files: この件数の完了ごとにfsyncする
+            sync_seconds: 前回のfsyncからこの秒数が経過したらfsyncする
+        """
+        self.path = os.path.join(output_dir, JOURNAL_FILENAME)
+        self.sync_files = sync_files
+        self.sync_seconds = sync_seconds
+        self.entries: Dict[str, Dict] = self._load() if resume else {}
+        self._pending: List[Tuple[str, Dict]] = []
+        self._last_sync = time.monotonic()
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # 読み込んだエントリを書き直してから追記する（中断で途中までになった最後の行を取り除く）
+        self._file = open(self.path, 'w', encoding='utf-8')
+        if self.entries:
+            self._pending = list(self.entries.items())
+            self.sync()
+    
+    def _load(self) -> Dict[str, Dict]:
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で中断した最後の行は無視する
+                        continue
+                    entries[entry.pop("file_id")] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+    
+    def add(self, file_id: str, entry: Dict):
+        """
+        完了したペアのエントリをためる（sync()するまでジャーナルには書かない）
+        """
+        self._pending.append((file_id, entry))
+    
+    def due(self) -> bool:
+        """
+        sync()する時期になったかどうか
+        """
+        return bool(self._pending) and (
+            len(self._pending) >= self.sync_files
+            or time.monotonic() - self._last_sync >= self.sync_seconds
+        )
+    
+    def sync(self, exclude: Optional[Set[str]] = None):
+        """
+        ためたエントリをジャーナルに追記してfsyncする
+        
+        呼ぶ前に、エントリに対応する出力をflushしておくこと
+        
+        Args:
+            exclude: 追記しないファイルIDの集合（書き込みに失敗したものなど）
+        """
+        for file_id, entry in self._pending:
+            if exclude and file_id in exclude:
+                continue
+            self._file.write(json.dumps({"file_id": file_id, **entry}, ensure_ascii=False) + "\n")
+            self.entries[file_id] = entry
+        self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+    
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+    
+    def remove(self):
+        """
+        ジャーナルを閉じて削除する（マニフェストを保存した後に呼ぶ）
+        """
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def apply_journal(
+    todo: List[tuple],
+    journal_entries: Dict[str, Dict],
+    digests: Dict[str, Dict],
+    output_dir: str,
+    output_format: str
+) -> Tuple[List[tuple], Dict[str, Dict]]:
+    """
+    中断した実行のジャーナルに記録されたペアを処理対象から外す
+    
+    入力の内容ハッシュがジャーナルと一致し、出力ファイルがJSONとして読み込めるペアだけを完了済みとみなす
+    
+    Args:
+        todo: plan_buildが返した処理対象のペア
+        journal_entries: BuildJournal.entries
+        digests: plan_buildが返した全ペアの入力ダイジェスト
+        output_dir: 出力ディレクトリ
+        output_format: 出力形式
+    
+    Returns:
+        (残りの処理対象のペア, 完了済みのペアのマニフェストエントリ {file_id: entry})
+    """
+    remaining = []
+    resumed = {}
+    for svg_path, csv_path, file_id in todo:
+        entry = journal_entries.get(file_id)
+        digest = digests[file_id]
+        if (entry
+                and entry.get("svg", {}).get("hash") == digest["svg"]["hash"]
+                and entry.get("csv", {}).get("hash") == digest["csv"]["hash"]
+                and outputs_complete(output_dir, output_format, entry.get("outputs", []))):
+            resumed[file_id] = {**digest, "outputs": entry.get("outputs", [])}
+        else:
+            remaining.append((svg_path, csv_path, file_id))
+    return remaining, resumed
@@ -0,0 +1,218 @@
+"""
+処理時間の計測モジュール
+ファイルごとに各ステージの処理時間（perf_counter_ns）と件数を記録し、
+実行全体のレポート（ステージ別の合計・p50/p95/max・遅いファイル）を作成する
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# 計測するステージ（レポートの表示順）
+STAGES = (
+    "svg_xml",         # SVGのXML解析
+    "svg_bbox",        # bounding boxの計算（path解析・transform適用・グループ構造）
+    "csv_load",        # CSVの読み込み
+    "merge",           # SVGとCSVの結合
+    "split_by_names",  # 名前ごとの分割
+    "records",         # gap_actual計算・レコード生成
+    "write",           # 出力（--background-write時はキューへの投入まで）
+)
+
+# レポートに載せる遅いファイルの件数
+SLOWEST_FILES = 20
+
+# ステージの開始・終了を受け取るフック（profiling.py が設定する）
+_stage_hook = None
+
+
+def set_stage_hook(hook):
+    """
+    FileMetrics.stage() の開始・終了を通知するフックを設定する（Noneで解除）
+    
+    Args:
+        hook: enter(name) と exit(name) を持つオブジェクト
+    """
+    global _stage_hook
+    _stage_hook = hook
+
+
+class FileMetrics:
+    """
+    1ファイル（SVG/CSVペア）の処理時間と件数
+    
+    使い方:
+        metrics = FileMetrics("06098137")
+        with metrics.stage("csv_load"):
+            csv_data = load_csv(csv_path)
+        metrics.count("glyphs", len(merged_data))
+    """
+    
+    def __init__(self, file_id: str):
+        self.file_id = file_id
+        self.stages_ns: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+    
+    @contextmanager
+    def stage(self, name: str):
+        """
+        withブロックの処理時間をステージに加算する（例外で抜けた場合も加算）
+        """
+        hook = _stage_hook
+        if hook is not None:
+            hook.enter(name)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - start)
+            if hook is not None:
+                hook.exit(name)
+    
+    def add(self, name: str, elapsed_ns: int):
+        """
+        ステージの処理時間（ナノ秒）を加算する
+        """
+        self.stages_ns[name] = self.stages_ns.get(name, 0) + elapsed_ns
+    
+    def count(self, name: str, value: int):
+        """
+        件数を加算する（glyphs, paths, names など）
+        """
+        self.counts[name] = self.counts.get(name, 0) + value
+    
+    @property
+    def total_ns(self) -> int:
+        return sum(self.stages_ns.values())
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        ワーカープロセスから返すための辞書に変換する
+        """
+        return {"file": self.file_id, "stages_ns": dict(self.stages_ns), "counts": dict(self.counts)}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FileMetrics":
+        metrics = cls(data["file"])
+        metrics.stages_ns = dict(data.get("stages_ns", {}))
+        metrics.counts = dict(data.get("counts", {}))
+        return metrics
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """
+    ソート済みの値のパーセンタイル（最近傍順位法）を返す
+    
+    Args:
+        sorted_values: 昇順にソートした値のリスト
+        p: パーセンタイル（0〜100）
+    
+    Returns:
+        パーセンタイル値（値がない場合はNone）
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))  # ceil(n * p / 100)
+    return sorted_values[int(rank) - 1]
+
+
+def _ms(ns: Optional[float]) -> Optional[float]:
+    return None if ns is None else round(ns / 1e6, 3)
+
+
+def build_run_report(file_metrics: List[FileMetrics], wall_ns: int) -> Dict[str, Any]:
+    """
+    ファイルごとの計測結果から実行全体のレポートを作成する（時間はミリ秒）
+    
+    Args:
+        file_metrics: FileMetricsのリスト
+        wall_ns: 実行全体の経過時間（ナノ秒）
+    
+    Returns:
+        {"files", "wall_ms", "throughput", "counts", "stages": {stage: {"total_ms", "p50_ms", "p95_ms", "max_ms"}},
+         "per_file_total": {...}, "slowest_files": [...]}
+    """
+    stage_names = list(STAGES) + sorted({name for m in file_metrics for name in m.stages_ns} - set(STAGES))
+    
+    stages = {}
+    for name in stage_names:
+        values = sorted(m.stages_ns.get(name, 0) for m in file_metrics)
+        stages[name] = {
+            "total_ms": _ms(sum(values)),
+            "p50_ms": _ms(percentile(values, 50)),
+            "p95_ms": _ms(percentile(values, 95)),
+            "max_ms": _ms(values[-1] if values else None),
+        }
+    
+    totals = sorted(m.total_ns for m in file_metrics)
+    counts: Dict[str, int] = {}
+    for m in file_metrics:
+        for name, value in m.counts.items():
+            counts[name] = counts.get(name, 0) + value
+    
+    wall_s = wall_ns / 1e9
+    slowest = sorted(file_metrics, key=lambda m: m.total_ns, reverse=True)[:SLOWEST_FILES]
+    
+    return {
+        "files": len(file_metrics),
+        "wall_ms": _ms(wall_ns),
+        "throughput": {
+            "files_per_s": round(len(file_metrics) / wall_s, 3) if wall_s > 0 else None,
+            "glyphs_per_s": round(counts.get("glyphs", 0) / wall_s, 3) if wall_s > 0 else None,
+        },
+        "counts": counts,
+        "stages": stages,
+        "per_file_total": {
+            "p50_ms": _ms(percentile(totals, 50)),
+            "p95_ms": _ms(percentile(totals, 95)),
+            "max_ms": _ms(totals[-1] if totals else None),
+        },
+        "slowest_files": [
+            {
+                "file": m.file_id,
+                "total_ms": _ms(m.total_ns),
+                "stages_ms": {name: _ms(ns) for name, ns in m.stages_ns.items()},
+                "counts": m.counts,
+            }
+            for m in slowest
+        ],
+    }
+
+
+def print_run_report(report: Dict[str, Any], slowest: int = 5, level: int = logging.DEBUG):
+    """
+    レポートの要約を表示する（デフォルトはDEBUGレベルのログで、--verbose か --log-file のときだけ出る）
+    
+    Args:
+        report: build_run_reportの結果
+        slowest: 表示する遅いファイルの件数
+        level: ログレベル（--metrics-out 指定時など、明示的に求められた場合はINFO）
+    """
+    logger.log(level, "Timing (%d files, wall %.1f ms):", report['files'], report['wall_ms'])
+    logger.log(level, "  %-16s%12s%10s%10s%10s  (ms)", "stage", "total", "p50", "p95", "max")
+    for name, stage in report["stages"].items():
+        logger.log(level, "  %-16s%12.1f%10.2f%10.2f%10.2f",
+                   name, stage['total_ms'], stage['p50_ms'], stage['p95_ms'], stage['max_ms'])
+    counts = ", ".join(f"{name}: {value}" for name, value in sorted(report["counts"].items()))
+    logger.log(level, "  Counts: %s", counts)
+    for item in report["slowest_files"][:slowest]:
+        logger.log(level, "  Slow: %s (%.1f ms)", item['file'], item['total_ms'])
+
+
+def write_run_report(report: Dict[str, Any], output_path: str):
+    """
+    レポートをJSONファイルに書き出す（一時ファイルからのリネームで置き換える）
+    """
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
@@ -0,0 +1,121 @@
+"""
+文字ペアの正規化キーモジュール
+全角・半角などの表記の違いをUnicode正規化（NFKC）でまとめ、
+ペアを整数のタプル (font_id, left_cp, right_cp) のキーで集計できるようにする
+
+- "Ｉ|Ｍ"（全角）と "I|M"（半角）、"ｶ|ﾅ"（半角カナ）と "カ|ナ" は同じキーになる
+- 正規化すると複数の文字になるもの（"㍻" → "平成" など）は正規化しない
+- 元の文字の幅（East Asian Width）は char_form() で特徴量として別に記録する
+
+使い方:
+    codec = PairKeyCodec("nfkc")
+    key = codec.pack("Gothic", "Ｉ", "Ｍ")  # (0, 73, 77)
+    codec.unpack(key)  # ("Gothic", "I", "M")
+    codec.pair_text(key)  # "I|M"（モデルJSONのキー）
+"""
+
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Tuple
+
+from columnar_utils import DictionaryEncoder
+
+
+# 文字の正規化の方式（nfkc: NFKCで1文字になる場合は置き換える、none: 置き換えない）
+FOLDINGS = ("nfkc", "none")
+DEFAULT_FOLDING = "nfkc"
+
+# 1コードポイントでない文字列に割り当てるコードの開始値（Unicodeの範囲外）
+EXTRA_CODE_BASE = 0x110000
+
+
+@lru_cache(maxsize=None)
+def fold_char(text: str, folding: str = DEFAULT_FOLDING) -> str:
+    """
+    文字を正規化する
+    
+    Args:
+        text: 文字（前後の空白は除いておく）
+        folding: FOLDINGSのいずれか
+    
+    Returns:
+        正規化した文字（NFKCで1コードポイントにならない場合は元の文字）
+    """
+    if folding == "none" or not text:
+        return text
+    folded = unicodedata.normalize("NFKC", text)
+    return folded if len(folded) == 1 else text
+
+
+@lru_cache(maxsize=None)
+def char_form(text: str) -> str:
+    """
+    元の文字の幅の種類（Unicode East Asian Width: "F" 全角, "H" 半角, "W", "Na", "A", "N"）
+    
+    正規化したキーでは失われる全角・半角の違いを、特徴量として残すために使う（空文字列は ""）
+    """
+    return unicodedata.east_asian_width(text[0]) if text else ""
+
+
+class PairKeyCodec:
+    """
+    文字ペアを整数のタプル (font_id, left_cp, right_cp) のキーに変換する
+    
+    文字はfold_charで正規化したコードポイント、フォントは出現順の番号にする。
+    キーはこのインスタンスの中でだけ有効（フォントの番号は出現順で決まる）。
+    """
+    
+    def __init__(self, folding: str = DEFAULT_FOLDING):
+        """
+        Args:
+            folding: FOLDINGSのいずれか
+        
+        Raises:
+            ValueError: foldingが正しくない場合
+        """
+        if folding not in FOLDINGS:
+            raise ValueError(f"Unknown folding '{folding}' (expected one of: {', '.join(FOLDINGS)})")
+        self.folding = folding
+        self.fonts = DictionaryEncoder()
+        self._extra = DictionaryEncoder()
+        self._pair_texts: Dict[Tuple[int, int, int], str] = {}
+    
+    def char_code(self, text: str) -> int:
+        """
+        文字のコード（正規化した文字のコードポイント、1コードポイントでない場合は EXTRA_CODE_BASE 以上）
+        """
+        folded = fold_char(text, self.folding)
+        if len(folded) == 1:
+            return ord(folded)
+        return EXTRA_CODE_BASE + self._extra.encode(folded)
+    
+    def char_text(self, code: int) -> str:
+        """
+        char_codeの逆変換（正規化した文字）
+        """
+        if code < EXTRA_CODE_BASE:
+            return chr(code)
+        return self._extra.values[code - EXTRA_CODE_BASE]
+    
+    def pack(self, font: str, left_char: str, right_char: str) -> Tuple[int, int, int]:
+        """
+        (フォント, 左の文字, 右の文字) → (font_id, left_cp, right_cp)
+        """
+        return self.fonts.encode(font), self.char_code(left_char), self.char_code(right_char)
+    
+    def unpack(self, key: Tuple[int, int, int]) -> Tuple[str, str, str]:
+        """
+        (font_id, left_cp, right_cp) → (フォント, 正規化した左の文字, 正規化した右の文字)
+        """
+        font_id, left_code, right_code = key
+        return self.fonts.values[font_id], self.char_text(left_code), self.char_text(right_code)
+    
+    def pair_text(self, key: Tuple[int, int, int]) -> str:
+        """
+        モデルJSONのペアのキー（"左|右"、キーごとに1回だけ組み立てる）
+        """
+        text = self._pair_texts.get(key)
+        if text is None:
+            _, left_char, right_char = self.unpack(key)
+            text = self._pair_texts[key] = f"{left_char}|{right_char}"
+        return text
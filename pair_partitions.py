@@ -0,0 +1,262 @@
+"""
+文字ペアのインクリメンタル集計モジュール
+名前ごとのJSONから作った文字ペアのレコードを、フォント（left_font）ごとのCSV（パーティション）に分けて出力し、
+どのJSONファイル（パスと内容ハッシュ）がどのパーティションに何行を出力したかを状態ファイルに記録する
+
+2回目以降は、状態ファイルと比較して
+- 新しいJSONファイルのレコードを追加する
+- 変更・削除されたJSONファイルのレコードを取り除く（変更されたものは作り直す）
+- 影響を受けたパーティションだけを書き直す（新しいファイルのレコードが末尾に来る場合は追記だけ）
+
+使い方:
+    python aggregate_pairs.py --json-dir ./output_json/train --partition-dir ./pairs_partitions
+
+各パーティションのCSVは aggregate_pairs のCSVの先頭に "source"（JSONファイル名）のカラムを加えたもので、
+行の順序は、1つのCSVに出力した場合のそのフォントの行の順序と同じになる
+（build_phase1_model.py --csv ./pairs_partitions でパーティションのディレクトリからモデルを生成できる）
+"""
+
+import csv
+import heapq
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from aggregate_pairs import CSV_COLUMNS, iter_json_source, iter_sample_pair_records, list_json_sources
+from manifest import file_digest
+from pair_keys import DEFAULT_FOLDING
+from sharding import SOURCE_COLUMN
+
+logger = logging.getLogger(__name__)
+
+# 状態ファイルのファイル名（パーティションのディレクトリに置く）
+STATE_FILENAME = ".aggregate_state"
+
+# 状態ファイル・パーティションの形式を変更したら上げる（上がると全パーティションを作り直す）
+STATE_VERSION = "1"
+
+# パーティションのファイル名（フォント名はURLエンコードする）
+PARTITION_FILE_FORMAT = "font-{font}.csv"
+
+# パーティションのCSVのカラム
+PARTITION_COLUMNS = [SOURCE_COLUMN] + CSV_COLUMNS
+
+
+def partition_of(record: Dict[str, Any]) -> str:
+    """
+    レコードのパーティション（build_phase1_model のモデルと同じく、前後の空白を除いたleft_font）
+    """
+    return (record.get("left_font") or "").strip()
+
+
+def partition_filename(font: str) -> str:
+    """
+    パーティションのファイル名（例: "Gothic" → font-Gothic.csv）
+    """
+    return PARTITION_FILE_FORMAT.format(font=quote(font, safe=""))
+
+
+def source_order(source: str) -> Tuple[bool, str]:
+    """
+    JSONファイル名の並び順のキー（aggregate_pairs.list_json_sources と同じく、*.json の後に *.jsonl）
+    """
+    return source.endswith(".jsonl"), source
+
+
+def load_state(output_dir: str) -> Dict:
+    """
+    パーティションのディレクトリの状態ファイルを読み込む（ない・壊れている場合は空の状態）
+    
+    Returns:
+        {"version": str, "columns": [...], "folding": str,
+         "sources": {JSONファイル名: {"json": file_digest, "rows": {フォント: 行数}}},
+         "dirty": [書き直し中だったフォント, ...]}
+    """
+    try:
+        with open(os.path.join(output_dir, STATE_FILENAME), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if isinstance(state.get("sources"), dict):
+            return state
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"version": None, "columns": None, "folding": None, "sources": {}, "dirty": []}
+
+
+def save_state(output_dir: str, sources: Dict[str, Dict], dirty: Optional[List[str]] = None,
+               folding: str = DEFAULT_FOLDING):
+    """
+    状態ファイルを書き出す（一時ファイルからのリネームで置き換える）
+    
+    Args:
+        output_dir: パーティションのディレクトリ
+        sources: {JSONファイル名: {"json": file_digest, "rows": {フォント: 行数}}}
+        dirty: これから書き直すフォント（中断した場合、次回はこれらのパーティションを作り直す）
+        folding: パーティションのpair_keyの文字の正規化の方式（変わると全パーティションを作り直す）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILENAME)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": STATE_VERSION,
+            "columns": PARTITION_COLUMNS,
+            "folding": folding,
+            "sources": sources,
+            "dirty": sorted(dirty or []),
+        }, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+
+def _iter_partition_rows(path: str) -> Iterator[List[str]]:
+    """パーティションのCSVの行（ヘッダーを除く）"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+
+def _rewrite_partition(path: str, drop: set, new_rows: List[tuple]) -> int:
+    """
+    パーティションを書き直す: dropのJSONファイルの行を取り除き、new_rowsをJSONファイル名順にマージする
+    
+    Returns:
+        書き直した後の行数（0行になった場合はファイルを削除する）
+    """
+    kept = (row for row in _iter_partition_rows(path) if row[0] not in drop)
+    merged = heapq.merge(kept, new_rows, key=lambda row: source_order(row[0]))
+    
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PARTITION_COLUMNS)
+        for row in merged:
+            writer.writerow(row)
+            count += 1
+    if count:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+        if os.path.exists(path):
+            os.remove(path)
+    return count
+
+
+def _append_partition(path: str, new_rows: List[tuple]) -> int:
+    """
+    パーティションの末尾に行を追記する（ファイルがなければヘッダーから書く）
+    
+    Returns:
+        追記した行数
+    """
+    exists = os.path.exists(path)
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if not exists:
+            writer.writerow(PARTITION_COLUMNS)
+        writer.writerows(new_rows)
+    return len(new_rows)
+
+
+def update_partitions(json_dir: str, output_dir: str, force: bool = False,
+                      folding: str = DEFAULT_FOLDING) -> Dict[str, Any]:
+    """
+    名前ごとのJSONから、変わったファイルの分だけフォントごとのパーティションを更新する
+    
+    Args:
+        json_dir: JSONファイルが格納されているディレクトリ
+        output_dir: パーティションのディレクトリ
+        force: Trueの場合、状態ファイルを使わずに全パーティションを作り直す
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        {"sources": int, "new": int, "changed": int, "removed": int, "unchanged": int,
+         "rewritten": [フォント, ...], "appended": [フォント, ...], "records": int}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = load_state(output_dir)
+    reusable = (
+        not force
+        and state.get("version") == STATE_VERSION
+        and state.get("columns") == PARTITION_COLUMNS
+        and state.get("folding", DEFAULT_FOLDING) == folding
+    )
+    previous = state.get("sources", {}) if reusable else {}
+    
+    # JSONファイルごとに、前回から変わったかどうかを内容ハッシュで判定する
+    paths = list_json_sources(json_dir)
+    sources: Dict[str, Dict] = {}
+    todo: List[Tuple[Path, Dict]] = []
+    for path in paths:
+        entry = previous.get(path.name)
+        digest = file_digest(str(path), entry["json"] if entry else None)
+        if entry and entry["json"]["hash"] == digest["hash"]:
+            sources[path.name] = {"json": digest, "rows": entry["rows"]}
+        else:
+            todo.append((path, digest))
+    removed = set(previous) - {path.name for path in paths}
+    
+    # 変わったJSONファイルのレコードを、フォントごとに分ける
+    new_rows: Dict[str, List[tuple]] = {}
+    for path, digest in todo:
+        rows: Dict[str, int] = {}
+        for json_data in iter_json_source(path):
+            for record in iter_sample_pair_records(json_data, folding):
+                font = partition_of(record)
+                new_rows.setdefault(font, []).append((path.name,) + tuple(record.get(column) for column in CSV_COLUMNS))
+                rows[font] = rows.get(font, 0) + 1
+        sources[path.name] = {"json": digest, "rows": rows}
+    
+    # 取り除く行: 変更・削除されたファイルの行（新しいファイルも、中断した前回の実行で書かれた行があれば取り除く）
+    drop = {path.name for path, _ in todo} | removed
+    affected = set(new_rows) | set(state.get("dirty", []) if reusable else [])
+    for source in drop & set(previous):
+        affected.update(previous[source]["rows"])
+    
+    if not reusable:
+        # 前回の状態が使えない場合は、ディレクトリ内の古いパーティションを削除してすべて作り直す
+        for entry in os.scandir(output_dir):
+            if entry.name.startswith("font-") and entry.name.endswith(".csv"):
+                os.remove(entry.path)
+    
+    if affected:
+        # 書き直し中に中断した場合に備えて、前回の状態に書き直すフォントを記録してから書き直す
+        save_state(output_dir, previous, affected, folding)
+    else:
+        logger.info("Pair partitions are up to date: %s", output_dir)
+    
+    rewritten, appended = [], []
+    for font in sorted(affected):
+        path = os.path.join(output_dir, partition_filename(font))
+        rows = new_rows.get(font, [])
+        
+        # 行を取り除かず、既存の行のファイルがすべて新しい行のファイルより前に並ぶなら、末尾に追記するだけでよい
+        dropping = any(font in previous[source]["rows"] for source in drop & set(previous))
+        last_existing = max((source_order(source) for source, entry in previous.items()
+                             if source not in drop and font in entry["rows"]), default=None)
+        if (reusable and rows and not dropping and font not in state.get("dirty", [])
+                and (last_existing is None or last_existing < source_order(rows[0][0]))):
+            _append_partition(path, rows)
+            appended.append(font)
+        else:
+            _rewrite_partition(path, drop, rows)
+            rewritten.append(font)
+    
+    save_state(output_dir, sources, folding=folding)
+    
+    new_count = sum(1 for path, _ in todo if path.name not in previous)
+    return {
+        "sources": len(sources),
+        "new": new_count,
+        "changed": len(todo) - new_count,
+        "removed": len(removed),
+        "unchanged": len(sources) - len(todo),
+        "rewritten": rewritten,
+        "appended": appended,
+        "records": sum(sum(entry["rows"].values()) for entry in sources.values()),
+    }
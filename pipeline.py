@@ -0,0 +1,160 @@
+"""
+SVG+CSV → Phase1モデル 一括パイプライン
+batch_process（名前ごとのJSON）→ aggregate_pairs（pairs_aggregated.csv）→ build_phase1_model
+の3段階を1プロセスで行い、解析した文字ペアをそのままモデルの集計に渡す
+
+中間ファイル（名前ごとのJSON、pairs_aggregated.csv）は必要な場合のみ出力する
+
+使い方:
+    python pipeline.py ./dataset_train --model-out ./assets/phase1_model.json
+    python pipeline.py ./dataset_train --json-dir ./output_json/train --pairs-csv ./pairs_aggregated.csv
+"""
+
+import argparse
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from aggregate_pairs import iter_sample_pair_records, record_row, write_csv_rows
+from batch_process import (
+    DEFAULT_DATASET_DIR,
+    find_svg_csv_pairs,
+    iter_file_results,
+    process_many,
+    write_pair_records
+)
+from build_phase1_model import OUTPUT_JSON_PATH, accumulate_row, finalize_model, new_stats, write_model_json
+from export_json import OUTPUT_FORMATS, open_writer
+from log_utils import SUMMARY, log_warning_summary, setup_logging
+from pair_keys import DEFAULT_FOLDING, FOLDINGS
+
+logger = logging.getLogger(__name__)
+
+
+def run_pipeline(
+    dataset_dir: str = None,
+    model_out: str = OUTPUT_JSON_PATH,
+    json_dir: Optional[str] = None,
+    output_format: str = "json",
+    pairs_csv: Optional[str] = None,
+    jobs: int = 1,
+    folding: str = DEFAULT_FOLDING
+) -> Optional[Dict[str, Any]]:
+    """
+    SVG/CSVペアを解析し、中間ファイルを経由せずにPhase1モデルを生成する
+    
+    Args:
+        dataset_dir: データセットディレクトリ（デフォルト: batch_process.DEFAULT_DATASET_DIR）
+        model_out: Phase1モデルJSONの出力先
+        json_dir: 指定した場合、名前ごとのレコードもこのディレクトリに出力する（batch_processと同じ出力）
+        output_format: json_dirへの出力形式（export_json.OUTPUT_FORMATS）
+        pairs_csv: 指定した場合、文字ペアのレコードもCSVに出力する（aggregate_pairsと同じカラム）
+        jobs: 解析の並列プロセス数（1なら逐次処理、0ならCPU数）
+        folding: モデル・pairs_csvのペアのキーの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        生成されたモデル辞書（SVG/CSVペアが見つからなかった場合はNone）
+    """
+    if dataset_dir is None:
+        dataset_dir = DEFAULT_DATASET_DIR
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    
+    logger.info("=" * 60)
+    logger.info("SVG+CSV → Phase1モデル パイプライン")
+    logger.info("=" * 60)
+    logger.info("Dataset directory: %s", dataset_dir)
+    logger.info("Model output: %s", model_out)
+    if json_dir:
+        logger.info("Sample output: %s (%s)", json_dir, output_format)
+    if pairs_csv:
+        logger.info("Pairs CSV: %s", pairs_csv)
+    logger.info("-" * 60)
+    
+    pairs = find_svg_csv_pairs(dataset_dir)
+    if not pairs:
+        logger.warning("No SVG/CSV pairs found")
+        return None
+    logger.info("Found %s SVG/CSV pairs", len(pairs))
+    
+    start_ns = time.perf_counter_ns()
+    stats = new_stats(folding)
+    error_count = 0
+    sample_count = 0
+    pair_count = 0
+    skipped_count = 0
+    
+    writer = open_writer(output_format, json_dir) if json_dir else None
+    
+    def iter_rows():
+        # 名前ごとのレコード → 文字ペアのレコード → モデルの集計
+        nonlocal error_count, sample_count, pair_count, skipped_count
+        for file_results in iter_file_results(process_many(pairs, jobs)):
+            if not file_results[0].ok:
+                error_count += 1
+                continue
+            named_records = [(r.output_name, r.name_text, r.record) for r in file_results]
+            if writer is not None and not write_pair_records(named_records, writer):
+                error_count += 1
+            
+            for _, _, record in named_records:
+                sample_count += 1
+                for row in iter_sample_pair_records(record, folding):
+                    pair_count += 1
+                    skip, reason = accumulate_row(stats, row)
+                    if skip:
+                        skipped_count += 1
+                        logger.debug("Skipped pair %s in %s: %s", row["pair_key"], row["sample_id"], reason)
+                    yield row
+    
+    try:
+        if pairs_csv:
+            # aggregate_pairsと同じく一時ファイルに書いてから置き換える（0件なら前回のCSVを削除）
+            write_csv_rows((record_row(row) for row in iter_rows()), pairs_csv)
+        else:
+            for _ in iter_rows():
+                pass
+    finally:
+        if writer is not None:
+            writer.close()
+    
+    result = finalize_model(stats)
+    write_model_json(result, model_out)
+    
+    elapsed_ms = (time.perf_counter_ns() - start_ns) / 1e6
+    logger.log(SUMMARY, "-" * 60)
+    logger.log(SUMMARY, "Pipeline completed:")
+    logger.log(SUMMARY, "  Files: %s (errors: %s)", len(pairs), error_count)
+    logger.log(SUMMARY, "  Samples: %s", sample_count)
+    logger.log(SUMMARY, "  Pairs: %s (skipped: %s)", pair_count, skipped_count)
+    logger.log(SUMMARY, "  Elapsed: %.1f ms", elapsed_ms)
+    log_warning_summary(logger)
+    
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SVG+CSV → Phase1モデル パイプライン（中間ファイルなし）")
+    parser.add_argument("dataset_dir", nargs="?", default=None,
+                        help=f"データセットディレクトリ（デフォルト: {DEFAULT_DATASET_DIR}）")
+    parser.add_argument("--model-out", default=OUTPUT_JSON_PATH,
+                        help=f"Phase1モデルJSONの出力先（デフォルト: {OUTPUT_JSON_PATH}）")
+    parser.add_argument("--json-dir", default=None,
+                        help="名前ごとのレコードも出力するディレクトリ（省略時は出力しない）")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="json",
+                        help="--json-dirへの出力形式")
+    parser.add_argument("--pairs-csv", default=None,
+                        help="文字ペアのレコードも出力するCSV（省略時は出力しない）")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="解析の並列プロセス数（1: 逐次処理、0: CPU数）")
+    parser.add_argument("--fold", choices=FOLDINGS, default=DEFAULT_FOLDING,
+                        help=f"モデルのペアのキーの文字の正規化（nfkc: 全角・半角などをまとめる、none: しない、デフォルト: {DEFAULT_FOLDING}）")
+    parser.add_argument("--quiet", "-q", action="store_true", help="処理結果の要約とエラーだけを表示する")
+    parser.add_argument("--verbose", "-v", action="store_true", help="繰り返される警告も1件ずつ表示する")
+    parser.add_argument("--log-file", default=None, help="すべてのログをJSON Lines形式で追記するファイル")
+    args = parser.parse_args()
+    setup_logging(args.quiet, args.verbose, args.log_file)
+    
+    run_pipeline(args.dataset_dir, args.model_out, args.json_dir, args.output_format, args.pairs_csv, args.jobs,
+                 args.fold)
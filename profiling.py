@@ -0,0 +1,297 @@
+"""
+プロファイリングモジュール
+batch_process の実行全体をプロファイルし、.pstats と、フレームグラフ用の collapsed stack
+（1行1スタック「stage:<ステージ>;フレーム;フレーム... 値」）を書き出す
+
+- cprofile: cProfileでステージごとにプロファイルする（stackは呼び出し関係から推定、値はマイクロ秒）
+- sample: 別スレッドで sys._current_frames() を一定間隔で記録する（値はサンプル数）
+
+ステージは metrics.FileMetrics.stage() の区間（svg_xml, svg_bbox, ...）で、それ以外は "other"
+（--jobs 2以上の場合、ワーカープロセスでの解析はプロファイルされない）
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from log_utils import SUMMARY
+from metrics import set_stage_hook
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# sampleモードのサンプリング間隔（秒）
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# ステージ外の区間のラベル
+OTHER_STAGE = "other"
+
+# cprofileモードで呼び出し関係からstackを推定するときの上限
+MAX_STACK_DEPTH = 64
+MIN_STACK_US = 1.0
+
+
+def _frame_label(filename: str, lineno: int, funcname: str) -> str:
+    """collapsed stackの1フレームのラベル（";" と空白を含まない）"""
+    label = f"{os.path.basename(filename)}:{funcname}:{lineno}" if filename != "~" else funcname
+    return label.replace(";", ":").replace(" ", "_")
+
+
+class _StatsSnapshot:
+    """
+    pstats.Statsに渡すための統計のコピー（pstats.Statsは渡したオブジェクトのstatsを空にするため）
+    """
+    
+    def __init__(self, stats: Dict[tuple, tuple]):
+        self.stats = dict(stats)
+    
+    def create_stats(self):
+        pass
+
+
+class StageProfiler:
+    """
+    cProfileでステージごとにプロファイルする
+    
+    ステージに入ると、そのステージ用のcProfile.Profileに切り替える（同じスレッドのみ）
+    """
+    
+    def __init__(self):
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        self._stack: List[str] = []
+        self._thread_id = None
+    
+    def _profile(self, stage: str) -> cProfile.Profile:
+        if stage not in self.profiles:
+            self.profiles[stage] = cProfile.Profile()
+        return self.profiles[stage]
+    
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._stack = [OTHER_STAGE]
+        set_stage_hook(self)
+        self._profile(OTHER_STAGE).enable()
+    
+    def stop(self):
+        set_stage_hook(None)
+        self._profile(self._stack[-1]).disable()
+        for profile in self.profiles.values():
+            profile.create_stats()
+    
+    def enter(self, name: str):
+        if threading.get_ident() != self._thread_id:
+            return
+        self._profile(self._stack[-1]).disable()
+        self._stack.append(name)
+        self._profile(name).enable()
+    
+    def exit(self, name: str):
+        if threading.get_ident() != self._thread_id or len(self._stack) <= 1:
+            return
+        self._profile(self._stack.pop()).disable()
+        self._profile(self._stack[-1]).enable()
+    
+    def stats(self) -> pstats.Stats:
+        """すべてのステージをまとめた統計"""
+        profiles = [profile for profile in self.profiles.values() if profile.stats] or list(self.profiles.values())
+        stats = pstats.Stats(_StatsSnapshot(profiles[0].stats))
+        for profile in profiles[1:]:
+            stats.add(_StatsSnapshot(profile.stats))
+        return stats
+    
+    def collapsed(self) -> Dict[str, float]:
+        """
+        ステージごとの呼び出し関係からstackを推定する
+        
+        各関数の自身の時間（tottime）を、呼び出し元ごとの累積時間（cumtime）の比で
+        呼び出し経路に按分する（再帰は打ち切る）
+        
+        Returns:
+            {"stage:<ステージ>;フレーム;...": マイクロ秒}
+        """
+        lines: Dict[str, float] = defaultdict(float)
+        for stage, profile in self.profiles.items():
+            stats = profile.stats
+            callees: Dict[tuple, Dict[tuple, float]] = defaultdict(dict)
+            for func, (_, _, _, _, callers) in stats.items():
+                for caller, edge in callers.items():
+                    callees[caller][func] = edge[3]
+            
+            def walk(func: tuple, path: List[str], on_path: set, fraction: float):
+                _, _, tottime, cumtime, _ = stats[func]
+                self_us = tottime * fraction * 1e6
+                if self_us >= MIN_STACK_US:
+                    lines[";".join(path)] += self_us
+                if len(path) >= MAX_STACK_DEPTH:
+                    return
+                for callee, edge_cumtime in callees[func].items():
+                    callee_cumtime = stats[callee][3]
+                    if callee in on_path or callee_cumtime <= 0:
+                        continue
+                    callee_fraction = edge_cumtime * fraction / callee_cumtime
+                    if callee_cumtime * callee_fraction * 1e6 < MIN_STACK_US:
+                        continue
+                    on_path.add(callee)
+                    walk(callee, path + [_frame_label(*callee)], on_path, callee_fraction)
+                    on_path.discard(callee)
+            
+            for func, (_, _, _, _, callers) in stats.items():
+                if not callers:
+                    walk(func, [f"stage:{stage}", _frame_label(*func)], {func}, 1.0)
+        return lines
+
+
+class SamplingProfiler:
+    """
+    別スレッドで対象スレッドのスタックを一定間隔で記録する
+    """
+    
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Dict[Tuple[str, Tuple[tuple, ...]], int] = defaultdict(int)
+        self._stage = OTHER_STAGE
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+    
+    def start(self):
+        self._thread_id = threading.get_ident()
+        set_stage_hook(self)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        set_stage_hook(None)
+    
+    def enter(self, name: str):
+        if threading.get_ident() == self._thread_id:
+            self._stage = name
+    
+    def exit(self, name: str):
+        if threading.get_ident() == self._thread_id:
+            self._stage = OTHER_STAGE
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.samples[(self._stage, tuple(reversed(stack)))] += 1
+    
+    def stats(self) -> pstats.Stats:
+        """サンプルから、サンプル数×間隔を時間とした統計を作る（呼び出し回数はサンプル数）"""
+        entries: Dict[tuple, list] = {}
+        for (_, stack), count in self.samples.items():
+            elapsed = count * self.interval
+            seen = set()
+            for depth, func in enumerate(stack):
+                entry = entries.setdefault(func, [0, 0, 0.0, 0.0, defaultdict(lambda: [0, 0, 0.0, 0.0])])
+                if func not in seen:
+                    seen.add(func)
+                    entry[0] += count
+                    entry[1] += count
+                    entry[3] += elapsed
+                if depth == len(stack) - 1:
+                    entry[2] += elapsed
+                if depth > 0:
+                    edge = entry[4][stack[depth - 1]]
+                    edge[0] += count
+                    edge[1] += count
+                    edge[3] += elapsed
+                    if depth == len(stack) - 1:
+                        edge[2] += elapsed
+        
+        return pstats.Stats(_StatsSnapshot({
+            func: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.items()})
+            for func, (cc, nc, tt, ct, callers) in entries.items()
+        }))
+    
+    def collapsed(self) -> Dict[str, float]:
+        """
+        Returns:
+            {"stage:<ステージ>;フレーム;...": サンプル数}
+        """
+        lines: Dict[str, float] = defaultdict(float)
+        for (stage, stack), count in self.samples.items():
+            lines[";".join([f"stage:{stage}"] + [_frame_label(*func) for func in stack])] += count
+        return lines
+
+
+def write_profile(profiler, output_prefix: str) -> Tuple[str, str]:
+    """
+    <output_prefix>.pstats と <output_prefix>.collapsed.txt を書き出す
+    
+    Returns:
+        (pstatsのパス, collapsed stackのパス)
+    """
+    directory = os.path.dirname(output_prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    pstats_path = output_prefix + ".pstats"
+    collapsed_path = output_prefix + ".collapsed.txt"
+    
+    profiler.stats().dump_stats(pstats_path)
+    with open(collapsed_path, 'w', encoding='utf-8') as f:
+        for stack, value in sorted(profiler.collapsed().items()):
+            f.write(f"{stack} {int(round(value))}\n")
+    return pstats_path, collapsed_path
+
+
+def log_top_functions(profiler, top: int):
+    """
+    累積時間（cumulative）の上位top件の関数を表示する（SUMMARYレベルのログ）
+    """
+    stream = io.StringIO()
+    stats = profiler.stats()
+    stats.stream = stream
+    stats.sort_stats("cumulative").print_stats(top)
+    for line in stream.getvalue().rstrip().splitlines():
+        logger.log(SUMMARY, "%s", line)
+
+
+@contextmanager
+def profile_run(output_prefix: Optional[str], mode: str = "cprofile", top: int = 0,
+                interval: float = DEFAULT_SAMPLE_INTERVAL):
+    """
+    withブロックの処理をプロファイルし、終了時に結果を書き出す
+    
+    使い方:
+        with profile_run("./profile/batch", mode="sample", top=30):
+            main(...)
+    
+    Args:
+        output_prefix: 出力ファイルのパス（拡張子なし、Noneならプロファイルしない）
+        mode: "cprofile" または "sample"
+        top: 1以上の場合、累積時間の上位top件の関数を表示する
+        interval: sampleモードのサンプリング間隔（秒）
+    """
+    if output_prefix is None:
+        yield
+        return
+    
+    profiler = StageProfiler() if mode == "cprofile" else SamplingProfiler(interval)
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        elapsed = time.perf_counter() - start
+        pstats_path, collapsed_path = write_profile(profiler, output_prefix)
+        logger.log(SUMMARY, "Profile (%s, %.1f s): %s, %s", mode, elapsed, pstats_path, collapsed_path)
+        if top:
+            log_top_functions(profiler, top)
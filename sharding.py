@@ -0,0 +1,260 @@
+"""
+複数マシンでの分散実行用のシャーディングモジュール
+SVG/CSVペアを file_id の安定したハッシュで N 個のシャードに振り分け、
+各シャードの出力（名前ごとのJSONと、文字ペアの部分集計）を1つのペア表とPhase1モデルにまとめる
+
+使い方:
+    # 各マシンで（<出力ディレクトリ>/shard-2-of-4/ に出力される）
+    python batch_process.py ./dataset_all ./output_json/all --shard 2/4
+    
+    # すべてのシャードの出力を1か所に集めてから
+    python sharding.py ./output_json/all --pairs-csv ./pairs_aggregated.csv --model-out ./assets/phase1_model.json
+
+まとめた結果は、1台で batch_process.py → aggregate_pairs.py → build_phase1_model.py を
+（同じ --fold で）実行した場合とバイト単位で同じになる
+（--fold none の場合は、batch_process.py --shard と sharding.py の両方に --fold none を指定する）
+"""
+
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from aggregate_pairs import CSV_COLUMNS, OUTPUT_CSV, iter_json_sample_files, iter_sample_pair_records, write_csv
+from build_phase1_model import OUTPUT_JSON_PATH, build_phase1_model
+from log_utils import SUMMARY, log_warning_summary, setup_logging
+from pair_keys import DEFAULT_FOLDING, FOLDINGS
+
+logger = logging.getLogger(__name__)
+
+# シャードの出力ディレクトリ名（<出力ディレクトリ>/shard-<i>-of-<N>）
+SHARD_DIR_FORMAT = "shard-{index}-of-{count}"
+SHARD_DIR_PATTERN = re.compile(r"^shard-(\d+)-of-(\d+)$")
+
+# シャードごとの文字ペアの部分集計（シャードの出力ディレクトリに置く）
+PARTIAL_PAIRS_FILENAME = "pairs_partial.csv"
+
+# 部分集計の並び順のキー（サンプルのJSONファイル名）のカラム
+SOURCE_COLUMN = "source"
+
+# 部分集計の設定（pair_keyの文字の正規化の方式）を記録するファイルの拡張子（pairs_partial.meta、*.json はサンプルとして読まれるため使わない）
+PARTIAL_META_SUFFIX = ".meta"
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """
+    "i/N" 形式のシャード指定を解析する（iは1始まり）
+    
+    Args:
+        text: シャード指定（例: "2/4"）
+    
+    Returns:
+        (i, N)
+    
+    Raises:
+        ValueError: 形式が正しくない場合
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", text)
+    if not match:
+        raise ValueError(f"Invalid shard '{text}' (expected i/N, e.g. 2/4)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{text}' (i must be between 1 and N)")
+    return index, count
+
+
+def shard_of(file_id: str, count: int) -> int:
+    """
+    ファイルIDが属するシャード番号（1始まり）を返す
+    
+    Pythonのhash()は実行ごとに変わるため、SHA-1の先頭8バイトを使う（マシン・実行によらず同じ）
+    """
+    digest = hashlib.sha1(file_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def select_shard(pairs: List[tuple], index: int, count: int) -> List[tuple]:
+    """
+    SVG/CSVペアのうち、指定したシャードに属するものを返す（順序は保つ）
+    
+    Args:
+        pairs: [(svg_path, csv_path, file_id), ...]
+        index: シャード番号（1始まり）
+        count: シャード数
+    """
+    return [pair for pair in pairs if shard_of(pair[2], count) == index]
+
+
+def shard_dir(output_dir: str, index: int, count: int) -> str:
+    """
+    シャードの出力ディレクトリ（<output_dir>/shard-<i>-of-<N>）
+    """
+    return os.path.join(output_dir, SHARD_DIR_FORMAT.format(index=index, count=count))
+
+
+def shard_path(path: str, index: int, count: int) -> str:
+    """
+    ファイルのパスにシャードの接尾辞を付ける（例: metrics.json → metrics.shard-2-of-4.json）
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{SHARD_DIR_FORMAT.format(index=index, count=count)}{ext}"
+
+
+def partial_meta_path(partial_path: str) -> str:
+    """
+    部分集計の設定ファイルのパス（例: pairs_partial.csv → pairs_partial.meta）
+    """
+    return os.path.splitext(partial_path)[0] + PARTIAL_META_SUFFIX
+
+
+def load_partial_folding(partial_path: str) -> Optional[str]:
+    """
+    部分集計のpair_keyの文字の正規化の方式（設定ファイルがない・壊れている場合はNone）
+    """
+    try:
+        with open(partial_meta_path(partial_path), 'r', encoding='utf-8') as f:
+            return json.load(f).get("folding")
+    except (FileNotFoundError, ValueError, AttributeError):
+        return None
+
+
+def write_partial_pairs(json_dir: str, output_path: Optional[str] = None, folding: str = DEFAULT_FOLDING) -> int:
+    """
+    シャードの名前ごとのJSONから文字ペアの部分集計を書き出す
+    
+    aggregate_pairs と同じレコードに、並び順のキー（JSONファイル名）を加えて、ファイル名順に書き出す。
+    正規化の方式は設定ファイル（pairs_partial.meta）に記録し、merge_shards で確認する。
+    
+    Args:
+        json_dir: シャードの出力ディレクトリ
+        output_path: 出力先（デフォルト: <json_dir>/pairs_partial.csv）
+        folding: pair_keyの文字の正規化の方式（pair_keys.FOLDINGS）
+    
+    Returns:
+        書き出したレコード数
+    """
+    if output_path is None:
+        output_path = os.path.join(json_dir, PARTIAL_PAIRS_FILENAME)
+    tmp_path = output_path + ".tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[SOURCE_COLUMN] + CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for json_file, data in iter_json_sample_files(json_dir):
+            for record in iter_sample_pair_records(data, folding):
+                record[SOURCE_COLUMN] = json_file.name
+                writer.writerow(record)
+                count += 1
+    
+    meta_path = partial_meta_path(output_path)
+    with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump({"folding": folding}, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def find_shard_dirs(output_dir: str) -> Dict[int, str]:
+    """
+    出力ディレクトリ内のシャードの出力ディレクトリを探す
+    
+    Returns:
+        {シャード番号: ディレクトリのパス}
+    
+    Raises:
+        ValueError: シャード数が揃っていない・一致しない場合
+    """
+    found: Dict[int, Dict[int, str]] = {}
+    for entry in os.scandir(output_dir):
+        match = SHARD_DIR_PATTERN.match(entry.name)
+        if match and entry.is_dir():
+            found.setdefault(int(match.group(2)), {})[int(match.group(1))] = entry.path
+    
+    if not found:
+        raise ValueError(f"No shard directories found in '{output_dir}'")
+    if len(found) > 1:
+        raise ValueError(f"Shard directories with different shard counts: {sorted(found)}")
+    count, dirs = next(iter(found.items()))
+    missing = sorted(set(range(1, count + 1)) - set(dirs))
+    if missing:
+        raise ValueError(f"Missing shards: {', '.join(f'{index}/{count}' for index in missing)}")
+    return dirs
+
+
+def _iter_partial_rows(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def merge_shards(output_dir: str, pairs_csv: str = OUTPUT_CSV, model_out: str = OUTPUT_JSON_PATH,
+                 folding: str = DEFAULT_FOLDING) -> Optional[Dict[str, Any]]:
+    """
+    すべてのシャードの部分集計をまとめて、文字ペアのCSVとPhase1モデルを生成する
+    
+    各シャードの部分集計はJSONファイル名順に並んでいるので、ファイル名をキーにマージすると
+    1台で aggregate_pairs.py を実行した場合と同じ順序のCSVになる
+    
+    Args:
+        output_dir: シャードの出力ディレクトリ（shard-<i>-of-<N>）を含むディレクトリ
+        pairs_csv: 文字ペアのCSVの出力先
+        model_out: Phase1モデルJSONの出力先
+        folding: pair_keyの文字の正規化の方式（部分集計を書き出したときの方式と一致しなければならない）
+    
+    Returns:
+        生成されたモデル辞書（レコードがない場合はNone）
+    
+    Raises:
+        ValueError: シャードが揃っていない・部分集計がない・部分集計の正規化の方式がfoldingと違う場合
+    """
+    dirs = find_shard_dirs(output_dir)
+    logger.info("Merging %s shards in %s", len(dirs), output_dir)
+    
+    readers = []
+    for index in sorted(dirs):
+        partial_path = os.path.join(dirs[index], PARTIAL_PAIRS_FILENAME)
+        if not os.path.exists(partial_path):
+            raise ValueError(f"Partial pairs not found: {partial_path} (run batch_process.py --shard with --format json)")
+        partial_folding = load_partial_folding(partial_path)
+        if partial_folding != folding:
+            raise ValueError(f"Partial pairs {partial_path} were written with --fold {partial_folding or 'unknown'} "
+                             f"(expected --fold {folding}; rerun batch_process.py --shard with the same --fold)")
+        readers.append(_iter_partial_rows(partial_path))
+    
+    # 部分集計を1行ずつマージしながら書き出す（全件をメモリに載せない）
+    records = heapq.merge(*readers, key=lambda row: row[SOURCE_COLUMN])
+    record_count = write_csv(records, pairs_csv)
+    if not record_count:
+        logger.warning("No pairs found. Exiting.")
+        return None
+    
+    logger.log(SUMMARY, "Merged %s pair records", record_count)
+    
+    Path(model_out).parent.mkdir(parents=True, exist_ok=True)
+    return build_phase1_model(pairs_csv, model_out, folding)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="シャードごとの出力を1つのペア表とPhase1モデルにまとめる")
+    parser.add_argument("output_dir", help="シャードの出力ディレクトリ（shard-<i>-of-<N>）を含むディレクトリ")
+    parser.add_argument("--pairs-csv", default=OUTPUT_CSV, help=f"文字ペアのCSVの出力先（デフォルト: {OUTPUT_CSV}）")
+    parser.add_argument("--model-out", default=OUTPUT_JSON_PATH,
+                        help=f"Phase1モデルJSONの出力先（デフォルト: {OUTPUT_JSON_PATH}）")
+    parser.add_argument("--fold", choices=FOLDINGS, default=DEFAULT_FOLDING,
+                        help="pair_key・モデルのキーの文字の正規化（batch_process.py --shard と同じものを指定する）")
+    parser.add_argument("--quiet", "-q", action="store_true", help="処理結果の要約とエラーだけを表示する")
+    parser.add_argument("--verbose", "-v", action="store_true", help="繰り返される警告も1件ずつ表示する")
+    parser.add_argument("--log-file", default=None, help="すべてのログをJSON Lines形式で追記するファイル")
+    args = parser.parse_args()
+    setup_logging(args.quiet, args.verbose, args.log_file)
+    
+    try:
+        merge_shards(args.output_dir, args.pairs_csv, args.model_out, args.fold)
+    except ValueError as e:
+        logger.error("Error: %s", e)
+    log_warning_summary(logger)
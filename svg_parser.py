@@ -3,11 +3,15 @@ SVG解析モジュール
 SVGファイルから各文字（path要素）のbounding boxを計算する
 """
 
+import logging
 import xml.etree.ElementTree as ET
+from xml.parsers.expat import errors as expat_errors
 from typing import List, Dict, Optional, Tuple
 import re
 import math
 
+from log_utils import warn_repeated
+
 # transform_utilsから関数をインポート
 from transform_utils import (
     identity_matrix,
@@ -16,6 +20,8 @@ from transform_utils import (
     apply_matrix_to_point
 )
 
+logger = logging.getLogger(__name__)
+
 
 def compute_cumulative_transform(elem: ET.Element, root: ET.Element) -> Tuple[float, float, float, float, float, float]:
     """
@@ -367,10 +373,13 @@ def get_path_bbox(path_element: ET.Element, root: ET.Element, parent_matrix: Opt
     except ImportError:
         # svgpathtoolsが利用できない場合は従来の方法を使用
         pass
+    except MemoryError:
+        # メモリ上限（isolation.IsolatedPool）を超えた場合は呼び出し元で打ち切る
+        raise
     except Exception as e:
         # svgpathtoolsでエラーが発生した場合は従来の方法にフォールバック
-        print(f"Warning: svgpathtoolsでエラーが発生しました: {e}")
-        pass
+        warn_repeated(logger, "svgpathtools_error", "{count} svgpathtools errors across {files} files (fell back to path parsing)",
+                      "Warning: svgpathtoolsでエラーが発生しました: %s", e)
     
     # 従来の方法（フォールバック）
     points = parse_path_d(path_d)
@@ -503,7 +512,34 @@ def collect_parent_transforms(root: ET.Element) -> Dict[ET.Element, Tuple[float,
     return transforms
 
 
-def parse_svg_groups(svg_path: str) -> List[List[str]]:
+def load_svg_root(svg_path: str) -> Optional[ET.Element]:
+    """
+    SVGファイルのXMLを解析してルート要素を返す
+    
+    parse_svg / parse_svg_groups に渡すと、同じファイルを2回解析せずに済む
+    
+    Args:
+        svg_path: SVGファイルのパス
+    
+    Returns:
+        ルート要素（解析に失敗した場合はNone）
+    """
+    try:
+        return ET.parse(svg_path).getroot()
+    except MemoryError:
+        raise
+    except ET.ParseError as e:
+        # expatはメモリ不足をParseErrorとして報告する
+        if e.code == expat_errors.codes[expat_errors.XML_ERROR_NO_MEMORY]:
+            raise MemoryError(str(e)) from e
+        logger.exception("Error parsing SVG %s: %s", svg_path, e)
+        return None
+    except Exception as e:
+        logger.exception("Error parsing SVG %s: %s", svg_path, e)
+        return None
+
+
+def parse_svg_groups(svg_path: str, root: Optional[ET.Element] = None) -> List[List[str]]:
     """
     SVGファイルを解析して、名前ごとのグループ（<g>要素）内のpath要素のidを取得
     
@@ -511,13 +547,15 @@ def parse_svg_groups(svg_path: str) -> List[List[str]]:
     
     Args:
         svg_path: SVGファイルのパス
+        root: load_svg_rootで解析済みのルート要素（Noneの場合はsvg_pathを解析する）
     
     Returns:
         グループごとのpath idのリスト [[path5, path7], [path9, path11, ...], ...]
     """
     try:
-        tree = ET.parse(svg_path)
-        root = tree.getroot()
+        if root is None:
+            tree = ET.parse(svg_path)
+            root = tree.getroot()
         
         groups = []
         
@@ -542,26 +580,28 @@ def parse_svg_groups(svg_path: str) -> List[List[str]]:
         
         return groups
     
+    except MemoryError:
+        raise
     except Exception as e:
-        print(f"Error parsing SVG groups {svg_path}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error parsing SVG groups %s: %s", svg_path, e)
         return []
 
 
-def parse_svg(svg_path: str) -> List[Dict[str, float]]:
+def parse_svg(svg_path: str, root: Optional[ET.Element] = None) -> List[Dict[str, float]]:
     """
     SVGファイルを解析して、各文字（idを持つ要素）のbounding boxを計算
     
     Args:
         svg_path: SVGファイルのパス
+        root: load_svg_rootで解析済みのルート要素（Noneの場合はsvg_pathを解析する）
     
     Returns:
         [{"id": str, "min_x": float, "max_x": float, "min_y": float, "max_y": float, "width": float, "height": float}, ...]
     """
     try:
-        tree = ET.parse(svg_path)
-        root = tree.getroot()
+        if root is None:
+            tree = ET.parse(svg_path)
+            root = tree.getroot()
         
         # SVGのviewBoxを取得（必要に応じて使用）
         viewbox = root.get('viewBox', '')
@@ -615,9 +655,9 @@ def parse_svg(svg_path: str) -> List[Dict[str, float]]:
         
         return results
     
+    except MemoryError:
+        raise
     except Exception as e:
-        print(f"Error parsing SVG {svg_path}: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error parsing SVG %s: %s", svg_path, e)
         return []
 
@@ -0,0 +1,26 @@
+"""
+テスト共通のフィクスチャ（リポジトリ直下のモジュールをimportできるようにする）
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_DIR = os.path.join(REPO_DIR, "Study", "svg_cvs")
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """Study/svg_cvs の2ペア（06098137: 名前1つ、06098876: 名前2つ）をコピーしたデータセット"""
+    path = tmp_path / "dataset"
+    path.mkdir()
+    for file_id in ("06098137", "06098876"):
+        for ext in (".svg", ".csv"):
+            shutil.copy(os.path.join(SAMPLE_DIR, file_id + ext), path / (file_id + ext))
+    return path
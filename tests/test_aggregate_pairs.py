@@ -0,0 +1,76 @@
+"""
+aggregate_pairs のペアのキー（--fold）とCSVの書き出しのテスト
+"""
+
+import csv
+import json
+
+import pytest
+
+import aggregate_pairs
+import pair_partitions
+
+
+def _sample(left="Ｎ", right="Ａ"):
+    """全角の2文字のペアを1つ持つ、名前ごとのJSONレコード"""
+    bbox = {"a": {"min_x": 0.0, "max_x": 10.0, "min_y": 0.0, "max_y": 10.0, "width": 10.0, "height": 10.0},
+            "b": {"min_x": 12.0, "max_x": 22.0, "min_y": 0.0, "max_y": 10.0, "width": 10.0, "height": 10.0}}
+    return {
+        "file": "00000001",
+        "font": "Gothic",
+        "sequence": [{"id": "a", "text": left}, {"id": "b", "text": right}],
+        "pairs": [{"left_id": "a", "left": left, "right_id": "b", "right": right, "gap_actual": 2.0}],
+        "bbox": bbox,
+    }
+
+
+def test_pair_key_folding():
+    folded, = aggregate_pairs.aggregate_pairs([_sample()])
+    assert folded["pair_key"] == "N|A|Gothic"
+    assert (folded["left_char"], folded["right_char"]) == ("Ｎ", "Ａ")
+    assert (folded["left_char_form"], folded["right_char_form"]) == ("F", "F")
+    
+    raw, = aggregate_pairs.aggregate_pairs([_sample()], folding="none")
+    assert raw["pair_key"] == "Ｎ|Ａ|Gothic"
+    assert (raw["left_char_form"], raw["right_char_form"]) == ("F", "F")
+
+
+def test_main_fold_option(tmp_path):
+    json_dir = tmp_path / "json"
+    json_dir.mkdir()
+    (json_dir / "00000001_test.json").write_text(
+        json.dumps(_sample(), ensure_ascii=False), encoding='utf-8')
+    
+    for folding, expected in (("nfkc", "N|A|Gothic"), ("none", "Ｎ|Ａ|Gothic")):
+        output_csv = tmp_path / f"pairs_{folding}.csv"
+        aggregate_pairs.main(str(json_dir), str(output_csv), jobs=1, folding=folding)
+        with open(output_csv, 'r', encoding='utf-8', newline='') as f:
+            assert [row["pair_key"] for row in csv.DictReader(f)] == [expected]
+        
+        # パーティションは正規化の方式が変わると作り直す
+        partition_dir = tmp_path / "partitions"
+        result = pair_partitions.update_partitions(str(json_dir), str(partition_dir), folding=folding)
+        assert result["new"] == 1
+        with open(partition_dir / "font-Gothic.csv", 'r', encoding='utf-8', newline='') as f:
+            assert [row["pair_key"] for row in csv.DictReader(f)] == [expected]
+
+
+def test_write_csv_rows_is_atomic(tmp_path):
+    output_csv = tmp_path / "pairs.csv"
+    record = aggregate_pairs.aggregate_pairs([_sample()])[0]
+    row = aggregate_pairs.record_row(record)
+    assert aggregate_pairs.write_csv_rows([row, row], str(output_csv)) == 2
+    previous = output_csv.read_bytes()
+    
+    # 途中で中断した場合は前回のCSVがそのまま残り、一時ファイルも残らない
+    def interrupted():
+        yield row
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        aggregate_pairs.write_csv_rows(interrupted(), str(output_csv))
+    assert output_csv.read_bytes() == previous
+    assert not (tmp_path / "pairs.csv.tmp").exists()
+    
+    # 0件の場合は前回のCSVを削除する
+    assert aggregate_pairs.write_csv_rows([], str(output_csv)) == 0
+    assert not output_csv.exists()
@@ -0,0 +1,55 @@
+"""
+batch_process の打ち切り（--file-timeout）で隔離したペアの古い出力の削除のテスト
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+import batch_process
+from aggregate_pairs import list_json_sources
+from export_json import INDEX_FILENAME, SQLITE_FILENAME
+from manifest import load_manifest
+
+
+def _touch_input(dataset_dir, file_id):
+    """入力のCSVの内容を変えて、次の実行で処理し直させる"""
+    csv_path = dataset_dir / f"{file_id}.csv"
+    csv_path.write_bytes(csv_path.read_bytes() + b"\r\n")
+
+
+@pytest.mark.parametrize("background_write", [False, True])
+def test_rejected_pair_removes_previous_json(dataset_dir, tmp_path, background_write):
+    output_dir = tmp_path / "out"
+    batch_process.main(str(dataset_dir), str(output_dir))
+    previous = load_manifest(str(output_dir))["entries"]["06098876"]["outputs"]
+    assert all((output_dir / f"{name}.json").exists() for name in previous)
+    
+    # 変更したペアだけが処理され、制限時間を超えて打ち切られる
+    _touch_input(dataset_dir, "06098876")
+    result = batch_process.main(str(dataset_dir), str(output_dir), file_timeout=1e-6,
+                                background_write=background_write)
+    assert result["rejected"] == 1
+    
+    assert not any((output_dir / f"{name}.json").exists() for name in previous)
+    index = json.loads((output_dir / INDEX_FILENAME).read_text(encoding='utf-8'))
+    assert {entry["file"] for entry in index.values()} == {"06098137"}
+    assert [path.name.split("_")[0] for path in list_json_sources(str(output_dir))] == ["06098137"]
+    assert load_manifest(str(output_dir))["entries"]["06098876"]["outputs"] == []
+
+
+def test_rejected_pair_removes_previous_samples(dataset_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    batch_process.main(str(dataset_dir), str(output_dir), output_format="sqlite")
+    
+    _touch_input(dataset_dir, "06098876")
+    result = batch_process.main(str(dataset_dir), str(output_dir), output_format="sqlite", file_timeout=1e-6)
+    assert result["rejected"] == 1
+    
+    conn = sqlite3.connect(str(output_dir / SQLITE_FILENAME))
+    try:
+        assert [row[0] for row in conn.execute("SELECT DISTINCT file_id FROM samples")] == ["06098137"]
+        assert [row[0] for row in conn.execute("SELECT DISTINCT file_id FROM pairs")] == ["06098137"]
+    finally:
+        conn.close()
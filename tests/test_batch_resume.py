@@ -0,0 +1,48 @@
+"""
+batch_process の --resume（中断した実行の再開）のテスト
+"""
+
+import json
+import os
+
+import batch_process
+from manifest import JOURNAL_FILENAME, MANIFEST_FILENAME, load_manifest
+
+
+def _simulate_crash(output_dir):
+    """完了したペアがジャーナルにだけ記録され、マニフェストを保存する前に中断した状態にする"""
+    entries = load_manifest(str(output_dir))["entries"]
+    os.remove(output_dir / MANIFEST_FILENAME)
+    with open(output_dir / JOURNAL_FILENAME, 'w', encoding='utf-8') as f:
+        for file_id, entry in entries.items():
+            f.write(json.dumps({"file_id": file_id, **entry}, ensure_ascii=False) + "\n")
+    return entries
+
+
+def test_resume_skips_complete_outputs(dataset_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    assert batch_process.main(str(dataset_dir), str(output_dir))["success"] == 2
+    
+    _simulate_crash(output_dir)
+    result = batch_process.main(str(dataset_dir), str(output_dir), resume=True)
+    assert result["success"] == 0
+    assert not (output_dir / JOURNAL_FILENAME).exists()
+
+
+def test_resume_rebuilds_torn_outputs(dataset_dir, tmp_path):
+    output_dir = tmp_path / "out"
+    batch_process.main(str(dataset_dir), str(output_dir))
+    entries = _simulate_crash(output_dir)
+    
+    # 06098876 の2つ目の出力が途中まで、06098137 の出力が空のまま残った（fsyncされずにOSが落ちた）
+    torn = output_dir / (entries["06098876"]["outputs"][1] + ".json")
+    content = torn.read_text(encoding='utf-8')
+    torn.write_text(content[:len(content) // 2], encoding='utf-8')
+    empty = output_dir / (entries["06098137"]["outputs"][0] + ".json")
+    empty.write_text("", encoding='utf-8')
+    
+    result = batch_process.main(str(dataset_dir), str(output_dir), resume=True)
+    assert result["success"] == 2
+    assert json.loads(torn.read_text(encoding='utf-8')) == json.loads(content)
+    assert json.loads(empty.read_text(encoding='utf-8'))["file"] == "06098137"
+    assert set(load_manifest(str(output_dir))["entries"]) == {"06098137", "06098876"}
@@ -0,0 +1,44 @@
+"""
+batch_process --watch のモデルの更新（refresh_model）のテスト
+"""
+
+import json
+import os
+import shutil
+
+import aggregate_pairs
+import batch_process
+import build_phase1_model
+from conftest import SAMPLE_DIR
+
+
+def test_refresh_model_updates_only_affected_partitions(dataset_dir, tmp_path):
+    # 06098137 / 06098876: Gothic・Brush、06099095: Mincho・MaruGothic
+    for ext in (".svg", ".csv"):
+        shutil.copy(os.path.join(SAMPLE_DIR, "06099095" + ext), dataset_dir / ("06099095" + ext))
+    output_dir = tmp_path / "out"
+    partition_dir = tmp_path / "partitions"
+    model_path = tmp_path / "model.json"
+    
+    batch_process.main(str(dataset_dir), str(output_dir))
+    result = batch_process.refresh_model(str(output_dir), "json", str(tmp_path / "pairs.csv"), str(model_path),
+                                         str(partition_dir))
+    assert sorted(result["rewritten"]) == ["Brush", "Gothic", "MaruGothic", "Mincho"]
+    assert not (tmp_path / "pairs.csv").exists()
+    untouched = {name: os.stat(partition_dir / name).st_mtime_ns for name in ("font-Gothic.csv", "font-Brush.csv")}
+    
+    # 1ペアを変更する（06099095 のCSVを別のサンプルの内容に置き換える）と、そのフォントのパーティションだけを書き直す
+    shutil.copy(os.path.join(SAMPLE_DIR, "12166430.svg"), dataset_dir / "06099095.svg")
+    shutil.copy(os.path.join(SAMPLE_DIR, "12166430.csv"), dataset_dir / "06099095.csv")
+    assert batch_process.main(str(dataset_dir), str(output_dir))["success"] == 1
+    result = batch_process.refresh_model(str(output_dir), "json", str(tmp_path / "pairs.csv"), str(model_path),
+                                         str(partition_dir))
+    assert result["changed"] + result["new"] + result["removed"] >= 1
+    assert "Gothic" not in result["rewritten"] + result["appended"]
+    assert "Brush" not in result["rewritten"] + result["appended"]
+    assert {name: os.stat(partition_dir / name).st_mtime_ns for name in untouched} == untouched
+    
+    # 更新したモデルは、出力全体から作り直したモデルと同じ
+    aggregate_pairs.main(str(output_dir), str(tmp_path / "full.csv"))
+    expected = build_phase1_model.build_phase1_model(str(tmp_path / "full.csv"), str(tmp_path / "full.json"))
+    assert json.loads(model_path.read_text(encoding='utf-8')) == expected
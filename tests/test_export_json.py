@@ -0,0 +1,21 @@
+"""
+export_json のライターのテスト
+"""
+
+from aggregate_pairs import list_json_sources
+from export_json import JsonlShardWriter, build_record
+
+
+def test_jsonl_writer_removes_stale_shards(tmp_path):
+    # 中断した前回の実行のシャード・一時ファイルと、別のprefixのファイル
+    for name in ("samples-00000.jsonl", "samples-00007.jsonl", "samples-00003.jsonl.tmp", "other-00000.jsonl"):
+        (tmp_path / name).write_text('{"file": "stale"}\n', encoding='utf-8')
+    
+    record = build_record("00000001", "Gothic", [], [], {})
+    with JsonlShardWriter(str(tmp_path)) as writer:
+        writer.write(record)
+    
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["other-00000.jsonl", "samples-00000.jsonl"]
+    assert [path.name for path in list_json_sources(str(tmp_path)) if path.name.startswith("samples")] == [
+        "samples-00000.jsonl"]
+    assert '"00000001"' in (tmp_path / "samples-00000.jsonl").read_text(encoding='utf-8')
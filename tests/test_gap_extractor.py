@@ -0,0 +1,51 @@
+"""
+gap_extractor.iter_ngrams（Phase2用のn-gram窓）のテスト
+"""
+
+import math
+import statistics
+
+import pytest
+
+import batch_process
+from gap_extractor import iter_ngrams, ngram_stride
+
+
+def _name_data(gaps, width=10.0, start=0.0):
+    """文字幅width、指定したgapで並んだ1名前分の結合データ"""
+    items = []
+    min_x = start
+    for i in range(len(gaps) + 1):
+        items.append({"id": f"path{i}", "text": chr(ord("A") + i), "min_x": min_x, "max_x": min_x + width,
+                      "min_y": 0.0, "max_y": 10.0, "width": width, "height": 10.0})
+        if i < len(gaps):
+            min_x += width + gaps[i]
+    return items
+
+
+def test_windows_and_gap_stats():
+    gaps = [1.0, 2.0, 4.0]
+    result, = iter_ngrams([_name_data(gaps)], n=3)
+    stride = ngram_stride(3)
+    assert (result["count"], result["stride"]) == (2, stride)
+    assert len(result["windows"]) == 2 * stride
+    assert list(result["windows"][stride - 2:stride]) == [1.0, 2.0]
+    assert result["gap_mean"] == pytest.approx(statistics.fmean(gaps))
+    assert result["gap_std"] == pytest.approx(statistics.pstdev(gaps))
+
+
+def test_gap_std_with_large_mean():
+    # 平均が大きく分散が小さいgapでも、E[x^2] - mean^2 のような桁落ちをしない
+    gaps = [1e9 + offset for offset in (0.0, 0.5, 1.0, 1.5, 2.0)]
+    result, = iter_ngrams([_name_data(gaps, start=1e9)], n=2)
+    assert result["gap_std"] == pytest.approx(statistics.pstdev(gaps), rel=1e-6)
+    assert not math.isnan(result["gap_std"])
+
+
+def test_name_result_ngrams(dataset_dir):
+    for result in batch_process.process_many(batch_process.find_svg_csv_pairs(str(dataset_dir))):
+        ngrams = result.ngrams(2)
+        assert ngrams["texts"] == [item["text"] for item in result.sequence]
+        pair_gaps = [pair["gap_actual"] for pair in result.pairs]
+        window_gaps = [ngrams["windows"][(i + 1) * ngrams["stride"] - 1] for i in range(ngrams["count"])]
+        assert window_gaps == pytest.approx(pair_gaps)
@@ -0,0 +1,33 @@
+"""
+pipeline の文字ペアのCSV（--pairs-csv）の書き出しのテスト
+"""
+
+import os
+
+import aggregate_pairs
+import batch_process
+import pipeline
+
+
+def test_pairs_csv_matches_aggregate_pairs(dataset_dir, tmp_path):
+    pairs_csv = tmp_path / "pairs.csv"
+    pairs_csv.write_text("stale\n", encoding='utf-8')
+    pipeline.run_pipeline(str(dataset_dir), str(tmp_path / "model.json"), pairs_csv=str(pairs_csv))
+    assert not os.path.exists(str(pairs_csv) + ".tmp")
+    
+    # batch_process → aggregate_pairs と同じCSVになる
+    batch_process.main(str(dataset_dir), str(tmp_path / "json"))
+    aggregate_pairs.main(str(tmp_path / "json"), str(tmp_path / "expected.csv"), jobs=1)
+    assert pairs_csv.read_bytes() == (tmp_path / "expected.csv").read_bytes()
+
+
+def test_pairs_csv_removed_without_pairs(tmp_path):
+    dataset = tmp_path / "dataset"
+    dataset.mkdir()
+    (dataset / "00000001.svg").write_text("", encoding='utf-8')
+    (dataset / "00000001.csv").write_text("", encoding='utf-8')
+    pairs_csv = tmp_path / "pairs.csv"
+    pairs_csv.write_text("stale\n", encoding='utf-8')
+    
+    pipeline.run_pipeline(str(dataset), str(tmp_path / "model.json"), pairs_csv=str(pairs_csv))
+    assert not pairs_csv.exists()
@@ -0,0 +1,35 @@
+"""
+sharding（シャードの出力のマージ）の --fold のテスト
+"""
+
+import pytest
+
+import aggregate_pairs
+import batch_process
+import build_phase1_model
+import sharding
+
+
+@pytest.mark.parametrize("folding", ["nfkc", "none"])
+def test_merge_shards_matches_single_node(dataset_dir, tmp_path, folding):
+    shard_out = tmp_path / "sharded"
+    for index in (1, 2):
+        batch_process.main(str(dataset_dir), str(shard_out), shard=(index, 2), folding=folding)
+    sharding.merge_shards(str(shard_out), str(tmp_path / "merged.csv"), str(tmp_path / "merged.json"), folding)
+    
+    single_out = tmp_path / "single"
+    batch_process.main(str(dataset_dir), str(single_out))
+    aggregate_pairs.main(str(single_out), str(tmp_path / "single.csv"), folding=folding)
+    build_phase1_model.build_phase1_model(str(tmp_path / "single.csv"), str(tmp_path / "single.json"), folding)
+    
+    assert (tmp_path / "merged.csv").read_bytes() == (tmp_path / "single.csv").read_bytes()
+    assert (tmp_path / "merged.json").read_bytes() == (tmp_path / "single.json").read_bytes()
+
+
+def test_merge_shards_rejects_different_folding(dataset_dir, tmp_path):
+    shard_out = tmp_path / "sharded"
+    for index in (1, 2):
+        batch_process.main(str(dataset_dir), str(shard_out), shard=(index, 2), folding="none")
+    with pytest.raises(ValueError, match="--fold none"):
+        sharding.merge_shards(str(shard_out), str(tmp_path / "merged.csv"), str(tmp_path / "merged.json"), "nfkc")
+    assert not (tmp_path / "merged.csv").exists()